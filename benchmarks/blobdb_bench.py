@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""Micro-benchmarks for blobapi.blob_service.BlobDB
+
+Builds deterministic synthetic catalogs and times the metadata operations of
+BlobDB in-process (no HTTP, no auth). Results are printed as JSON so they can be
+compared between commits.
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from io import BytesIO
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from blobapi.blob_service import BlobDB  # noqa: E402
+from blobapi.snapshot import write_snapshot  # noqa: E402
+
+# Fraction of the catalog shared with each "fan-out" user
+FANOUTS = (0.0, 0.001, 0.01, 0.1)
+USERS = 1000
+
+
+def fanout_user(fraction):
+    """Name of the user which has read access to the given fraction of the catalog"""
+    return f'fanout-{fraction:g}'
+
+
+def build_catalog(size, seed):
+    """Generate a deterministic catalog with "size" blobs"""
+    rnd = random.Random(seed)
+    blobs = {}
+    for index in range(size):
+        users = [f'user{rnd.randrange(USERS)}' for _ in range(rnd.randrange(4))]
+        for fraction in FANOUTS:
+            if fraction and rnd.random() < fraction:
+                users.append(fanout_user(fraction))
+        blobs[f'{index:08d}-0000-4000-8000-{seed:012d}'] = {
+            'URL': os.path.join('storage', f'blob-{index}'),
+            'public': rnd.random() < 0.5,
+            'users': users,
+            'owner': f'user{index % USERS}'
+        }
+    return blobs
+
+
+def write_catalog(db_file, blobs):
+    """Store the catalog in the format written by BlobDB"""
+    with open(db_file, 'w', encoding='utf-8') as contents:
+        write_snapshot(contents, blobs)
+
+
+def measure(function, repeat):
+    """Time "function" (called with the iteration index) "repeat" times"""
+    samples = []
+    for iteration in range(repeat):
+        start = time.perf_counter()
+        function(iteration)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'repeat': repeat,
+        'min_ms': round(samples[0] * 1000, 3),
+        'median_ms': round(statistics.median(samples) * 1000, 3),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 3),
+        'max_ms': round(samples[-1] * 1000, 3),
+    }
+
+
+def traced(function):
+    """Heap used by the result of "function" (and peak while running it)"""
+    gc.collect()
+    tracemalloc.start()
+    result = function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current, peak
+
+
+def memory_footprint(db_file):
+    """Python heap used by a loaded BlobDB, compared with the catalog as plain dicts.
+
+    The catalog is loaded once before measuring, so one-time growth of interpreter
+    tables (e.g. the interned strings) is not charged to the records.
+    """
+    BlobDB(db_file)
+    gc.collect()
+    database, current, peak = traced(lambda: BlobDB(db_file))
+    blobs = len(database._blobs_)
+    del database
+    with open(db_file, 'rb') as contents:
+        plain, plain_current, _ = traced(lambda: json.load(contents))
+    del plain
+    gc.collect()
+    return {
+        'heap_bytes': current,
+        'peak_bytes': peak,
+        'bytes_per_blob': round(current / blobs, 1) if blobs else None,
+        'plain_dict_heap_bytes': plain_current,
+        'reduction': round(1 - current / plain_current, 3) if plain_current else None,
+        'file_bytes': os.path.getsize(db_file),
+    }
+
+
+def bench_catalog(size, options):
+    """Run every benchmark against a catalog of the given size"""
+    results = {'catalog_size': size}
+    blobs = build_catalog(size, options.seed)
+    blob_ids = list(blobs)
+    owners = {blob_id: blobs[blob_id]['owner'] for blob_id in blob_ids}
+    rnd = random.Random(options.seed)
+    with tempfile.TemporaryDirectory() as workspace:
+        cwd = os.getcwd()
+        os.chdir(workspace)
+        try:
+            db_file = Path(workspace).joinpath('blobs.json')
+            write_catalog(db_file, blobs)
+            del blobs
+
+            database = None
+
+            def cold_start(_):
+                nonlocal database
+                database = BlobDB(db_file)
+
+            results['cold_start'] = measure(cold_start, options.cold_repeat)
+            database._read_db_()
+            results['read_db'] = measure(lambda _: database._read_db_(), options.cold_repeat)
+
+            results['getBlobs'] = {
+                'anonymous': measure(lambda _: database.getBlobs(), options.repeat),
+                'owner': measure(lambda _: database.getBlobs(user='user0'), options.repeat),
+            }
+            for fraction in FANOUTS:
+                results['getBlobs'][fanout_user(fraction)] = measure(
+                    lambda _, user=fanout_user(fraction): database.getBlobs(user=user), options.repeat
+                )
+
+            targets = [rnd.choice(blob_ids) for _ in range(options.write_repeat)] if blob_ids else []
+            if targets:
+                results['setVisibility'] = measure(
+                    lambda i: database.setVisibility(targets[i], bool(i % 2), owners[targets[i]]),
+                    options.write_repeat
+                )
+                results['addPermission'] = measure(
+                    lambda i: database.addPermission(targets[i], [f'grantee{i}'], owners[targets[i]]),
+                    options.write_repeat
+                )
+                results['updatePermission'] = measure(
+                    lambda i: database.updatePermission(targets[i], [f'grantee{i}', 'user1'], owners[targets[i]]),
+                    options.write_repeat
+                )
+
+            payload = os.urandom(options.blob_size)
+            results['newBlob'] = measure(
+                lambda i: database.newBlob(FileStorage(stream=BytesIO(payload), filename=f'bench-{i}.bin'), 'user0'),
+                options.write_repeat
+            )
+            del database
+            results['memory'] = memory_footprint(db_file)
+        finally:
+            os.chdir(cwd)
+    return results
+
+
+def git_revision():
+    """Commit being measured, if available"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_commandline():
+    """Parse command line"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='Catalog sizes (default: %(default)s)')
+    parser.add_argument('--repeat', type=int, default=10,
+                        help='Iterations for read operations (default: %(default)s)')
+    parser.add_argument('--write-repeat', type=int, default=5,
+                        help='Iterations for mutating operations (default: %(default)s)')
+    parser.add_argument('--cold-repeat', type=int, default=3,
+                        help='Iterations for database loading (default: %(default)s)')
+    parser.add_argument('--blob-size', type=int, default=1024,
+                        help='Size of the blobs created by newBlob (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: %(default)s)')
+    parser.add_argument('-o', '--output', default=None, help='Write JSON report to file instead of stdout')
+    return parser.parse_args()
+
+
+def main():
+    """Entry point"""
+    options = parse_commandline()
+    # BlobDB warns about no-op visibility changes, which would flood the output
+    logging.basicConfig(level=logging.ERROR)
+    report = {
+        'benchmark': 'blobdb',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'catalogs': [bench_catalog(size, options) for size in options.sizes],
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as contents:
+            contents.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""Commit throughput of BlobDB against concurrency
+
+Runs concurrent ACL updates against a synthetic catalog, with and without group
+commit, and reports commits/s and p50/p99 latency for every concurrency level.
+Results are printed as JSON.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_ROOT))
+
+from blobapi.blob_service import BlobDB  # noqa: E402
+from benchmarks.blobdb_bench import build_catalog, write_catalog, git_revision  # noqa: E402
+from benchmarks.load_test import percentile  # noqa: E402
+
+
+def run(db_file, blob_ids, owners, concurrency, operations, group_commit, options):
+    """Run "operations" ACL updates per thread with the given concurrency"""
+    database = BlobDB(db_file, group_commit=group_commit,
+                      commit_window=options.window, commit_batch=options.batch)
+    latencies = [[] for _ in range(concurrency)]
+
+    def worker(index):
+        for iteration in range(operations):
+            blob_id = blob_ids[(index * operations + iteration) % len(blob_ids)]
+            start = time.perf_counter()
+            database.addPermission(blob_id, [f'grantee{index}-{iteration}'], owners[blob_id])
+            latencies[index].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    writes = database.metrics().get('group_commit', {}).get('writes', concurrency * operations)
+    database.close()
+    samples = sorted(sample for thread_samples in latencies for sample in thread_samples)
+    return {
+        'mode': 'group' if group_commit else 'direct',
+        'concurrency': concurrency,
+        'commits': len(samples),
+        'writes': writes,
+        'commits_per_s': round(len(samples) / elapsed, 2),
+        'p50_ms': round(percentile(samples, 50) * 1000, 3),
+        'p99_ms': round(percentile(samples, 99) * 1000, 3),
+    }
+
+
+def parse_commandline():
+    """Parse command line"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--catalog-size', type=int, default=10000, help='Blobs in the catalog (default: %(default)s)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64],
+                        help='Concurrent writers (default: %(default)s)')
+    parser.add_argument('--operations', type=int, default=20,
+                        help='ACL updates per writer (default: %(default)s)')
+    parser.add_argument('--window', type=float, default=0.005,
+                        help='Group commit window in seconds (default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=128, help='Group commit batch size (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: %(default)s)')
+    parser.add_argument('-o', '--output', default=None, help='Write JSON report to file instead of stdout')
+    return parser.parse_args()
+
+
+def main():
+    """Entry point"""
+    options = parse_commandline()
+    logging.basicConfig(level=logging.ERROR)
+    blobs = build_catalog(options.catalog_size, options.seed)
+    blob_ids = list(blobs)
+    owners = {blob_id: blobs[blob_id]['owner'] for blob_id in blob_ids}
+    results = []
+    with tempfile.TemporaryDirectory() as workspace:
+        db_file = Path(workspace).joinpath('blobs.json')
+        for concurrency in options.concurrency:
+            for group_commit in (False, True):
+                write_catalog(db_file, blobs)
+                results.append(run(db_file, blob_ids, owners, concurrency, options.operations, group_commit, options))
+                os.remove(db_file)
+    report = {
+        'benchmark': 'commit',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'catalog_size': options.catalog_size,
+        'window_s': options.window,
+        'batch': options.batch,
+        'results': results
+    }
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as contents:
+            contents.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,313 @@
+#!/usr/bin/env python3
+"""End-to-end HTTP load benchmark for the blob API
+
+Starts the mock auth service and an ApiService (each one in its own process),
+seeds a synthetic catalog and drives a mixed upload/download/list/ACL workload
+from many concurrent clients. Results are printed as JSON.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+import requests
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+MOCK_AUTH = REPO_ROOT.joinpath('tests', 'mock_auth', 'mock_auth.py')
+
+OPERATIONS = ('upload', 'download', 'list', 'acl')
+DEFAULT_MIX = 'upload=20,download=50,list=10,acl=20'
+
+
+def free_port():
+    """Ask the OS for an unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def user_token(user):
+    """Token accepted by the mock auth service for the given user"""
+    return f'{user}_TOKEN'
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a sorted list"""
+    if not samples:
+        return None
+    rank = max(0, min(len(samples) - 1, int(round(pct / 100.0 * len(samples) + 0.5)) - 1))
+    return samples[rank]
+
+
+def parse_mix(mix):
+    """Parse "op=weight,..." into a dict of weights"""
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(f'Unknown operation "{name}", use one of {OPERATIONS}')
+        weights[name] = int(weight)
+    return weights
+
+
+def seed_catalog(workspace, catalog_size, blob_size, users):
+    """Write a synthetic catalog (database and files) before the service starts"""
+    storage = workspace.joinpath('storage')
+    storage.mkdir(exist_ok=True)
+    payload = os.urandom(blob_size)
+    blobs = {}
+    for index in range(catalog_size):
+        url = os.path.join('storage', f'seed-{index}.bin')
+        with open(workspace.joinpath(url), 'wb') as contents:
+            contents.write(payload)
+        owner = users[index % len(users)]
+        blobs[str(uuid.uuid4())] = {
+            'URL': url,
+            'public': index % 2 == 0,
+            'users': [users[(index + 1) % len(users)]],
+            'owner': owner
+        }
+    db_file = workspace.joinpath('blobs.json')
+    with open(db_file, 'w', encoding='utf-8') as contents:
+        json.dump(blobs, contents)
+    return db_file, list(blobs.keys())
+
+
+def wait_for(url, timeout=30.0):
+    """Poll a status URL until it answers 200"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.1)
+    raise RuntimeError(f'{url} did not come up in {timeout}s')
+
+
+class Services:
+    """Run mock auth + blob API as child processes"""
+
+    def __init__(self, workspace, db_file, auth_latency):
+        self._workspace_ = workspace
+        self._db_file_ = db_file
+        self._auth_latency_ = auth_latency
+        self._processes_ = []
+        self.auth_port = free_port()
+        self.blob_port = free_port()
+
+    @property
+    def base_uri(self):
+        return f'http://127.0.0.1:{self.blob_port}'
+
+    def __enter__(self):
+        env = dict(os.environ)
+        env.update({
+            'PYTHONPATH': str(REPO_ROOT),
+            'AUTH_PORT': str(self.auth_port),
+            'AUTH_ADDRESS': '127.0.0.1',
+            'MOCK_ADDRESS': '127.0.0.1',
+            'MOCK_LATENCY': str(self._auth_latency_),
+            'FILE_STORAGE': 'storage',
+        })
+        self._processes_.append(subprocess.Popen(
+            [sys.executable, str(MOCK_AUTH)], cwd=self._workspace_, env=env,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        wait_for(f'http://127.0.0.1:{self.auth_port}/api/v1/status')
+        self._processes_.append(subprocess.Popen(
+            [sys.executable, '-m', 'blobapi.server', '-l', '127.0.0.1', '-p', str(self.blob_port),
+             '-d', str(self._db_file_)],
+            cwd=self._workspace_, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        ))
+        wait_for(f'{self.base_uri}/api/v1/status/')
+        return self
+
+    def __exit__(self, *args):
+        for process in reversed(self._processes_):
+            process.terminate()
+            process.wait(timeout=10)
+
+
+class Worker(threading.Thread):
+    """One client issuing operations until the deadline"""
+
+    def __init__(self, index, base_uri, user, users, blob_ids, payload, weights, deadline, seed):
+        super().__init__(daemon=True)
+        self._url_ = base_uri
+        self._user_ = user
+        self._users_ = users
+        self._session_ = requests.Session()
+        self._session_.headers['AuthToken'] = user_token(user)
+        self._known_ = list(blob_ids)
+        self._owned_ = []
+        self._payload_ = payload
+        self._deadline_ = deadline
+        self._random_ = random.Random(seed + index)
+        self._index_ = index
+        self._ops_ = [name for name in weights for _ in range(weights[name])]
+        self.latencies = {name: [] for name in OPERATIONS}
+        self.errors = {name: 0 for name in OPERATIONS}
+
+    def _upload_(self):
+        name = f'client{self._index_}-{uuid.uuid4().hex}.bin'
+        response = self._session_.post(f'{self._url_}/api/v1/blob', files={'file': (name, self._payload_)})
+        if response.status_code == 201:
+            self._owned_.append(response.json()['blobId'])
+        return response.status_code == 201
+
+    def _download_(self):
+        pool = self._owned_ or self._known_
+        if not pool:
+            return self._list_()
+        response = self._session_.get(f'{self._url_}/api/v1/blob/{self._random_.choice(pool)}')
+        # Seeded private blobs may legitimately be refused
+        return response.status_code in (200, 401)
+
+    def _list_(self):
+        response = self._session_.get(f'{self._url_}/api/v1/blobs')
+        return response.status_code == 200
+
+    def _acl_(self):
+        if not self._owned_:
+            return self._upload_()
+        blob_id = self._random_.choice(self._owned_)
+        grantee = self._random_.choice(self._users_)
+        response = self._session_.post(f'{self._url_}/api/v1/blob/{blob_id}/acl', json={'allowed_users': [grantee]})
+        return response.status_code == 204
+
+    def run(self):
+        while time.monotonic() < self._deadline_:
+            operation = self._random_.choice(self._ops_)
+            start = time.perf_counter()
+            try:
+                succeeded = getattr(self, f'_{operation}_')()
+            except requests.RequestException:
+                succeeded = False
+            elapsed = time.perf_counter() - start
+            self.latencies[operation].append(elapsed)
+            if not succeeded:
+                self.errors[operation] += 1
+
+
+def summarize(workers, duration):
+    """Aggregate latencies of all workers"""
+    summary = {}
+    every = []
+    for operation in OPERATIONS:
+        samples = sorted(sample for worker in workers for sample in worker.latencies[operation])
+        every.extend(samples)
+        summary[operation] = {
+            'count': len(samples),
+            'errors': sum(worker.errors[operation] for worker in workers),
+            'ops_per_s': round(len(samples) / duration, 2),
+            'p50_ms': round(percentile(samples, 50) * 1000, 3) if samples else None,
+            'p99_ms': round(percentile(samples, 99) * 1000, 3) if samples else None,
+        }
+    every.sort()
+    summary['total'] = {
+        'count': len(every),
+        'errors': sum(summary[operation]['errors'] for operation in OPERATIONS),
+        'ops_per_s': round(len(every) / duration, 2),
+        'p50_ms': round(percentile(every, 50) * 1000, 3) if every else None,
+        'p99_ms': round(percentile(every, 99) * 1000, 3) if every else None,
+    }
+    return summary
+
+
+def run_scenario(blob_size, catalog_size, options):
+    """Run one (blob size, catalog size) combination on a fresh service"""
+    users = [f'bench{index}' for index in range(options.users)]
+    weights = parse_mix(options.mix)
+    with tempfile.TemporaryDirectory() as workspace:
+        workspace = Path(workspace)
+        db_file, blob_ids = seed_catalog(workspace, catalog_size, blob_size, users)
+        payload = os.urandom(blob_size)
+        with Services(workspace, db_file, options.auth_latency) as services:
+            deadline = time.monotonic() + options.duration
+            workers = [
+                Worker(index, services.base_uri, users[index % len(users)], users, blob_ids,
+                       payload, weights, deadline, options.seed)
+                for index in range(options.clients)
+            ]
+            start = time.monotonic()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            elapsed = time.monotonic() - start
+    return {
+        'blob_size': blob_size,
+        'catalog_size': catalog_size,
+        'clients': options.clients,
+        'auth_latency_s': options.auth_latency,
+        'duration_s': round(elapsed, 3),
+        'results': summarize(workers, elapsed)
+    }
+
+
+def git_revision():
+    """Commit being measured, if available"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_commandline():
+    """Parse command line"""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=16, help='Concurrent clients (default: %(default)s)')
+    parser.add_argument('--users', type=int, default=8, help='Distinct users (default: %(default)s)')
+    parser.add_argument('--duration', type=float, default=10.0,
+                        help='Seconds per scenario (default: %(default)s)')
+    parser.add_argument('--blob-sizes', type=int, nargs='+', default=[1024, 65536, 1048576],
+                        help='Blob sizes in bytes (default: %(default)s)')
+    parser.add_argument('--catalog-sizes', type=int, nargs='+', default=[0, 1000, 10000],
+                        help='Number of pre-existing blobs (default: %(default)s)')
+    parser.add_argument('--auth-latency', type=float, default=0.0,
+                        help='Artificial latency of the mock auth service, in seconds (default: %(default)s)')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='Operation weights (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (default: %(default)s)')
+    parser.add_argument('-o', '--output', default=None, help='Write JSON report to file instead of stdout')
+    return parser.parse_args()
+
+
+def main():
+    """Entry point"""
+    options = parse_commandline()
+    report = {
+        'benchmark': 'http_load',
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'mix': parse_mix(options.mix),
+        'scenarios': [
+            run_scenario(blob_size, catalog_size, options)
+            for catalog_size in options.catalog_sizes
+            for blob_size in options.blob_sizes
+        ]
+    }
+    output = json.dumps(report, indent=2)
+    if options.output:
+        with open(options.output, 'w', encoding='utf-8') as contents:
+            contents.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -11,6 +11,85 @@ AUTH_ADDRESS=os.getenv('AUTH_ADDRESS', '127.0.0.1')
 DEFAULT_ENCODING = os.getenv('DEFAULT_ENCODING', 'utf-8')
 FILE_STORAGE = os.getenv('FILE_STORAGE', 'storage')
 BLOB_DB = os.getenv('BLOB_DB', 'blobs.json')
+# At-rest compression of new blobs: "gzip" or "none"
+BLOB_COMPRESSION = os.getenv('BLOB_COMPRESSION', 'none')
+# Blobs are stored compressed only if a sample shrinks below this ratio
+COMPRESSION_MIN_RATIO = float(os.getenv('COMPRESSION_MIN_RATIO', '0.9'))
+# In-memory cache of small blobs: total budget and biggest cached object, in bytes (0 disables it)
+BLOB_CACHE_SIZE = int(os.getenv('BLOB_CACHE_SIZE', str(64 * 1024 * 1024)))
+BLOB_CACHE_MAX_OBJECT = int(os.getenv('BLOB_CACHE_MAX_OBJECT', str(256 * 1024)))
+# Group commit: coalesce metadata writes arriving within a window (seconds) or up to a batch size
+GROUP_COMMIT = os.getenv('GROUP_COMMIT', 'false').lower() in ('1', 'true', 'yes')
+GROUP_COMMIT_WINDOW = float(os.getenv('GROUP_COMMIT_WINDOW', '0.005'))
+GROUP_COMMIT_BATCH = int(os.getenv('GROUP_COMMIT_BATCH', '128'))
+# Keys to verify signed tokens locally ("kid:secret,kid:secret"); empty to always ask the auth service
+SIGNED_TOKEN_KEYS = os.getenv('SIGNED_TOKEN_KEYS', '')
+SIGNED_TOKEN_LEEWAY = float(os.getenv('SIGNED_TOKEN_LEEWAY', '30'))
+# Pre-signed URLs: signing keys ("kid:secret,kid:secret", the first one signs; empty disables them),
+# default and longest validity in seconds
+PRESIGN_KEYS = os.getenv('PRESIGN_KEYS', '')
+PRESIGN_TTL = int(os.getenv('PRESIGN_TTL', '3600'))
+PRESIGN_MAX_TTL = int(os.getenv('PRESIGN_MAX_TTL', str(7 * 24 * 3600)))
+# Token lookups in the auth service: timeout (seconds), circuit breaker and stale results during outages
+AUTH_TIMEOUT = float(os.getenv('AUTH_TIMEOUT', '2'))
+AUTH_BREAKER_FAILURES = int(os.getenv('AUTH_BREAKER_FAILURES', '5'))
+AUTH_BREAKER_RESET = float(os.getenv('AUTH_BREAKER_RESET', '10'))
+AUTH_STALE_GRACE = float(os.getenv('AUTH_STALE_GRACE', '0'))
+# Pack files: blobs up to PACK_THRESHOLD bytes are appended to packs of up to PACK_MAX_SIZE bytes,
+# packs with more than PACK_GARBAGE_RATIO of deleted data are compacted every PACK_COMPACT_INTERVAL seconds
+BLOB_PACKS = os.getenv('BLOB_PACKS', 'false').lower() in ('1', 'true', 'yes')
+PACK_THRESHOLD = int(os.getenv('PACK_THRESHOLD', str(64 * 1024)))
+PACK_MAX_SIZE = int(os.getenv('PACK_MAX_SIZE', str(64 * 1024 * 1024)))
+PACK_GARBAGE_RATIO = float(os.getenv('PACK_GARBAGE_RATIO', '0.5'))
+PACK_COMPACT_INTERVAL = float(os.getenv('PACK_COMPACT_INTERVAL', '60'))
+# Previous versions kept for every blob when it is updated (0 keeps none)
+BLOB_VERSIONS = int(os.getenv('BLOB_VERSIONS', '3'))
+# Change feed: changes kept in memory, longest wait of a long poll and heartbeat of the event streams (seconds)
+CHANGE_FEED_SIZE = int(os.getenv('CHANGE_FEED_SIZE', '10000'))
+CHANGE_FEED_MAX_WAIT = float(os.getenv('CHANGE_FEED_MAX_WAIT', '30'))
+CHANGE_FEED_HEARTBEAT = float(os.getenv('CHANGE_FEED_HEARTBEAT', '15'))
+# Storage quota of every user: bytes and blobs (0 is unlimited), and quotas of some users
+# ("user:bytes:blobs,user:bytes:blobs")
+USER_QUOTA_BYTES = int(os.getenv('USER_QUOTA_BYTES', '0'))
+USER_QUOTA_BLOBS = int(os.getenv('USER_QUOTA_BLOBS', '0'))
+USER_QUOTAS = os.getenv('USER_QUOTAS', '')
+# Rate limits of every user (or address of anonymous requests): requests and bytes per second with their
+# bursts (a rate of 0 disables the limit) and clients tracked; uploads and downloads running at once in the
+# whole service (0 is unlimited)
+RATE_LIMIT_REQUESTS = float(os.getenv('RATE_LIMIT_REQUESTS', '0'))
+RATE_LIMIT_REQUEST_BURST = float(os.getenv('RATE_LIMIT_REQUEST_BURST', '20'))
+RATE_LIMIT_BYTES = float(os.getenv('RATE_LIMIT_BYTES', '0'))
+RATE_LIMIT_BYTE_BURST = float(os.getenv('RATE_LIMIT_BYTE_BURST', str(16 * 1024 * 1024)))
+RATE_LIMIT_CLIENTS = int(os.getenv('RATE_LIMIT_CLIENTS', '10000'))
+MAX_TRANSFERS = int(os.getenv('MAX_TRANSFERS', '0'))
+# Background scrubber: seconds between passes (0 disables it), I/O budget, digest verification,
+# what to do with orphan files (quarantine, delete or report) and their minimum age in seconds
+SCRUB_INTERVAL = float(os.getenv('SCRUB_INTERVAL', '0'))
+SCRUB_FILES_PER_SECOND = float(os.getenv('SCRUB_FILES_PER_SECOND', '100'))
+SCRUB_BYTES_PER_SECOND = float(os.getenv('SCRUB_BYTES_PER_SECOND', str(1024 * 1024)))
+SCRUB_VERIFY = os.getenv('SCRUB_VERIFY', 'false').lower() in ('1', 'true', 'yes')
+SCRUB_ORPHANS = os.getenv('SCRUB_ORPHANS', 'quarantine')
+SCRUB_GRACE = float(os.getenv('SCRUB_GRACE', '300'))
+# Asynchronous replication to "dir:<path>" or another blob service URL (empty disables it), the key
+# shared with the replica service, changes shipped per batch and first retry delay in seconds
+REPLICA = os.getenv('REPLICA', '')
+REPLICATION_KEY = os.getenv('REPLICATION_KEY', '')
+REPLICATION_BATCH = int(os.getenv('REPLICATION_BATCH', '64'))
+REPLICATION_RETRY = float(os.getenv('REPLICATION_RETRY', '1'))
+# Storage backend of the blob contents: "local" (files) or "s3" (S3-compatible service)
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'local')
+S3_ENDPOINT = os.getenv('S3_ENDPOINT', 'http://127.0.0.1:9000')
+S3_BUCKET = os.getenv('S3_BUCKET', 'blobs')
+S3_ACCESS_KEY = os.getenv('S3_ACCESS_KEY', '')
+S3_SECRET_KEY = os.getenv('S3_SECRET_KEY', '')
+S3_REGION = os.getenv('S3_REGION', 'us-east-1')
+S3_PART_SIZE = int(os.getenv('S3_PART_SIZE', str(8 * 1024 * 1024)))
+S3_POOL_SIZE = int(os.getenv('S3_POOL_SIZE', '10'))
+# Sharding: base URLs of every node ("http://a:3002,http://b:3002"; empty disables it), URL of this
+# node and virtual nodes per node in the consistent-hash ring
+SHARD_NODES = [node.strip() for node in os.getenv('SHARD_NODES', '').split(',') if node.strip()]
+SHARD_SELF = os.getenv('SHARD_SELF', '')
+SHARD_VNODES = int(os.getenv('SHARD_VNODES', '64'))
 
 HTTPS_DEBUG_MODE = False
 ADMIN = 'admin'
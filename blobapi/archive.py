@@ -0,0 +1,162 @@
+"""Archives of many blobs, generated on the fly.
+
+The archive is written as it is sent, one chunk at a time, so memory use does
+not depend on the number or the size of the blobs: tar headers are built for
+every member (its size is known in advance) and followed by its contents; zip
+archives are written by zipfile to a stream which is emptied after every write.
+
+The last member, MANIFEST_NAME, lists the blobs exported with the SHA-256
+digest of the contents sent, and the blobs skipped (not found, not readable...).
+
+Archives to import (tar, optionally compressed) are read the same way, while
+they are received: every member is stored as it arrives, see read_tar().
+"""
+
+import hashlib
+import json
+import tarfile
+import time
+import zipfile
+import zlib
+
+from blobapi import DEFAULT_ENCODING
+
+TAR, TAR_GZIP, ZIP = 'tar', 'tar.gz', 'zip'
+ARCHIVE_FORMATS = {TAR: 'application/x-tar', TAR_GZIP: 'application/gzip', ZIP: 'application/zip'}
+# Blob names never start with a dot (see secure_filename), so the manifest cannot clash with them
+MANIFEST_NAME = '.manifest.json'
+
+_BLOCK = tarfile.BLOCKSIZE
+_RECORD = tarfile.RECORDSIZE
+_GZIP_WBITS = 16 + zlib.MAX_WBITS
+
+
+class _Sink:
+    """Unseekable binary stream keeping what is written until it is taken"""
+
+    def __init__(self):
+        self._chunks_ = []
+
+    def write(self, data):
+        self._chunks_.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self._chunks_)
+        self._chunks_ = []
+        return data
+
+
+def _exact_(chunks, size, entry):
+    """Exactly "size" bytes of contents (cut or padded if they changed meanwhile), updating the digest of the entry"""
+    digest = hashlib.sha256()
+    remaining = size
+    for chunk in chunks:
+        if len(chunk) > remaining:
+            entry["error"] = 'changed while exporting'
+            chunk = chunk[:remaining]
+        if chunk:
+            digest.update(chunk)
+            remaining -= len(chunk)
+            yield chunk
+        if not remaining:
+            break
+    if remaining:
+        entry["error"] = 'changed while exporting'
+        yield bytes(remaining)
+    entry["sha256"] = digest.hexdigest()
+
+
+def _tar_member_(name, size, chunks, entry):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    # PAX headers support long names and sizes over 8 GiB
+    yield info.tobuf(tarfile.PAX_FORMAT, DEFAULT_ENCODING)
+    yield from _exact_(chunks, size, entry)
+    if size % _BLOCK:
+        yield bytes(_BLOCK - size % _BLOCK)
+
+
+def _tar_(blobs, manifest):
+    written = 0
+    for name, size, chunks, entry in _members_(blobs, manifest):
+        for data in _tar_member_(name, size, chunks, entry):
+            written += len(data)
+            yield data
+    # End of archive: two empty blocks, padded to a whole record
+    end = 2 * _BLOCK
+    end += -(written + end) % _RECORD
+    yield bytes(end)
+
+
+def _gzip_(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _zip_(blobs, manifest):
+    sink = _Sink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, size, chunks, entry in _members_(blobs, manifest):
+            info = zipfile.ZipInfo(name, time.localtime()[:6])
+            info.compress_type = zipfile.ZIP_DEFLATED
+            info.file_size = size
+            with archive.open(info, 'w', force_zip64=size >= zipfile.ZIP64_LIMIT) as member:
+                for chunk in _exact_(chunks, size, entry):
+                    member.write(chunk)
+                    data = sink.take()
+                    if data:
+                        yield data
+            yield sink.take()
+    yield sink.take()
+
+
+def _members_(blobs, manifest):
+    """(name, size, chunks, manifest entry) of every blob exported, then the manifest"""
+    for blob in blobs:
+        if "error" in blob:
+            manifest["skipped"].append({"blobId": blob["blobId"], "reason": blob["error"]})
+            continue
+        entry = {"blobId": blob["blobId"], "name": blob["name"], "size": blob["size"]}
+        manifest["blobs"].append(entry)
+        yield blob["name"], blob["size"], blob["chunks"], entry
+    data = json.dumps(manifest, indent=1).encode(DEFAULT_ENCODING)
+    yield MANIFEST_NAME, len(data), iter([data]), {}
+
+
+def stream_archive(blobs, archive_format=TAR):
+    """Iterate over the chunks of an archive of blobs.
+
+    "blobs" is an iterable of dicts with "blobId", "name", "size" and "chunks" (an iterable of
+    the original contents), or with "blobId" and "error" for the blobs skipped.
+    """
+    if archive_format not in ARCHIVE_FORMATS:
+        raise ValueError(f'Archive format {archive_format} is not supported. Supported: {list(ARCHIVE_FORMATS)}')
+    manifest = {"format": archive_format, "blobs": [], "skipped": []}
+    if archive_format == ZIP:
+        return _zip_(blobs, manifest)
+    if archive_format == TAR_GZIP:
+        return _gzip_(_tar_(blobs, manifest))
+    return _tar_(blobs, manifest)
+
+
+def read_tar(stream):
+    """Iterate over the (name, contents) of the members of a tar archive read from an unseekable stream.
+
+    Contents are streams, only readable until the next member; they are None for members which are not
+    regular files. Directories are skipped. Raises tarfile.TarError if the archive is not valid.
+    """
+    with tarfile.open(fileobj=stream, mode='r|*') as archive:
+        for member in archive:
+            if member.isdir():
+                continue
+            yield member.name, archive.extractfile(member) if member.isfile() else None
@@ -8,17 +8,94 @@
 import copy
 import json
 import hashlib
+import threading
+import time
+from collections import OrderedDict
 from typing import Optional
 
 import requests
 
-from blobapi import ADMIN, USER_TOKEN, ADMIN_TOKEN, USER, HASH_PASS, DEFAULT_ENCODING, TOKEN, CONTENT_JSON
+from blobapi import ADMIN, USER_TOKEN, ADMIN_TOKEN, USER, HASH_PASS, DEFAULT_ENCODING, TOKEN, CONTENT_JSON, \
+    AUTH_TIMEOUT, AUTH_BREAKER_FAILURES, AUTH_BREAKER_RESET, AUTH_STALE_GRACE
 from blobapi.errors import Unauthorized, ServiceError, UserAlreadyExists, UserNotExists, AlreadyLogged
 
+# Maximum number of token owners remembered to be served during auth outages
+STALE_ENTRIES = 10000
+
+
+class CircuitBreaker:
+    """Fail fast while a remote service is unhealthy.
+
+    After "failures" consecutive failures the circuit opens and calls are refused
+    for "reset_timeout" seconds. Then a single trial call is let through: the
+    circuit closes again if it succeeds and stays open otherwise.
+    """
+
+    def __init__(self, failures=AUTH_BREAKER_FAILURES, reset_timeout=AUTH_BREAKER_RESET):
+        self._max_failures_ = failures
+        self._reset_timeout_ = reset_timeout
+        self._failures_ = 0
+        self._opened_at_ = None
+        self._trial_ = False
+        self._lock_ = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """closed, open or half-open"""
+        with self._lock_:
+            if self._opened_at_ is None:
+                return 'closed'
+            if time.monotonic() - self._opened_at_ >= self._reset_timeout_:
+                return 'half-open'
+            return 'open'
+
+    def allow(self) -> bool:
+        """Check if a call can be made now"""
+        with self._lock_:
+            if self._opened_at_ is None:
+                return True
+            if time.monotonic() - self._opened_at_ < self._reset_timeout_ or self._trial_:
+                return False
+            self._trial_ = True
+            return True
+
+    def success(self):
+        """Record a successful call"""
+        with self._lock_:
+            self._failures_ = 0
+            self._opened_at_ = None
+            self._trial_ = False
+
+    def failure(self):
+        """Record a failed call"""
+        with self._lock_:
+            self._failures_ += 1
+            if self._trial_ or self._failures_ >= self._max_failures_:
+                self._opened_at_ = time.monotonic()
+            self._trial_ = False
+
+
+class _Lookup:
+    """Token lookup in progress, shared by every request with the same token"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.user = None
+        self.error = None
+
+
 class Client:
     """authClient implementation"""
-    def __init__(self, api_url: str, admin_token: Optional[str]=None, check_service: bool=True):
+    def __init__(self, api_url: str, admin_token: Optional[str] = None, check_service: bool = True,
+                 timeout: float = AUTH_TIMEOUT, breaker: Optional[CircuitBreaker] = None,
+                 stale_grace: float = AUTH_STALE_GRACE):
         self._url_ = api_url[:-1] if api_url.endswith('/') else api_url
+        self._timeout_ = timeout
+        self._breaker_ = breaker or CircuitBreaker()
+        self._stale_grace_ = stale_grace
+        self._stale_ = OrderedDict()
+        self._lookups_ = {}
+        self._lookups_lock_ = threading.Lock()
         if check_service:
             if not self.service_up:
                 raise ServiceError(api_url, 'service seems down')
@@ -176,9 +253,57 @@ class Client:
         return result.status_code == 204
 
     def token_owner(self, token: str) -> str:
-        """Check the owner of a token"""
-        result = requests.get(f'{self._url_}/api/v1/token/{token}', verify=False)
+        """Check the owner of a token
+
+        Concurrent calls with the same token share a single request to the auth service.
+        """
+        with self._lookups_lock_:
+            lookup = self._lookups_.get(token)
+            leader = lookup is None
+            if leader:
+                lookup = self._lookups_[token] = _Lookup()
+        if leader:
+            try:
+                lookup.user = self._token_owner_(token)
+            except Exception as error:  # pylint: disable=broad-except
+                lookup.error = error
+            finally:
+                with self._lookups_lock_:
+                    del self._lookups_[token]
+                lookup.done.set()
+        elif not lookup.done.wait(self._timeout_ * 2):
+            raise ServiceError(self._url_, 'timeout waiting for token lookup')
+        if lookup.error is not None:
+            raise lookup.error
+        return lookup.user
+
+    def _token_owner_(self, token: str) -> str:
+        """Ask the auth service, failing fast (or serving stale results) while it is unhealthy"""
+        if not self._breaker_.allow():
+            return self._stale_owner_(token, 'service unavailable (circuit open)')
+        try:
+            result = requests.get(f'{self._url_}/api/v1/token/{token}', verify=False, timeout=self._timeout_)
+        except requests.RequestException as error:
+            self._breaker_.failure()
+            return self._stale_owner_(token, f'token lookup failed: {error}')
+        if result.status_code >= 500:
+            self._breaker_.failure()
+            return self._stale_owner_(token, f'token lookup failed with status {result.status_code}')
+        self._breaker_.success()
         if result.status_code != 200:
+            self._stale_.pop(token, None)
             raise UserNotExists(f'Owner of token #{token}')
-        result = json.loads(result.content.decode(DEFAULT_ENCODING))
-        return result[USER]
+        user = json.loads(result.content.decode(DEFAULT_ENCODING))[USER]
+        if self._stale_grace_ > 0:
+            self._stale_[token] = (user, time.monotonic())
+            self._stale_.move_to_end(token)
+            while len(self._stale_) > STALE_ENTRIES:
+                self._stale_.popitem(last=False)
+        return user
+
+    def _stale_owner_(self, token: str, reason: str) -> str:
+        """Last known owner of a token if it is recent enough, raise ServiceError otherwise"""
+        known = self._stale_.get(token)
+        if known is not None and time.monotonic() - known[1] <= self._stale_grace_:
+            return known[0]
+        raise ServiceError(self._url_, reason)
@@ -1,191 +1,1088 @@
 """Blob DB implementation."""
 
+import fnmatch
+import functools
 import hashlib
-import json
 import logging
 import os
+import threading
+import time
 import uuid
+from io import BytesIO, StringIO
 from pathlib import Path
 
+from werkzeug.datastructures import FileStorage
 from werkzeug.utils import secure_filename
 
-from blobapi import DEFAULT_ENCODING, FILE_STORAGE
-from blobapi.errors import ObjectAlreadyExists, ObjectNotFound, UnauthorizedBlob, StatusNotValid
+from blobapi import DEFAULT_ENCODING, FILE_STORAGE, BLOB_COMPRESSION, BLOB_CACHE_SIZE, BLOB_CACHE_MAX_OBJECT, \
+    GROUP_COMMIT, GROUP_COMMIT_WINDOW, GROUP_COMMIT_BATCH, BLOB_PACKS, PACK_THRESHOLD, PACK_COMPACT_INTERVAL, \
+    SCRUB_INTERVAL, BLOB_VERSIONS, USER_QUOTA_BYTES, USER_QUOTA_BLOBS, USER_QUOTAS
+from blobapi.cache import BlobCache
+from blobapi.group_commit import GroupCommitter
+from blobapi.packs import PackStore
+from blobapi.quotas import LimitedStream, Usage, parse_quotas
+from blobapi.scrubber import Scrubber
+from blobapi.storage import make_backend
+from blobapi.snapshot import read_snapshot, write_snapshot
+from blobapi.compression import CHUNK_SIZE, save_file, read_chunks, decompress
+from blobapi.errors import ObjectAlreadyExists, ObjectNotFound, UnauthorizedBlob, StatusNotValid, QuotaExceeded
+from blobapi.records import BlobRecord, AclPool, intern_users
 
 _WRN = logging.warning
 
+# ACL entries with this prefix are groups of users, i.e. "group:developers"
+GROUP_PREFIX = 'group:'
+# Directory of the pack files, inside FILE_STORAGE (secure_filename() never produces this name)
+PACKS_DIRECTORY = '.packs'
+# Previous versions of the blobs, in FILE_STORAGE/.versions/<blob ID>/<digest> (shared by identical versions)
+VERSIONS_DIRECTORY = '.versions'
+
 
 def _initialize_(db_file):
-    """Create an empty JSON file"""
+    """Create an empty database file"""
     _WRN(f'Initializing new database in file "{db_file}"')
     with open(db_file, 'w', encoding=DEFAULT_ENCODING) as contents:
-        json.dump({}, contents)
+        write_snapshot(contents, {})
 
 
 def raise_user_no_owner(blob_data, user):
     """Raise an exception if the user is not the owner of the blob"""
-    if user != blob_data["owner"]:
+    if user != blob_data.owner:
         raise UnauthorizedBlob(user=user, reason=f'{user} is not the owner of this blob')
 
 
-def raise_optional_token(blob_data, user):
-    """Raise an exception if the user is not the owner of the blob or has no permissions for it"""
-    if not blob_data["public"] and user != blob_data["owner"] and user not in blob_data["users"]:
+def raise_optional_token(blob_data, user, groups=None):
+    """Raise an exception if the user is not the owner of the blob or has no permissions for it
+
+    "groups" are the group principals the user belongs to (see BlobDB.groupsOf)
+    """
+    if not blob_data.public and user != blob_data.owner and user not in blob_data.users \
+            and not (groups and not blob_data.users.isdisjoint(groups)):
         raise UnauthorizedBlob(user=user, reason="User has no permissions for this blob")
 
 
 class BlobDB:
     """Repository for the blobs"""
 
-    def __init__(self, db_file):
+    def __init__(self, db_file, compression=BLOB_COMPRESSION,
+                 cache_size=BLOB_CACHE_SIZE, cache_max_object=BLOB_CACHE_MAX_OBJECT,
+                 group_commit=GROUP_COMMIT, commit_window=GROUP_COMMIT_WINDOW, commit_batch=GROUP_COMMIT_BATCH,
+                 background_load=False, packs=BLOB_PACKS, pack_threshold=PACK_THRESHOLD,
+                 compact_interval=PACK_COMPACT_INTERVAL, scrub_interval=SCRUB_INTERVAL, storage=FILE_STORAGE,
+                 backend=None, owns=None, versions=BLOB_VERSIONS, quota=(USER_QUOTA_BYTES, USER_QUOTA_BLOBS),
+                 quotas=None):
         if not Path(db_file).exists():
             _initialize_(db_file)
         self._db_file_ = db_file
-        self._blobs_ = {}
-        self._read_db_()
+        self._storage_ = storage
+        # Where the blob contents are stored (files, S3...), see blobapi.storage
+        self._backend_ = backend or make_backend()
+        # Only IDs accepted by this function are given to new blobs (see blobapi.sharding)
+        self._owns_ = owns
+        self._compression_ = compression
+        # Small blobs are appended to pack files, if enabled
+        self._packs_ = PackStore(os.path.join(storage, PACKS_DIRECTORY)) if packs else None
+        # Functions called with (event, key) after every committed change, see subscribe()
+        self._subscribers_ = []
+        self._pack_threshold_ = pack_threshold
+        # Previous versions kept per blob
+        self._versions_ = versions
+        self._stop_ = threading.Event()
+        self._cache_ = BlobCache(cache_size, cache_max_object)
+        self._catalog_ = {}
+        self._header_ = {}
+        self._acls_ = AclPool()
+        # Bytes and blobs of every owner, and their quotas (see blobapi.quotas)
+        self._usage_ = Usage(quota, parse_quotas(USER_QUOTAS) if quotas is None else quotas)
+        # Group name -> {"owner": user, "members": set of names}, and cache of user -> group principals
+        self._groups_ = {}
+        self._memberships_ = {}
+        # Protects the in-memory catalog; URLs being written by newBlob are reserved meanwhile
+        self._lock_ = threading.RLock()
+        self._write_lock_ = threading.Lock()
+        self._reserved_urls_ = set()
+        # How the contents of copied blobs were shared (see copyBlob)
+        self._copies_ = {}
+        self._loaded_ = threading.Event()
+        self._load_stats_ = {}
+        if background_load:
+            threading.Thread(target=self._read_db_, name='blobdb-load', daemon=True).start()
+        else:
+            self._read_db_()
+        self._group_commit_ = GroupCommitter(self._write_db_, commit_window, commit_batch) if group_commit else None
+        if self._packs_ and compact_interval > 0:
+            threading.Thread(target=self._compactor_, args=(compact_interval,), name='blobdb-compact',
+                             daemon=True).start()
+        self._scrubber_ = Scrubber(self, storage) if scrub_interval > 0 else None
+        if self._scrubber_:
+            threading.Thread(target=self._scrubber_.run, args=(scrub_interval,), name='blobdb-scrub',
+                             daemon=True).start()
+
+    @property
+    def _blobs_(self):
+        """Blob ID -> BlobRecord"""
+        return self._catalog_
+
+    @_blobs_.setter
+    def _blobs_(self, blobs):
+        self._acls_.clear()
+        self._catalog_ = {blob_id: self._record_(blob_data) for blob_id, blob_data in blobs.items()}
+        self._usage_.clear()
+        for blob_data in self._catalog_.values():
+            self._usage_.add(blob_data.owner, blob_data.size, 1)
+
+    def _record_(self, blob_data):
+        """Build a record sharing its ACL with other blobs with the same permissions"""
+        record = BlobRecord.from_dict(blob_data)
+        record.users = self._acls_.acquire(record.users)
+        if self._packs_:
+            for location in [record.location] + [entry.get('location') for entry in record.versions or ()]:
+                if location is not None:
+                    self._packs_.track(location)
+        return record
+
+    def _set_users_(self, blob_data, users):
+        """Replace the ACL of a record"""
+        old_users = blob_data.users
+        blob_data.users = self._acls_.acquire(users)
+        self._acls_.release(old_users)
 
     def _read_db_(self):
-        with open(self._db_file_, 'r', encoding=DEFAULT_ENCODING) as contents:
-            self._blobs_ = json.load(contents)
+        """Load the database file incrementally, so blobs can be served while the rest is loading"""
+        self._loaded_.clear()
+        start = time.monotonic()
+        total = max(os.path.getsize(self._db_file_), 1)
+        self._load_stats_ = {"loaded": False, "progress": 0.0, "seconds": None}
+        with self._lock_:
+            self._catalog_ = {}
+            self._acls_.clear()
+            self._usage_.clear()
+        snapshot = read_snapshot(self._db_file_)
+        self._header_ = next(snapshot)
+        # Databases written before usage was accounted have no totals: they are added up while loading
+        usage = self._header_.pop("usage", None)
+        with self._lock_:
+            if usage is not None:
+                self._usage_.load(usage)
+            self._groups_ = {
+                name: {"owner": group["owner"], "members": intern_users(group["members"])}
+                for name, group in self._header_.pop("groups", {}).items()
+            }
+            self._memberships_ = {}
+        for blobs, bytes_read in snapshot:
+            with self._lock_:
+                records = {blob_id: self._record_(blob_data) for blob_id, blob_data in blobs.items()}
+                self._catalog_.update(records)
+                if usage is None:
+                    for blob_data in records.values():
+                        self._usage_.add(blob_data.owner, blob_data.size, 1)
+            self._load_stats_["progress"] = round(bytes_read / total, 4)
+        self._load_stats_ = {"loaded": True, "progress": 1.0, "seconds": round(time.monotonic() - start, 3)}
+        self._loaded_.set()
+
+    def _wait_loaded_(self):
+        """Block until the whole database is loaded"""
+        self._loaded_.wait()
 
     def _commit_(self):
-        with open(self._db_file_, 'w', encoding=DEFAULT_ENCODING) as contents:
-            json.dump(self._blobs_, contents, indent=2, sort_keys=True)
+        """Make the current catalog durable (coalesced with concurrent commits in group commit mode)"""
+        if self._group_commit_:
+            self._group_commit_.commit()
+        else:
+            self._write_db_()
+
+    def _write_db_(self):
+        """Atomically replace the database file with the current catalog"""
+        with self._write_lock_:
+            self._wait_loaded_()
+            serialized = StringIO()
+            with self._lock_:
+                write_snapshot(serialized, self._blobs_, dict(self._header_, groups=self.groupsSnapshot(),
+                                                              usage=self._usage_.snapshot()))
+            temp_file = f'{self._db_file_}.tmp'
+            with open(temp_file, 'w', encoding=DEFAULT_ENCODING) as contents:
+                contents.write(serialized.getvalue())
+                contents.flush()
+                os.fsync(contents.fileno())
+            os.replace(temp_file, self._db_file_)
+
+    def flush(self):
+        """Make every change durable now"""
+        self._commit_()
+
+    def subscribe(self, callback):
+        """Call "callback(event, key, blob_data, before)" after every committed change.
+
+        Events are "create", "update", "delete", "visibility" and "acl" (the key is the blob ID
+        and blob_data its record, the removed one for "delete"), and "group" (the key is the
+        group name and blob_data is None). "before" is (public, users) before "visibility" and
+        "acl" changes, the users who gained or lost access through the group for "group" changes
+        (none if no blob grants it), None otherwise.
+        """
+        self._subscribers_.append(callback)
+
+    def _notify_(self, event, key, blob_data=None, before=None):
+        for callback in self._subscribers_:
+            try:
+                callback(event, key, blob_data, before)
+            except Exception as error:  # pylint: disable=broad-except
+                logging.error(f'Change subscriber failed: {error}')
+
+    def close(self):
+        """Flush pending commits"""
+        self._stop_.set()
+        if self._scrubber_:
+            self._scrubber_.stop()
+        if self._group_commit_:
+            self._group_commit_.close()
+            self._group_commit_ = None
+        if self._packs_:
+            self._packs_.close()
+
+    def _store_(self, file, url, limit=None, user=None):
+        """Save an uploaded file, in a pack if it is small. Returns encoding, size, location and digest.
+
+        Raises QuotaExceeded as soon as the file is bigger than "limit" bytes (if given).
+        """
+        if limit is not None:
+            file = FileStorage(stream=LimitedStream(file.stream, limit, user), filename=file.filename)
+        digest = hashlib.sha256()
+        head = file.stream.read(self._pack_threshold_ + 1) if self._packs_ else b''
+        if not self._packs_ or len(head) > self._pack_threshold_:
+            with self._backend_.writer(url) as contents:
+                encoding, size = save_file(file, contents, self._compression_, head=head, digest=digest)
+            return encoding, size, None, digest.hexdigest()
+        packed = BytesIO()
+        encoding, size = save_file(file, packed, self._compression_, head=head, digest=digest)
+        return encoding, size, self._packs_.append(packed.getvalue()), digest.hexdigest()
+
+    def _discard_(self, blob_data):
+        """Remove the stored contents of a blob"""
+        if blob_data.location is not None:
+            self._packs_.delete(blob_data.location)
+        else:
+            self._backend_.remove(blob_data.url)
+
+    def _version_key_(self, blob_id, name):
+        return os.path.join(self._storage_, VERSIONS_DIRECTORY, blob_id, name)
+
+    def _same_version_(self, blob_data):
+        """Version kept with the same contents as the blob, if any"""
+        return next((other for other in blob_data.versions or ()
+                     if blob_data.digest and other["digest"] == blob_data.digest), None)
+
+    def _prepare_version_(self, blob_id):
+        """Copy the current contents of a blob, to keep them as a version, without the lock (see _keep_version_).
+
+        Returns (version, key) of the copy, or None if no copy is needed.
+        """
+        if self._versions_ <= 0:
+            return None
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            same = self._same_version_(blob_data)
+            if blob_data.location is not None or (same is not None and "key" in same):
+                return None
+            version, url = blob_data.version, blob_data.url
+        key = self._version_key_(blob_id, uuid.uuid4().hex)
+        self._backend_.copy(url, key)
+        return version, key
+
+    def _keep_version_(self, blob_id, blob_data, prepared=None):
+        """Keep the current contents of a blob as a version (sharing them), dropping the oldest versions.
+
+        "prepared" is the copy made by _prepare_version_. Returns True if it was used, else the caller removes it.
+        """
+        if self._versions_ <= 0:
+            return False
+        used = False
+        versions = blob_data.versions or []
+        entry = {"version": blob_data.version, "digest": blob_data.digest, "size": blob_data.size,
+                 "encoding": blob_data.encoding, "time": time.time()}
+        same = self._same_version_(blob_data)
+        if blob_data.location is not None:
+            entry["location"] = blob_data.location
+            self._packs_.track(blob_data.location)
+        elif same is not None and "key" in same:
+            # Unchanged contents are stored once
+            entry.update(key=same["key"], encoding=same["encoding"])
+        elif prepared is not None and prepared[0] == blob_data.version:
+            entry["key"] = prepared[1]
+            used = True
+        else:
+            # Changed since the copy was prepared by a concurrent update: copy it now
+            entry["key"] = self._version_key_(blob_id, uuid.uuid4().hex)
+            self._backend_.copy(blob_data.url, entry["key"])
+        versions.append(entry)
+        while len(versions) > self._versions_:
+            self._drop_version_(versions.pop(0), versions)
+        blob_data.versions = versions
+        return used
+
+    def _drop_prepared_(self, prepared):
+        """Remove a copy made by _prepare_version_ which was not used"""
+        if prepared is not None and self._backend_.exists(prepared[1]):
+            self._backend_.remove(prepared[1])
+
+    def _drop_version_(self, entry, remaining=()):
+        """Remove the stored contents of a version, unless other versions share them"""
+        if entry.get("location") is not None:
+            self._packs_.delete(entry["location"])
+        elif not any(other.get("key") == entry["key"] for other in remaining):
+            try:
+                self._backend_.remove(entry["key"])
+            except FileNotFoundError:
+                pass
+
+    def _swap_(self, blob_data, url, location):
+        """Discard the contents replaced by the new ones (just moved to url, or in a pack location)"""
+        if blob_data.location is not None or blob_data.url != url or location is not None:
+            self._discard_(blob_data)
+
+    def readBlob(self, blob_data):
+        """Iterate over the original contents of a blob (a record, see storedBlob())"""
+        if blob_data.location is not None:
+            return iter([decompress(self._packs_.read(blob_data.location), blob_data.encoding)])
+        return read_chunks(self._backend_.open(blob_data.url), blob_data.encoding)
+
+    @property
+    def backend(self):
+        """Storage backend of the blob contents"""
+        return self._backend_
+
+    @property
+    def storage(self):
+        """Storage directory (prefix of the URLs)"""
+        return self._storage_
+
+    def storedUrls(self):
+        """URLs of the blobs stored as individual files, including those being written"""
+        self._wait_loaded_()
+        with self._lock_:
+            return {blob.url for blob in self._blobs_.values() if blob.location is None} | self._reserved_urls_
+
+    def storedBlob(self, blob_id):
+        """Copy of the record of a blob (without permission checks), None if it does not exist"""
+        with self._lock_:
+            blob_data = self._blobs_.get(blob_id)
+            return BlobRecord.from_dict(blob_data.to_dict()) if blob_data is not None else None
+
+    def openStored(self, blob_data):
+        """Binary file with the stored (maybe compressed) contents of a blob (a record, see storedBlob())"""
+        if blob_data.location is not None:
+            return BytesIO(self._packs_.read(blob_data.location))
+        return self._backend_.open(blob_data.url)
+
+    def blobVersions(self):
+        """Version and digest of every blob (without permission checks)"""
+        self._wait_loaded_()
+        with self._lock_:
+            return {blob_id: {"version": blob.version, "digest": blob.digest} for blob_id, blob in self._blobs_.items()}
+
+    def groupsSnapshot(self):
+        """Every group, in the stored format"""
+        with self._lock_:
+            return {
+                name: {"owner": group["owner"], "members": sorted(group["members"])}
+                for name, group in self._groups_.items()
+            }
+
+    def applyReplica(self, blob_id, blob_data, stored, commit=True):
+        """Store a blob replicated from another service: its record (stored format) and stored contents"""
+        self._wait_loaded_()
+        record = BlobRecord.from_dict(blob_data)
+        record.url = os.path.join(self._storage_, os.path.basename(record.url))
+        record.location = None
+        # Replicas do not keep previous versions
+        record.versions = None
+        # Written aside without the lock (it may be a network transfer) and swapped in
+        staging = self._version_key_(blob_id, f'{uuid.uuid4().hex}.part')
+        with self._backend_.writer(staging) as contents:
+            chunk = stored.read(CHUNK_SIZE)
+            while chunk:
+                contents.write(chunk)
+                chunk = stored.read(CHUNK_SIZE)
+        try:
+            with self._lock_:
+                if any(other.url == record.url for other_id, other in self._blobs_.items() if other_id != blob_id):
+                    # The name is used here by another blob (i.e. moved from another shard)
+                    record.url = os.path.join(self._storage_, blob_id, os.path.basename(record.url))
+                old = self._blobs_.get(blob_id)
+                if old is not None:
+                    self._drop_stored_(blob_id, old, record.url)
+                    self._acls_.release(old.users)
+                    self._usage_.add(old.owner, -(old.size or 0), -1)
+                self._backend_.rename(staging, record.url)
+                record.users = self._acls_.acquire(record.users)
+                self._blobs_[blob_id] = record
+                self._usage_.add(record.owner, record.size, 1)
+                self._cache_.invalidate(blob_id)
+        except Exception:
+            if self._backend_.exists(staging):
+                self._backend_.remove(staging)
+            raise
+        if commit:
+            self._commit_()
+
+    def dropReplica(self, blob_id, commit=True):
+        """Remove a blob removed in the service this one replicates"""
+        self._wait_loaded_()
+        with self._lock_:
+            old = self._blobs_.pop(blob_id, None)
+            if old is None:
+                return
+            self._drop_stored_(blob_id, old)
+            self._acls_.release(old.users)
+            self._usage_.add(old.owner, -(old.size or 0), -1)
+            self._cache_.invalidate(blob_id)
+        if commit:
+            self._commit_()
+
+    def _drop_stored_(self, blob_id, blob_data, keep_url=None):
+        """Remove the stored contents and versions of a replicated blob, unless another blob uses the file now"""
+        versions = list(blob_data.versions or ())
+        while versions:
+            self._drop_version_(versions.pop(), versions)
+        if blob_data.location is not None:
+            self._packs_.delete(blob_data.location)
+        elif blob_data.url != keep_url and self._backend_.exists(blob_data.url) and not any(
+                other.url == blob_data.url for other_id, other in self._blobs_.items() if other_id != blob_id):
+            self._backend_.remove(blob_data.url)
+
+    def setGroups(self, groups, commit=True):
+        """Replace every group (stored format), replicated from another service"""
+        self._wait_loaded_()
+        with self._lock_:
+            before = self.groupsSnapshot()
+            after = {name: {"owner": group["owner"], "members": sorted(group["members"])}
+                     for name, group in groups.items()}
+            changed = {
+                name: self._affected_(name, before.get(name, {}).get("members", ()),
+                                      after.get(name, {}).get("members", ()))
+                for name in set(before) | set(after) if before.get(name) != after.get(name)
+            }
+            removed = set(before) - set(after)
+            self._groups_ = {
+                name: {"owner": group["owner"], "members": intern_users(group["members"])}
+                for name, group in groups.items()
+            }
+            self._memberships_ = {}
+            revoked = [change for name in removed for change in self._revoke_group_(name)]
+        if commit:
+            self._commit_()
+        for name, affected in changed.items():
+            self._notify_('group', name, before=affected)
+        for blob_id, blob_data, before in revoked:
+            self._notify_('acl', blob_id, blob_data, before)
+
+    def blobIds(self):
+        """IDs of every blob (without permission checks)"""
+        self._wait_loaded_()
+        with self._lock_:
+            return list(self._blobs_)
+
+    def compactPacks(self):
+        """Move the live blobs out of the packs mostly holding deleted blobs, and remove those packs"""
+        if not self._packs_:
+            return 0
+        self._wait_loaded_()
+        # Removed in the previous compaction: no read can still be using them
+        self._packs_.release_retired()
+        compacted = 0
+        for pack in self._packs_.garbage():
+            with self._lock_:
+                # Copies of a blob share its location: move it once
+                moved = {}
+
+                def relocate(location):
+                    new_location = moved.get(location)
+                    if new_location is None:
+                        new_location = moved[location] = self._packs_.append(self._packs_.read(location), sync=False)
+                    else:
+                        self._packs_.track(new_location)
+                    self._packs_.delete(location)
+                    return new_location
+                for blob_data in self._blobs_.values():
+                    if blob_data.location is not None and blob_data.location[0] == pack:
+                        blob_data.location = relocate(blob_data.location)
+                    for entry in blob_data.versions or ():
+                        if entry.get("location") is not None and entry["location"][0] == pack:
+                            entry["location"] = relocate(entry["location"])
+                self._packs_.sync()
+            # The old pack is removed only when the catalog no longer points to it
+            self._commit_()
+            self._packs_.retire(pack)
+            compacted += 1
+        return compacted
+
+    def _compactor_(self, interval):
+        while not self._stop_.wait(interval):
+            try:
+                self.compactPacks()
+            except Exception as error:  # pylint: disable=broad-except
+                logging.error(f'Pack compaction failed: {error}')
 
     def _exists_(self, blob_id):
+        """Record of a blob. Callers holding the lock must wait for the load first, the loader needs the lock"""
         if blob_id not in self._blobs_:
-            raise ObjectNotFound(blob_id)
+            # It may just not be loaded yet
+            self._wait_loaded_()
+            if blob_id not in self._blobs_:
+                raise ObjectNotFound(blob_id)
         return self._blobs_[blob_id]
 
     def newBlob(self, file, user):
+        blob_id, url, blob_data = self._add_blob_(file, user)
+        self._commit_()
+        self._notify_('create', blob_id, blob_data)
+
+        return blob_id, url
+
+    def _add_blob_(self, file, user):
+        """Store a new blob and add it to the catalog, without committing it"""
         # Save the file and generate blob metadata
         if not file:
             raise ValueError("File not provided")
         filename = secure_filename(file.filename)
-        url = os.path.join(FILE_STORAGE, filename)
-        blob_id = str(uuid.uuid4())
-
-        storage_path = os.path.dirname(url)
-        if not os.path.exists(storage_path):
-            os.makedirs(storage_path)
+        url = os.path.join(self._storage_, filename)
+        blob_id = self._new_id_()
 
         """Add new blob to DB"""
-        if url in [blob["URL"] for blob in self._blobs_.values()]:
-            raise ObjectAlreadyExists(url)
-        if blob_id in self._blobs_:
-            raise ObjectAlreadyExists(blob_id)
+        self._wait_loaded_()
+        with self._lock_:
+            if url in self._reserved_urls_ or url in [blob.url for blob in self._blobs_.values()]:
+                raise ObjectAlreadyExists(url)
+            if blob_id in self._blobs_:
+                raise ObjectAlreadyExists(blob_id)
+            self._usage_.check(user, 0, 1)
+            limit = self._usage_.remaining(user)
+            self._reserved_urls_.add(url)
 
-        # Save the file
-        file.save(url)
+        try:
+            # Save the file
+            encoding, size, location, digest = self._store_(file, url, limit, user)
 
-        # Save blob info to the database
-        self._blobs_[blob_id] = {"URL": url, "public": True, "users": [], "owner": user}
+            # Save blob info to the database
+            blob_data = BlobRecord(url, True, (), user, size, encoding, location=location, digest=digest)
+            with self._lock_:
+                try:
+                    # Other uploads of the user may have been committed meanwhile
+                    self._usage_.check(user, size, 1)
+                except QuotaExceeded:
+                    self._discard_(blob_data)
+                    raise
+                self._blobs_[blob_id] = blob_data
+                self._usage_.add(user, size, 1)
+        finally:
+            with self._lock_:
+                self._reserved_urls_.discard(url)
+        return blob_id, url, blob_data
+
+    def importBlobs(self, members, user):
+        """Create a blob for every (name, stream) of "members", committing all of them at once.
+
+        Yields, in order, {"name", "blobId", "URL"} for every blob created or {"name", "error"} for the members
+        rejected (not a file, invalid name, already existing, not fitting in the quota). The commit is done when
+        the members are exhausted or reading them fails, so the blobs created before a broken member are kept.
+        """
+        created = []
+        try:
+            for name, stream in members:
+                if stream is None or not secure_filename(name):
+                    yield {"name": name, "error": 'Not a file' if stream is None else f'Invalid blob name "{name}"'}
+                    continue
+                try:
+                    blob_id, url, blob_data = self._add_blob_(FileStorage(stream=stream, filename=name), user)
+                except (ObjectAlreadyExists, QuotaExceeded) as error:
+                    yield {"name": name, "error": str(error)}
+                    continue
+                created.append((blob_id, blob_data))
+                yield {"name": name, "blobId": blob_id, "URL": url}
+        finally:
+            if created:
+                self._commit_()
+                for blob_id, blob_data in created:
+                    self._notify_('create', blob_id, blob_data)
+
+    def _new_id_(self):
+        """Random blob ID (owned by this node if sharded)"""
+        while True:
+            blob_id = str(uuid.uuid4())
+            if self._owns_ is None or self._owns_(blob_id):
+                return blob_id
+
+    def copyBlob(self, blob_id, user, name=None, owner=None):
+        """Create a new blob with the contents of another one, without copying its data if possible.
+
+        Blobs in packs share their location; files are copied by the backend (reflink, hardlink...).
+        The copy keeps the visibility of the source but not its ACL. Only the owner can give a copy to another user.
+        """
+        source = self._exists_(blob_id)
+        raise_optional_token(source, user, self.groupsOf(user))
+        owner = owner or user
+        if owner != user:
+            raise_user_no_owner(source, user)
+        new_id = self._new_id_()
+        filename = secure_filename(name) if name else f'{new_id}-{os.path.basename(source.url)}'
+        if not filename:
+            raise ValueError(f'Invalid blob name "{name}"')
+        url = os.path.join(self._storage_, filename)
+        self._wait_loaded_()
+        while True:
+            with self._lock_:
+                # The source may have been removed or updated meanwhile: copy what is stored now
+                source = self._exists_(blob_id)
+                if url in self._reserved_urls_ or url in [blob.url for blob in self._blobs_.values()]:
+                    raise ObjectAlreadyExists(url)
+                # Copies count in the usage of their owner, even if the data is shared
+                self._usage_.check(owner, source.size or 0, 1)
+                if source.location is not None:
+                    self._packs_.track(source.location)
+                    blob_data = self._add_copy_(new_id, source, owner, url, 'pack')
+                    break
+                # Copied without the lock (it may be a real copy of the data), the URL is reserved meanwhile
+                self._reserved_urls_.add(url)
+                source_url, version = source.url, source.version
+            try:
+                method = self._backend_.copy(source_url, url)
+                with self._lock_:
+                    source = self._exists_(blob_id)
+                    if source.version == version:
+                        self._usage_.check(owner, source.size or 0, 1)
+                        blob_data = self._add_copy_(new_id, source, owner, url, method)
+                        break
+                # Updated while copying: the copy may have any of the versions, copy it again
+                self._backend_.remove(url)
+            except Exception:
+                if self._backend_.exists(url):
+                    self._backend_.remove(url)
+                raise
+            finally:
+                with self._lock_:
+                    self._reserved_urls_.discard(url)
         self._commit_()
+        self._notify_('create', new_id, blob_data)
+        return new_id, url
 
-        return blob_id, url
+    def _add_copy_(self, blob_id, source, owner, url, method):
+        """Add the record of a copy of a blob whose contents are stored (url or pack location)"""
+        self._copies_[method] = self._copies_.get(method, 0) + 1
+        blob_data = self._blobs_[blob_id] = BlobRecord(url, source.public, (), owner, source.size, source.encoding,
+                                                       location=source.location, digest=source.digest)
+        self._usage_.add(owner, source.size, 1)
+        return blob_data
 
     def getBlob(self, blob_id, user=None):
         """Retrieve blob by ID"""
         blob_data = self._exists_(blob_id)
 
-        raise_optional_token(blob_data, user)
-        return blob_data["URL"]
+        raise_optional_token(blob_data, user, self.groupsOf(user))
+        return blob_data.url
 
-    def getBlobs(self, user=None):
-        """Retrieve all blobs"""
-        return {'blobs': [
-            blob_id
-            for blob_id, blob_data in self._blobs_.items()
-            if blob_data['public'] or user == blob_data['owner'] or user in blob_data['users']
-        ]}
+    def openBlob(self, blob_id, user=None, authorized=False):
+        """Retrieve how a blob is stored: URL, encoding (None if stored as is), original size and version.
+
+        Small blobs also include their stored contents in "data", served from the in-memory cache.
+        Blobs stored in pack files always include it. "authorized" skips the ACL (i.e. for pre-signed URLs).
+        """
+        blob_data = self._exists_(blob_id)
+        if not authorized:
+            raise_optional_token(blob_data, user, self.groupsOf(user))
+        version = blob_data.version
+        location = blob_data.location
+        blob_info = {"URL": blob_data.url, "encoding": blob_data.encoding,
+                     "size": blob_data.size, "version": version, "data": None,
+                     "path": self._backend_.path(blob_data.url) if location is None else None,
+                     "open": functools.partial(self._backend_.open, blob_data.url)}
+        if self._cache_.enabled:
+            blob_info["data"] = self._cache_.get(blob_id, version)
+            if blob_info["data"] is not None:
+                return blob_info
+        stored_size = location[2] if location is not None else None
+        if location is not None:
+            blob_info["data"] = self._packs_.read(location)
+        elif self._cache_.enabled:
+            # Avoid asking the backend when the stored size is known
+            stored_size = blob_data.size if blob_data.encoding is None and blob_data.size is not None \
+                else self._backend_.size(blob_data.url)
+            if self._cache_.cacheable(stored_size):
+                with self._backend_.open(blob_data.url) as contents:
+                    blob_info["data"] = contents.read()
+        if blob_info["data"] is not None and self._cache_.cacheable(stored_size):
+            # Do not cache if the blob was updated while reading it
+            if blob_data.version == version and blob_id in self._blobs_:
+                self._cache_.put(blob_id, version, blob_info["data"])
+        return blob_info
+
+    def metrics(self):
+        """Internal counters of the service"""
+        metrics = {"blobs": len(self._blobs_), "acl_sets": len(self._acls_), "groups": len(self._groups_),
+                   "load": dict(self._load_stats_), "cache": self._cache_.stats}
+        if self._group_commit_:
+            metrics["group_commit"] = self._group_commit_.stats
+        if self._packs_:
+            metrics["packs"] = self._packs_.stats
+        if self._scrubber_:
+            metrics["scrubber"] = self._scrubber_.stats
+        if self._copies_:
+            metrics["copies"] = dict(self._copies_)
+        return metrics
+
+    def usage(self, user):
+        """Bytes and blobs stored by a user, and their quota"""
+        self._wait_loaded_()
+        with self._lock_:
+            return self._usage_.get(user)
+
+    def setRemoteUsage(self, owner, size, blobs):
+        """Bytes and blobs of an owner in the other nodes of a sharded deployment, counted in their quota"""
+        with self._lock_:
+            self._usage_.set_remote(owner, size, blobs)
+
+    def checkQuota(self, user, size, blob_id=None):
+        """Raise QuotaExceeded if a user cannot store a new blob (or replace blob_id) of "size" bytes"""
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._blobs_.get(blob_id) if blob_id else None
+            if blob_data is None:
+                self._usage_.check(user, size, 1)
+            else:
+                self._usage_.check(blob_data.owner, size - (blob_data.size or 0))
+
+    def getBlobs(self, user=None, owner=None, pattern=None):
+        """Retrieve all blobs, optionally only those of an owner or whose name matches a glob pattern"""
+        self._wait_loaded_()
+        # One set lookup per blob: the user or any of their groups in the ACL
+        principals = self.groupsOf(user) | {user} if user is not None else frozenset()
+        with self._lock_:
+            return {'blobs': [
+                blob_id
+                for blob_id, blob_data in self._blobs_.items()
+                if (blob_data.public or user == blob_data.owner or not principals.isdisjoint(blob_data.users))
+                and (owner is None or blob_data.owner == owner)
+                and (pattern is None or fnmatch.fnmatchcase(os.path.basename(blob_data.url), pattern))
+            ]}
+
+    def exportBlobs(self, blob_ids, user=None):
+        """Blobs to archive (see blobapi.archive): name, size and contents, or why they are skipped"""
+        for blob_id in blob_ids:
+            try:
+                blob_info = self.openBlob(blob_id, user)
+                # Opened now, so a blob removed meanwhile is skipped instead of breaking the archive
+                stored = BytesIO(blob_info["data"]) if blob_info["data"] is not None else blob_info["open"]()
+            except (ObjectNotFound, UnauthorizedBlob, FileNotFoundError) as error:
+                yield {"blobId": blob_id, "error": str(error)}
+                continue
+            size = blob_info["size"]
+            if size is None:
+                # Records from old databases may not know the original size
+                size = sum(len(chunk) for chunk in read_chunks(stored, blob_info["encoding"]))
+                stored = BytesIO(blob_info["data"]) if blob_info["data"] is not None else blob_info["open"]()
+            yield {"blobId": blob_id, "name": os.path.basename(blob_info["URL"]), "size": size,
+                   "chunks": read_chunks(stored, blob_info["encoding"])}
 
     def removeBlob(self, blob_id, user):
         """Remove blob from DB and filesystem using its ID"""
-        blob_data = self._exists_(blob_id)
-        raise_user_no_owner(blob_data, user)
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            raise_user_no_owner(blob_data, user)
 
-        os.remove(blob_data["URL"])
-        del self._blobs_[blob_id]
+            self._discard_(blob_data)
+            for entry in blob_data.versions or ():
+                self._drop_version_(entry)
+            del self._blobs_[blob_id]
+            self._usage_.add(blob_data.owner, -(blob_data.size or 0), -1)
+            self._acls_.release(blob_data.users)
+            self._cache_.invalidate(blob_id)
         self._commit_()
+        self._notify_('delete', blob_id, blob_data)
+
+    def _raise_conflict_(self, blob_data, url):
+        if blob_data.url != url and (url in self._reserved_urls_ or url in [blob.url for blob in self._blobs_.values()]):
+            raise ObjectAlreadyExists(f'Blob "{url}" already exists')
 
     def updateBlob(self, blob_id, new_file, user):
-        """Update blob with a new file"""
-        self._exists_(blob_id)
-        raise_user_no_owner(self._blobs_[blob_id], user)
+        """Update blob with a new file.
 
-        filename = secure_filename(new_file.filename)
-        url = os.path.join(FILE_STORAGE, filename)
+        The file is written aside and swapped in atomically, so readers never miss the blob or get a partial file.
+        The previous contents are kept as a version (see listVersions).
+        """
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            raise_user_no_owner(blob_data, user)
 
-        # Check for potential conflicts
-        if url in [blob["URL"] for blob in self._blobs_.values()] and self._blobs_[blob_id]["URL"] != url:
-            raise ObjectAlreadyExists(f'Blob "{url}" already exists')
+            filename = secure_filename(new_file.filename)
+            url = os.path.join(self._storage_, filename)
+
+            # Check for potential conflicts
+            self._raise_conflict_(blob_data, url)
+            # The new contents replace the current ones in the usage of the owner
+            limit = self._usage_.remaining(user)
+            if limit is not None:
+                limit += blob_data.size or 0
 
-        # Remove the old file
-        os.remove(self._blobs_[blob_id]["URL"])
-        new_file.save(url)
+        staging = self._version_key_(blob_id, f'{uuid.uuid4().hex}.part')
+        encoding, size, location, digest = self._store_(new_file, staging, limit, user)
+        prepared = None
+        try:
+            prepared = self._prepare_version_(blob_id)
+            with self._lock_:
+                # It may have been removed or renamed meanwhile
+                blob_data = self._exists_(blob_id)
+                self._raise_conflict_(blob_data, url)
+                self._usage_.check(blob_data.owner, size - (blob_data.size or 0))
+                self._usage_.add(blob_data.owner, size - (blob_data.size or 0))
+                if self._keep_version_(blob_id, blob_data, prepared):
+                    prepared = None
+                if location is None:
+                    self._backend_.rename(staging, url)
+                self._swap_(blob_data, url, location)
 
-        # Update blob info in the database
-        self._blobs_[blob_id]["URL"] = url
+                # Update blob info in the database
+                blob_data.url = url
+                blob_data.location = location
+                blob_data.digest = digest
+                blob_data.version += 1
+                blob_data.encoding = encoding
+                blob_data.size = size
+                self._cache_.invalidate(blob_id)
+        except Exception:
+            if location is not None:
+                self._packs_.delete(location)
+            elif self._backend_.exists(staging):
+                self._backend_.remove(staging)
+            raise
+        finally:
+            self._drop_prepared_(prepared)
         self._commit_()
+        self._notify_('update', blob_id, blob_data)
+
+    def listVersions(self, blob_id, user):
+        """Current version of a blob and the previous versions kept, oldest first"""
+        blob_data = self._exists_(blob_id)
+        raise_optional_token(blob_data, user, self.groupsOf(user))
+        with self._lock_:
+            return {"version": blob_data.version, "versions": [
+                {"version": entry["version"], "digest": entry["digest"], "size": entry["size"], "time": entry["time"]}
+                for entry in blob_data.versions or ()
+            ]}
+
+    def restoreVersion(self, blob_id, version, user):
+        """Make a previous version the current contents of a blob (as a new version)"""
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            raise_user_no_owner(blob_data, user)
+            entry = self._version_entry_(blob_id, blob_data, version)
+            self._usage_.check(blob_data.owner, (entry["size"] or 0) - (blob_data.size or 0))
+        # The contents are copied without the lock
+        staging = None
+        prepared = None
+        try:
+            if entry.get("location") is None:
+                staging = self._version_key_(blob_id, f'{uuid.uuid4().hex}.part')
+                self._backend_.copy(entry["key"], staging)
+            prepared = self._prepare_version_(blob_id)
+            with self._lock_:
+                # It may have been removed, or the version dropped, meanwhile
+                blob_data = self._exists_(blob_id)
+                entry = self._version_entry_(blob_id, blob_data, version)
+                self._usage_.check(blob_data.owner, (entry["size"] or 0) - (blob_data.size or 0))
+                location = entry.get("location")
+                if location is not None:
+                    self._packs_.track(location)
+                if self._keep_version_(blob_id, blob_data, prepared):
+                    prepared = None
+                if location is None:
+                    self._backend_.rename(staging, blob_data.url)
+                    staging = None
+                self._swap_(blob_data, blob_data.url, location)
+
+                self._usage_.add(blob_data.owner, (entry["size"] or 0) - (blob_data.size or 0))
+                blob_data.location = location
+                blob_data.digest = entry["digest"]
+                blob_data.version += 1
+                blob_data.encoding = entry["encoding"]
+                blob_data.size = entry["size"]
+                self._cache_.invalidate(blob_id)
+        finally:
+            self._drop_prepared_(prepared)
+            if staging is not None and self._backend_.exists(staging):
+                self._backend_.remove(staging)
+        self._commit_()
+        self._notify_('update', blob_id, blob_data)
+
+    @staticmethod
+    def _version_entry_(blob_id, blob_data, version):
+        """Previous version of a blob kept"""
+        entry = next((entry for entry in blob_data.versions or () if entry["version"] == version), None)
+        if entry is None:
+            raise ObjectNotFound(f'{blob_id} version {version}')
+        return entry
 
     def getBlobHash(self, blob_id, user, hash_type='md5'):
         """Compute the hash for the blob based on a specified hash type."""
         blob_data = self._exists_(blob_id)
-        raise_optional_token(blob_data, user)
+        raise_optional_token(blob_data, user, self.groupsOf(user))
         supported_hash_types = ['md5', 'sha1', 'sha256', 'sha512']
         if hash_type not in supported_hash_types:
             raise ValueError(f'Hash type {hash_type} is not supported. Supported hash types are: {supported_hash_types}')
-        with open(blob_data["URL"], 'rb') as f:
-            file_data = f.read()
-            hash_func = getattr(hashlib, hash_type)
-            blob_hash = hash_func(file_data).hexdigest()
+        if hash_type == 'sha256' and blob_data.digest:
+            return {"hash_type": hash_type, "hexdigest": blob_data.digest}
+        # Digest of the original contents, even if stored compressed
+        hash_func = getattr(hashlib, hash_type)()
+        for chunk in self.readBlob(blob_data):
+            hash_func.update(chunk)
+        blob_hash = hash_func.hexdigest()
 
         return {"hash_type": hash_type, "hexdigest": blob_hash}
 
     def setVisibility(self, blob_id, public, user):
         """Change the visibility of a blob."""
-        self._exists_(blob_id)
-        raise_user_no_owner(self._blobs_[blob_id], user)
-        self._blobs_[blob_id]['public'] = public
-        if self._blobs_[blob_id]['public'] != public:
-            self._blobs_[blob_id]['public'] = public
-        else:
-            logging.warning(f'Blob {blob_id} is already {"public" if public else "private"}')
-            # raise StatusNotValid(blob_id, f'Blob is already {"public" if public else "private"}')
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            raise_user_no_owner(blob_data, user)
+            before = (blob_data.public, blob_data.users)
+            blob_data.public = public
+            if blob_data.public != public:
+                blob_data.public = public
+            else:
+                logging.warning(f'Blob {blob_id} is already {"public" if public else "private"}')
+                # raise StatusNotValid(blob_id, f'Blob is already {"public" if public else "private"}')
         self._commit_()
+        self._notify_('visibility', blob_id, blob_data, before)
+
+    def checkOwner(self, blob_id, user):
+        """Raise UnauthorizedBlob if the user is not the owner of the blob"""
+        raise_user_no_owner(self._exists_(blob_id), user)
 
     def getPermissions(self, blob_id, owner):
         """Get read permissions for a blob."""
         blob_data = self._exists_(blob_id)
         raise_user_no_owner(blob_data, owner)
-        users = blob_data['users']
-        users.append(blob_data['owner'])
-        return users
+        return sorted(blob_data.users) + [blob_data.owner]
+
+    def _check_groups_(self, users, owner):
+        """Raise an exception if "users" grant a group which does not exist or the owner is not part of"""
+        for user in users:
+            if not user.startswith(GROUP_PREFIX):
+                continue
+            group = self._groups_.get(user[len(GROUP_PREFIX):])
+            if group is None:
+                raise ObjectNotFound(user)
+            if owner != group["owner"] and owner not in group["members"]:
+                raise UnauthorizedBlob(user=owner, reason=f'{owner} does not belong to {user}')
 
     def addPermission(self, blob_id, users, owner):
         """Add read permissions for a blob."""
-        self._exists_(blob_id)
-        raise_user_no_owner(self._blobs_[blob_id], owner)
-        for user in users:
-            if user not in self._blobs_[blob_id]['users'] and user != self._blobs_[blob_id]['owner']:
-                self._blobs_[blob_id]['users'].append(user)
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            raise_user_no_owner(blob_data, owner)
+            before = (blob_data.public, blob_data.users)
+            new_users = intern_users(user for user in users if user != blob_data.owner)
+            self._check_groups_(new_users - blob_data.users, owner)
+            if not new_users <= blob_data.users:
+                self._set_users_(blob_data, blob_data.users | new_users)
         self._commit_()
+        self._notify_('acl', blob_id, blob_data, before)
 
     def removePermission(self, blob_id, user, owner):
         """Remove read permissions from a user for a blob."""
-        self._exists_(blob_id)
-        raise_user_no_owner(self._blobs_[blob_id], owner)
-        if 'users' in self._blobs_[blob_id] and user in self._blobs_[blob_id]['users']:
-            self._blobs_[blob_id]['users'].remove(user)
-        else:
-            raise ObjectNotFound(user)
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            raise_user_no_owner(blob_data, owner)
+            before = (blob_data.public, blob_data.users)
+            if user in blob_data.users:
+                self._set_users_(blob_data, blob_data.users - {user})
+            else:
+                raise ObjectNotFound(user)
         self._commit_()
+        self._notify_('acl', blob_id, blob_data, before)
 
     def updatePermission(self, blob_id, users, owner):
         """Update read permissions from a user for a blob."""
-        self._exists_(blob_id)
-        raise_user_no_owner(self._blobs_[blob_id], owner)
-        if users is not None and self._blobs_[blob_id]['owner'] in users:
-            users.remove(self._blobs_[blob_id]['owner'])
-        self._blobs_[blob_id]['users'] = users
+        self._wait_loaded_()
+        with self._lock_:
+            blob_data = self._exists_(blob_id)
+            raise_user_no_owner(blob_data, owner)
+            before = (blob_data.public, blob_data.users)
+            new_users = [user for user in users or () if user != blob_data.owner]
+            self._check_groups_(set(new_users) - blob_data.users, owner)
+            self._set_users_(blob_data, new_users)
+        self._commit_()
+        self._notify_('acl', blob_id, blob_data, before)
+
+    def groupsOf(self, user):
+        """Group principals ("group:<name>") the user belongs to, cached until groups change"""
+        if user is None or not self._groups_:
+            return frozenset()
+        groups = self._memberships_.get(user)
+        if groups is None:
+            with self._lock_:
+                groups = intern_users(
+                    GROUP_PREFIX + name for name, group in self._groups_.items() if user in group["members"]
+                )
+                self._memberships_[user] = groups
+        return groups
+
+    def setGroup(self, name, members, user):
+        """Create a group of users, or replace its members (only its owner can)"""
+        self._wait_loaded_()
+        with self._lock_:
+            if name in self._groups_ and self._groups_[name]["owner"] != user:
+                raise UnauthorizedBlob(user=user, reason=f'{user} is not the owner of group "{name}"')
+            affected = self._affected_(name, self._groups_.get(name, {}).get("members", ()), members)
+            self._groups_[name] = {"owner": user, "members": intern_users(members)}
+            self._memberships_ = {}
+        self._commit_()
+        self._notify_('group', name, before=affected)
+
+    def getGroup(self, name, user):
+        """Get the members of a group (only for its owner and members)"""
+        group = self._groups_.get(name)
+        if group is None:
+            raise ObjectNotFound(f'{GROUP_PREFIX}{name}')
+        if user != group["owner"] and user not in group["members"]:
+            raise UnauthorizedBlob(user=user, reason=f'{user} does not belong to group "{name}"')
+        return {"name": name, "owner": group["owner"], "members": sorted(group["members"])}
+
+    def _affected_(self, name, before, after):
+        """Users who gain or lose access when the members of a group change (none if no blob grants the group)"""
+        principal = GROUP_PREFIX + name
+        if not any(principal in blob_data.users for blob_data in self._blobs_.values()):
+            return frozenset()
+        return frozenset(before) ^ frozenset(after)
+
+    def _revoke_group_(self, name):
+        """Remove a group from every ACL granting it. Returns (blob ID, record, (public, users) before) of each blob"""
+        principal = GROUP_PREFIX + name
+        revoked = []
+        for blob_id, blob_data in self._blobs_.items():
+            if principal in blob_data.users:
+                revoked.append((blob_id, blob_data, (blob_data.public, blob_data.users)))
+                self._set_users_(blob_data, blob_data.users - {principal})
+        return revoked
+
+    def removeGroup(self, name, user):
+        """Remove a group (only its owner can) and every grant of it, so a new group with its name gets nothing"""
+        principal = GROUP_PREFIX + name
+        self._wait_loaded_()
+        with self._lock_:
+            group = self._groups_.get(name)
+            if group is None:
+                raise ObjectNotFound(principal)
+            if user != group["owner"]:
+                raise UnauthorizedBlob(user=user, reason=f'{user} is not the owner of group "{name}"')
+            affected = self._affected_(name, group["members"], ())
+            del self._groups_[name]
+            self._memberships_ = {}
+            revoked = self._revoke_group_(name)
         self._commit_()
+        self._notify_('group', name, before=affected)
+        for blob_id, blob_data, before in revoked:
+            self._notify_('acl', blob_id, blob_data, before)
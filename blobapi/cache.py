@@ -0,0 +1,84 @@
+"""In-memory cache for the contents of small blobs."""
+
+import threading
+from collections import OrderedDict
+
+
+class BlobCache:
+    """LRU cache of blob contents bounded by a total byte budget.
+
+    Entries are keyed by (blob ID, version) so a new version of a blob never
+    hits an old entry. Objects bigger than max_object_size are never cached.
+    """
+
+    def __init__(self, max_bytes, max_object_size):
+        self._max_bytes_ = max_bytes
+        self._max_object_size_ = min(max_object_size, max_bytes)
+        self._entries_ = OrderedDict()
+        self._keys_ = {}
+        self._bytes_ = 0
+        self._hits_ = 0
+        self._misses_ = 0
+        self._evictions_ = 0
+        self._lock_ = threading.Lock()
+
+    @property
+    def enabled(self):
+        """Return if the cache can hold anything"""
+        return self._max_bytes_ > 0
+
+    def cacheable(self, size):
+        """Check if an object of the given size is accepted by the cache"""
+        return self.enabled and size <= self._max_object_size_
+
+    def get(self, blob_id, version):
+        """Get cached contents (None if missing)"""
+        with self._lock_:
+            data = self._entries_.get((blob_id, version))
+            if data is None:
+                self._misses_ += 1
+                return None
+            self._entries_.move_to_end((blob_id, version))
+            self._hits_ += 1
+            return data
+
+    def put(self, blob_id, version, data):
+        """Store contents, evicting least recently used entries if needed"""
+        if not self.cacheable(len(data)):
+            return
+        with self._lock_:
+            self._discard_(blob_id)
+            self._entries_[(blob_id, version)] = data
+            self._keys_[blob_id] = (blob_id, version)
+            self._bytes_ += len(data)
+            while self._bytes_ > self._max_bytes_:
+                (old_id, _), old_data = self._entries_.popitem(last=False)
+                del self._keys_[old_id]
+                self._bytes_ -= len(old_data)
+                self._evictions_ += 1
+
+    def invalidate(self, blob_id):
+        """Drop any cached version of a blob"""
+        with self._lock_:
+            self._discard_(blob_id)
+
+    def _discard_(self, blob_id):
+        key = self._keys_.pop(blob_id, None)
+        if key is not None:
+            self._bytes_ -= len(self._entries_.pop(key))
+
+    @property
+    def stats(self):
+        """Cache counters"""
+        with self._lock_:
+            lookups = self._hits_ + self._misses_
+            return {
+                'entries': len(self._entries_),
+                'bytes': self._bytes_,
+                'max_bytes': self._max_bytes_,
+                'max_object_size': self._max_object_size_,
+                'hits': self._hits_,
+                'misses': self._misses_,
+                'evictions': self._evictions_,
+                'hit_ratio': round(self._hits_ / lookups, 4) if lookups else 0.0
+            }
@@ -0,0 +1,102 @@
+"""Change feed of the blob metadata.
+
+Every committed change of a blob (see BlobDB.subscribe) gets a sequence number
+and is kept in a bounded in-memory log, with the visibility of the blob at the
+time of the change: before it for deletions, and before or after it for
+visibility and ACL changes, so clients also learn about the blobs they can no
+longer read. Clients resume from the last sequence number they saw and only get
+the changes of the blobs they could read, so they do not need to poll the whole
+listing:
+
+- GET /api/v1/changes?since=<sequence>&wait=<seconds> answers as soon as there are
+  changes (long poll).
+- The same URL with "Accept: text/event-stream" pushes them as server-sent events
+  (the sequence is the event ID, so "Last-Event-ID" resumes the stream).
+
+Sequence numbers start at the startup time in microseconds, so they keep growing
+across restarts. A client whose sequence number is no longer in the log (too old,
+or from before a restart) gets a "reset": it must list the blobs again and follow
+the feed from the sequence number given. So does a client whose user joined or
+left a group granted on some blobs, since that changes which blobs it can read.
+"""
+
+import threading
+import time
+from collections import deque
+
+from blobapi import CHANGE_FEED_SIZE
+
+BLOB_EVENTS = ('create', 'update', 'delete', 'visibility', 'acl')
+
+
+class ChangeFeed:
+    """Bounded log of the changes of a BlobDB"""
+
+    def __init__(self, blobdb, size=CHANGE_FEED_SIZE):
+        self._blobdb_ = blobdb
+        self._condition_ = threading.Condition()
+        # (sequence, event, blob ID, public, owner, users)
+        self._changes_ = deque(maxlen=size)
+        self._last_ = time.time_ns() // 1000
+        blobdb.subscribe(self._changed_)
+
+    def _changed_(self, event, key, blob_data=None, before=None):
+        if event == 'group':
+            if before:
+                # The users who gained or lost access through the group are told to list again
+                with self._condition_:
+                    self._last_ += 1
+                    self._changes_.append((self._last_, event, key, False, None, before))
+                    self._condition_.notify_all()
+            return
+        if event not in BLOB_EVENTS or blob_data is None:
+            return
+        public, users = blob_data.public, blob_data.users
+        if before is not None:
+            public, users = public or before[0], users | before[1]
+        with self._condition_:
+            self._last_ += 1
+            self._changes_.append((self._last_, event, key, public, blob_data.owner, users))
+            self._condition_.notify_all()
+
+    @property
+    def last(self):
+        """Sequence number of the last change"""
+        with self._condition_:
+            return self._last_
+
+    def _expired_(self, since):
+        """Check if changes after a sequence number were lost (or it is unknown)"""
+        oldest = self._changes_[0][0] if self._changes_ else self._last_ + 1
+        return since > self._last_ or since < oldest - 1
+
+    def read(self, since, user=None, timeout=0, limit=1000):
+        """Changes after a sequence number visible for a user, waiting up to "timeout" seconds for some.
+
+        Returns a dict with the "changes", the "next" sequence number to ask for and "reset" if the
+        client must list the blobs again.
+        """
+        principals = self._blobdb_.groupsOf(user) | {user} if user is not None else frozenset()
+        deadline = time.monotonic() + timeout
+        with self._condition_:
+            if self._expired_(since):
+                return {"changes": [], "next": self._last_, "reset": True}
+            while True:
+                changes = []
+                for sequence, event, blob_id, public, owner, users in self._changes_:
+                    if sequence <= since:
+                        continue
+                    if event == 'group':
+                        if user in users:
+                            return {"changes": [], "next": self._last_, "reset": True}
+                        continue
+                    if public or (user is not None and (user == owner or not principals.isdisjoint(users))):
+                        changes.append({"sequence": sequence, "event": event, "blobId": blob_id})
+                        if len(changes) == limit:
+                            return {"changes": changes, "next": sequence, "reset": False}
+                # Changes not visible for this user are skipped too
+                since = self._last_
+                remaining = deadline - time.monotonic()
+                if changes or remaining <= 0:
+                    return {"changes": changes, "next": since, "reset": False}
+                self._condition_.wait(remaining)
@@ -0,0 +1,94 @@
+"""At-rest compression of blob contents."""
+
+import os
+import zlib
+
+from blobapi import COMPRESSION_MIN_RATIO
+
+GZIP = 'gzip'
+NO_COMPRESSION = 'none'
+SUPPORTED_COMPRESSIONS = [GZIP, NO_COMPRESSION]
+
+CHUNK_SIZE = 64 * 1024
+# zlib "wbits" value which produces/reads a gzip container, usable as HTTP Content-Encoding
+_GZIP_WBITS = 31
+
+
+def _compressible_(sample):
+    """Check if a sample of the data shrinks enough to be worth compressing"""
+    if not sample:
+        return False
+    return len(zlib.compress(sample, 1)) < len(sample) * COMPRESSION_MIN_RATIO
+
+
+def save_file(file, path, compression=NO_COMPRESSION, head=b'', digest=None):
+    """Store an uploaded file (a FileStorage), compressed if it is worth it.
+
+    "path" can also be an open binary file. "head" is the beginning of the contents, if
+    it was already read from the file stream. "digest" (a hashlib object) is updated
+    with the original contents.
+    Returns the encoding used to store the file (None if stored as is) and the original size.
+    """
+    if compression not in SUPPORTED_COMPRESSIONS:
+        raise ValueError(f'Compression {compression} is not supported. Supported: {SUPPORTED_COMPRESSIONS}')
+    if not isinstance(path, (str, bytes, os.PathLike)):
+        return _write_stream_(file.stream, path, compression, head, digest)
+    with open(path, 'wb') as contents:
+        return _write_stream_(file.stream, contents, compression, head, digest)
+
+
+def _write_stream_(stream, contents, compression, head, digest):
+    sample = head + stream.read(max(CHUNK_SIZE - len(head), 0))
+    encoding = GZIP if compression == GZIP and _compressible_(sample) else None
+    compressor = zlib.compressobj(6, zlib.DEFLATED, _GZIP_WBITS) if encoding else None
+    size = 0
+    chunk = sample
+    while chunk:
+        size += len(chunk)
+        if digest is not None:
+            digest.update(chunk)
+        contents.write(compressor.compress(chunk) if compressor else chunk)
+        chunk = stream.read(CHUNK_SIZE)
+    if compressor:
+        contents.write(compressor.flush())
+    return encoding, size
+
+
+def read_chunks(path, encoding=None):
+    """Iterate over the original (decompressed) contents of a stored file ("path" can also be an open binary file)"""
+    decompressor = zlib.decompressobj(_GZIP_WBITS) if encoding == GZIP else None
+    with (open(path, 'rb') if isinstance(path, (str, bytes, os.PathLike)) else path) as contents:
+        while True:
+            chunk = contents.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            if decompressor:
+                chunk = decompressor.decompress(chunk)
+            if chunk:
+                yield chunk
+        if decompressor:
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+
+
+def read_range(path, first, last, encoding=None):
+    """Iterate over the original contents of a stored file from "first" to "last" (inclusive)"""
+    contents = open(path, 'rb') if isinstance(path, (str, bytes, os.PathLike)) else path
+    if encoding is None and contents.seekable():
+        # Not compressed: seek to the first byte instead of reading up to it
+        contents.seek(first)
+        first, last = 0, last - first
+    position = 0
+    for chunk in read_chunks(contents, encoding):
+        end = position + len(chunk)
+        if end > first:
+            yield chunk[max(first - position, 0):last + 1 - position]
+        position = end
+        if position > last:
+            break
+
+
+def decompress(data, encoding=None):
+    """Original contents of stored data held in memory"""
+    return zlib.decompress(data, _GZIP_WBITS) if encoding == GZIP else data
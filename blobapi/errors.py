@@ -42,6 +42,28 @@ class ObjectAlreadyExists(Exception):
     def __str__(self):
         return f'Trying to create already created item "{self._item_}"'
 
+
+class QuotaExceeded(Exception):
+    """Storage quota error"""
+
+    def __init__(self, user='unknown', reason='unknown'):
+        self._user_ = user
+        self._reason_ = reason
+
+    def __str__(self):
+        return f'Quota exceeded for user "{self._user_}": {self._reason_}'
+
+
+class InvalidSignature(Exception):
+    """Pre-signed URL error"""
+
+    def __init__(self, reason='unknown'):
+        self._reason_ = reason
+
+    def __str__(self):
+        return f'Invalid pre-signed URL: {self._reason_}'
+
+
 class ServiceError(Exception):
     """Generic service error"""
 
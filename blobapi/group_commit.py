@@ -0,0 +1,85 @@
+"""Group commit: coalesce concurrent durable writes of the blob database."""
+
+import logging
+import threading
+import time
+
+_WRN = logging.warning
+
+
+class GroupCommitter:
+    """Batch commit requests into a single call to a durable write function.
+
+    Every call to commit() takes a ticket and blocks until a write that started
+    after the ticket was issued has finished, so the caller's change is durable
+    when commit() returns. A background thread waits up to "window" seconds (or
+    until "batch_size" tickets are pending) and then writes once for all of them.
+    """
+
+    def __init__(self, write, window=0.005, batch_size=128):
+        self._write_ = write
+        self._window_ = window
+        self._batch_size_ = max(1, batch_size)
+        self._condition_ = threading.Condition()
+        self._requested_ = 0
+        self._durable_ = 0
+        self._failed_ = {}
+        self._commits_ = 0
+        self._closed_ = False
+        self._thread_ = threading.Thread(target=self._run_, name='group-commit', daemon=True)
+        self._thread_.start()
+
+    def commit(self):
+        """Request a durable write and wait for it"""
+        with self._condition_:
+            if self._closed_:
+                raise RuntimeError('Group commit is closed')
+            self._requested_ += 1
+            ticket = self._requested_
+            self._condition_.notify_all()
+            while self._durable_ < ticket:
+                self._condition_.wait()
+            error = self._failed_.pop(ticket, None)
+        if error is not None:
+            raise error
+
+    def close(self):
+        """Flush pending requests and stop the writer thread"""
+        with self._condition_:
+            self._closed_ = True
+            self._condition_.notify_all()
+        self._thread_.join()
+
+    @property
+    def stats(self):
+        """Number of requests and of actual writes"""
+        with self._condition_:
+            return {'requests': self._requested_, 'writes': self._commits_}
+
+    def _run_(self):
+        while True:
+            with self._condition_:
+                while self._requested_ == self._durable_ and not self._closed_:
+                    self._condition_.wait()
+                if self._requested_ == self._durable_:
+                    return
+                deadline = time.monotonic() + self._window_
+                while not self._closed_ and self._requested_ - self._durable_ < self._batch_size_:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition_.wait(remaining)
+                target = self._requested_
+            error = None
+            try:
+                self._write_()
+            except Exception as failure:  # pylint: disable=broad-except
+                _WRN(f'Group commit failed: {failure}')
+                error = failure
+            with self._condition_:
+                if error is not None:
+                    for ticket in range(self._durable_ + 1, target + 1):
+                        self._failed_[ticket] = error
+                self._durable_ = target
+                self._commits_ += 1
+                self._condition_.notify_all()
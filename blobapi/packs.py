@@ -0,0 +1,157 @@
+"""Append-only pack files for small blobs.
+
+Storing every small blob in its own file wastes inodes, and opening/stat-ing the
+files dominates the latency of small uploads and downloads. Small blobs are
+appended instead to big pack files ("pack-000001.pack"...) and the catalog keeps
+their location: (pack, offset, length). Reads are a single pread() on a file
+descriptor kept open for every pack.
+
+Pack files are never rewritten: removing a blob only drops it from the index (a
+tombstone) and its bytes become garbage. The compaction copies the live blobs of
+packs mostly holding garbage to the active pack and removes the old pack files.
+"""
+
+import os
+import re
+import threading
+
+from blobapi import PACK_MAX_SIZE, PACK_GARBAGE_RATIO
+
+_PACK_NAME = re.compile(r'^pack-(\d{6})\.pack$')
+
+
+def _pack_file_(pack):
+    return f'pack-{pack:06d}.pack'
+
+
+class PackStore:
+    """Pack files in a directory"""
+
+    def __init__(self, directory, max_pack_size=PACK_MAX_SIZE, garbage_ratio=PACK_GARBAGE_RATIO):
+        self._directory_ = directory
+        self._max_pack_size_ = max_pack_size
+        self._garbage_ratio_ = garbage_ratio
+        self._lock_ = threading.Lock()
+        # Pack -> read-only file descriptor, bytes on disk and bytes used by live blobs
+        self._readers_ = {}
+        self._sizes_ = {}
+        self._live_ = {}
+        # Descriptors of removed packs, kept open for the reads in progress
+        self._retired_ = []
+        os.makedirs(directory, exist_ok=True)
+        for filename in os.listdir(directory):
+            match = _PACK_NAME.match(filename)
+            if match:
+                pack = int(match.group(1))
+                self._sizes_[pack] = os.path.getsize(self._path_(pack))
+                self._live_[pack] = 0
+        self._active_ = max(self._sizes_, default=0)
+        self._writer_ = None
+        self._open_active_(self._active_ or 1)
+
+    def _path_(self, pack):
+        return os.path.join(self._directory_, _pack_file_(pack))
+
+    def _open_active_(self, pack):
+        """Start appending to a pack"""
+        if self._writer_ is not None:
+            os.close(self._writer_)
+        self._active_ = pack
+        self._writer_ = os.open(self._path_(pack), os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        self._sizes_.setdefault(pack, 0)
+        self._live_.setdefault(pack, 0)
+
+    def _reader_(self, pack):
+        reader = self._readers_.get(pack)
+        if reader is None:
+            with self._lock_:
+                reader = self._readers_.get(pack)
+                if reader is None:
+                    reader = self._readers_[pack] = os.open(self._path_(pack), os.O_RDONLY)
+        return reader
+
+    def append(self, data, sync=True):
+        """Store data at the end of the active pack, return its location"""
+        with self._lock_:
+            if self._sizes_[self._active_] and self._sizes_[self._active_] + len(data) > self._max_pack_size_:
+                self._open_active_(max(self._sizes_) + 1)
+            pack = self._active_
+            offset = self._sizes_[pack]
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self._writer_, view):]
+            if sync:
+                os.fsync(self._writer_)
+            self._sizes_[pack] += len(data)
+            self._live_[pack] += len(data)
+        return pack, offset, len(data)
+
+    def sync(self):
+        """Flush the active pack to disk"""
+        with self._lock_:
+            os.fsync(self._writer_)
+
+    def read(self, location):
+        """Contents stored at a location"""
+        pack, offset, length = location
+        data = os.pread(self._reader_(pack), length, offset)
+        if len(data) != length:
+            raise IOError(f'Truncated blob in {_pack_file_(pack)} at offset {offset}')
+        return data
+
+    def track(self, location):
+        """Count a location as used by a live blob (when the index is loaded)"""
+        pack, _, length = location
+        with self._lock_:
+            if pack in self._live_:
+                self._live_[pack] += length
+
+    def delete(self, location):
+        """Tombstone a location: its bytes become garbage"""
+        pack, _, length = location
+        with self._lock_:
+            if pack in self._live_:
+                self._live_[pack] = max(self._live_[pack] - length, 0)
+
+    def garbage(self):
+        """Packs (except the active one) worth compacting"""
+        with self._lock_:
+            return [
+                pack for pack, size in sorted(self._sizes_.items())
+                if pack != self._active_ and size and self._live_[pack] <= size * (1 - self._garbage_ratio_)
+            ]
+
+    def retire(self, pack):
+        """Remove a pack without live blobs"""
+        with self._lock_:
+            reader = self._readers_.pop(pack, None)
+            if reader is not None:
+                self._retired_.append(reader)
+            del self._sizes_[pack]
+            del self._live_[pack]
+        os.remove(self._path_(pack))
+
+    def release_retired(self):
+        """Close the descriptors of packs removed before (no reads can be using them anymore)"""
+        with self._lock_:
+            retired, self._retired_ = self._retired_, []
+        for reader in retired:
+            os.close(reader)
+
+    @property
+    def stats(self):
+        """Packs, bytes on disk and bytes used by live blobs"""
+        with self._lock_:
+            return {"packs": len(self._sizes_), "active": self._active_,
+                    "bytes": sum(self._sizes_.values()), "live_bytes": sum(self._live_.values())}
+
+    def close(self):
+        """Close every file descriptor"""
+        self.release_retired()
+        with self._lock_:
+            for reader in self._readers_.values():
+                os.close(reader)
+            self._readers_ = {}
+            if self._writer_ is not None:
+                os.close(self._writer_)
+                self._writer_ = None
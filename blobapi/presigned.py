@@ -0,0 +1,96 @@
+"""Pre-signed URLs: time-limited access to one blob without an auth token.
+
+The owner of a blob mints a URL scoped to the blob ID, the HTTP method, an
+expiration time and, optionally, a byte range. Those limits travel in the
+query string with an HMAC-SHA256 signature of them:
+
+    /api/v1/blob/<blob ID>?expires=<epoch>&range=<first>-<last>&kid=<key id>&signature=<base64url>
+
+so the download route verifies the URL locally (any node sharing the keys can),
+without asking the auth service or checking the ACL. Keys use the same
+"kid:secret" format as the signed tokens: URLs are signed with the first key
+and verified with any of them, so keys can be rotated.
+"""
+
+import base64
+import binascii
+import hashlib
+import hmac
+import time
+from urllib.parse import urlencode
+
+from blobapi import DEFAULT_ENCODING
+from blobapi.errors import InvalidSignature
+
+SIGNED_METHODS = ('GET', 'HEAD')
+
+
+def parse_range(value):
+    """Parse "first-last" (inclusive byte positions) into a tuple"""
+    first, separator, last = value.partition('-')
+    try:
+        byte_range = (int(first), int(last)) if separator else None
+    except ValueError:
+        byte_range = None
+    if byte_range is None or byte_range[0] < 0 or byte_range[1] < byte_range[0]:
+        raise ValueError(f'Invalid byte range "{value}", use "first-last"')
+    return byte_range
+
+
+def _signing_input_(blob_id, method, expires, byte_range):
+    byte_range = f'{byte_range[0]}-{byte_range[1]}' if byte_range else ''
+    return f'{method}\n{blob_id}\n{expires}\n{byte_range}'.encode(DEFAULT_ENCODING)
+
+
+class URLSigner:
+    """Sign and verify the query string of pre-signed URLs"""
+
+    def __init__(self, keys, max_ttl=7 * 24 * 3600):
+        if not keys:
+            raise ValueError('At least one key is needed to sign URLs')
+        self._keys_ = dict(keys)
+        self._key_id_ = next(iter(self._keys_))
+        self._max_ttl_ = max_ttl
+
+    def _signature_(self, key_id, blob_id, method, expires, byte_range):
+        signing_input = _signing_input_(blob_id, method, expires, byte_range)
+        return hmac.new(self._keys_[key_id], signing_input, hashlib.sha256).digest()
+
+    def sign(self, blob_id, method='GET', ttl=3600, byte_range=None, now=None):
+        """Query string of a URL to "method" a blob (or a byte range of it) during "ttl" seconds, and its expiration"""
+        if method not in SIGNED_METHODS:
+            raise ValueError(f'Only {", ".join(SIGNED_METHODS)} URLs can be signed')
+        if not 0 < ttl <= self._max_ttl_:
+            raise ValueError(f'URLs must expire within {self._max_ttl_} seconds')
+        expires = int((time.time() if now is None else now) + ttl)
+        args = {'expires': expires}
+        if byte_range:
+            args['range'] = f'{byte_range[0]}-{byte_range[1]}'
+        args['kid'] = self._key_id_
+        signature = self._signature_(self._key_id_, blob_id, method, expires, byte_range)
+        args['signature'] = base64.urlsafe_b64encode(signature).rstrip(b'=').decode('ascii')
+        return urlencode(args), expires
+
+    def verify(self, blob_id, method, args, now=None):
+        """Check the query string of a pre-signed URL, returning its expiration and byte range (or None).
+
+        Raises InvalidSignature if it is not valid for this blob and method, or expired.
+        """
+        key_id = args.get('kid')
+        if key_id not in self._keys_:
+            raise InvalidSignature('unknown signing key')
+        try:
+            expires = int(args.get('expires', ''))
+            byte_range = parse_range(args['range']) if args.get('range') else None
+        except ValueError:
+            raise InvalidSignature('malformed URL') from None
+        signature = args.get('signature', '')
+        try:
+            signature = base64.urlsafe_b64decode(signature + '=' * (-len(signature) % 4))
+        except (ValueError, binascii.Error):
+            raise InvalidSignature('malformed signature') from None
+        if not hmac.compare_digest(self._signature_(key_id, blob_id, method, expires, byte_range), signature):
+            raise InvalidSignature('invalid signature')
+        if expires < (time.time() if now is None else now):
+            raise InvalidSignature('expired URL')
+        return expires, byte_range
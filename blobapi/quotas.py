@@ -0,0 +1,122 @@
+"""Storage usage and quotas of the users.
+
+The bytes (original size of the current contents) and the number of blobs of
+every owner are running totals, updated by BlobDB whenever a blob is created,
+updated or removed, and written in the header of the database snapshot, so
+usage is known in O(1) without walking the catalog or the storage. Previous
+versions of the blobs are not counted.
+
+Quotas are checked before storing (from Content-Length, if known), while
+storing (the upload is stopped as soon as it does not fit) and again when the
+blob is committed, so concurrent uploads cannot exceed them either.
+
+In a sharded deployment the blobs of a user are spread across the nodes: the
+node receiving an upload asks the others for their usage of the owner first
+(see Usage.set_remote), so the quota covers every node. Uploads running at
+once in different nodes are not checked against each other, so they can
+exceed it by their own size.
+"""
+
+from blobapi.errors import QuotaExceeded
+
+
+def parse_quotas(value):
+    """Parse "user:bytes:blobs,user:bytes:blobs" into a dict of (bytes, blobs), 0 being unlimited"""
+    quotas = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        user, _, limits = item.partition(':')
+        max_bytes, separator, max_blobs = limits.partition(':')
+        try:
+            quotas[user] = (int(max_bytes or 0), int(max_blobs or 0) if separator else 0)
+        except ValueError:
+            raise ValueError(f'Invalid quota "{item}", use "user:bytes:blobs"') from None
+        if not user:
+            raise ValueError(f'Invalid quota "{item}", use "user:bytes:blobs"')
+    return quotas
+
+
+class Usage:
+    """Bytes and blobs of every owner, and their quotas (not thread-safe: used under the lock of BlobDB)"""
+
+    def __init__(self, quota=(0, 0), quotas=None):
+        self._quota_ = quota
+        self._quotas_ = quotas or {}
+        # Owner -> [bytes, blobs]
+        self._usage_ = {}
+        # Owner -> (bytes, blobs) in the other nodes of a sharded deployment
+        self._remote_ = {}
+
+    def quota(self, user):
+        """(bytes, blobs) a user can store, 0 being unlimited"""
+        return self._quotas_.get(user, self._quota_)
+
+    def add(self, owner, size, blobs=0):
+        """Account "size" bytes and "blobs" blobs more (or less, if negative) of an owner"""
+        usage = self._usage_.setdefault(owner, [0, 0])
+        usage[0] += size or 0
+        usage[1] += blobs
+        if usage == [0, 0]:
+            del self._usage_[owner]
+
+    def set_remote(self, owner, size, blobs):
+        """Set the bytes and blobs of an owner in the other nodes, counted in their quota"""
+        self._remote_[owner] = (size, blobs)
+
+    def _used_(self, user):
+        """(bytes, blobs) of a user in every node"""
+        used_bytes, used_blobs = self._usage_.get(user, (0, 0))
+        remote_bytes, remote_blobs = self._remote_.get(user, (0, 0))
+        return used_bytes + remote_bytes, used_blobs + remote_blobs
+
+    def check(self, user, size, blobs=0):
+        """Raise QuotaExceeded if a user cannot store "size" bytes and "blobs" blobs more"""
+        max_bytes, max_blobs = self.quota(user)
+        used_bytes, used_blobs = self._used_(user)
+        if max_blobs and blobs > 0 and used_blobs + blobs > max_blobs:
+            raise QuotaExceeded(user, f'{max_blobs} blobs allowed')
+        if max_bytes and size > 0 and used_bytes + size > max_bytes:
+            raise QuotaExceeded(user, f'{max_bytes} bytes allowed, {used_bytes} used')
+
+    def remaining(self, user):
+        """Bytes a user can still store, None if unlimited"""
+        max_bytes = self.quota(user)[0]
+        return max(max_bytes - self._used_(user)[0], 0) if max_bytes else None
+
+    def get(self, user):
+        """Usage (in this node only) and quota of a user"""
+        used_bytes, used_blobs = self._usage_.get(user, (0, 0))
+        max_bytes, max_blobs = self.quota(user)
+        return {"user": user, "bytes": used_bytes, "blobs": used_blobs,
+                "quota": {"bytes": max_bytes or None, "blobs": max_blobs or None}}
+
+    def clear(self):
+        """Forget every total"""
+        self._usage_ = {}
+
+    def snapshot(self):
+        """Every total, in the stored format"""
+        return {owner: {"bytes": usage[0], "blobs": usage[1]} for owner, usage in self._usage_.items()}
+
+    def load(self, snapshot):
+        """Replace every total with the stored ones"""
+        self._usage_ = {owner: [usage["bytes"], usage["blobs"]] for owner, usage in snapshot.items()}
+
+
+class LimitedStream:
+    """Binary stream raising QuotaExceeded as soon as more than "limit" bytes are read from it"""
+
+    def __init__(self, stream, limit, user):
+        self._stream_ = stream
+        self._limit_ = limit
+        self._user_ = user
+        self._read_ = 0
+
+    def read(self, size=-1):
+        data = self._stream_.read(size)
+        self._read_ += len(data)
+        if self._read_ > self._limit_:
+            raise QuotaExceeded(self._user_, f'the blob does not fit in the {self._limit_} bytes left')
+        return data
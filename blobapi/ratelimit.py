@@ -0,0 +1,136 @@
+"""Admission control of the blob API.
+
+Every client (the authenticated user, or the address of anonymous requests) has
+two token buckets: one of requests per second and one of bytes per second. A
+request is rejected with "429 Too Many Requests" and a Retry-After header when a
+bucket does not have enough tokens. The bytes of an upload are taken when it is
+admitted (from its Content-Length) and the bytes of a download once its size is
+known, leaving the bucket in debt if needed: the next requests of the client
+wait until the debt is paid. Transfers bigger than the burst are admitted with a
+full bucket, so they are slowed down but never rejected forever.
+
+Besides, the whole service runs a limited number of uploads and downloads at
+once: transfers beyond that are rejected with "503 Service Unavailable" and a
+Retry-After header instead of queueing without limit.
+
+Checking a request is O(1): a dict lookup and some arithmetic under a lock. The
+least recently seen clients are forgotten when there are too many of them.
+"""
+
+import math
+import threading
+import time
+from collections import OrderedDict
+
+
+class RateLimiter:
+    """Token buckets of requests and bytes per second of every client (a rate of 0 disables a bucket)"""
+
+    def __init__(self, requests_per_second, request_burst, bytes_per_second, byte_burst, clients=10000,
+                 clock=time.monotonic):
+        self._rates_ = (float(requests_per_second), float(bytes_per_second))
+        self._bursts_ = (max(float(request_burst), 1.0), max(float(byte_burst), 1.0))
+        self._clients_ = clients
+        self._clock_ = clock
+        self._lock_ = threading.Lock()
+        # Client -> [requests, bytes, time of the last refill]
+        self._buckets_ = OrderedDict()
+        self._rejected_ = 0
+
+    @property
+    def enabled(self):
+        """Check if some limit is configured"""
+        return any(self._rates_)
+
+    def _bucket_(self, client, now):
+        """Refilled bucket of a client"""
+        bucket = self._buckets_.get(client)
+        if bucket is None:
+            bucket = self._buckets_[client] = [self._bursts_[0], self._bursts_[1], now]
+            if len(self._buckets_) > self._clients_:
+                self._buckets_.popitem(last=False)
+        else:
+            self._buckets_.move_to_end(client)
+            elapsed = now - bucket[2]
+            for index in (0, 1):
+                bucket[index] = min(self._bursts_[index], bucket[index] + elapsed * self._rates_[index])
+        bucket[2] = now
+        return bucket
+
+    def admit(self, client, size=0):
+        """Take a request and "size" bytes of a client, return 0 or the seconds to wait before retrying"""
+        with self._lock_:
+            bucket = self._bucket_(client, self._clock_())
+            wait = 0.0
+            for index, amount in ((0, 1.0), (1, float(size))):
+                if not self._rates_[index]:
+                    continue
+                needed = min(amount, self._bursts_[index])
+                if bucket[index] < needed:
+                    wait = max(wait, (needed - bucket[index]) / self._rates_[index])
+            if wait:
+                self._rejected_ += 1
+                return wait
+            bucket[0] -= 1.0
+            bucket[1] -= size
+            return 0.0
+
+    def charge(self, client, size):
+        """Take the bytes of a transfer whose size was unknown when it was admitted"""
+        if not self._rates_[1] or not size:
+            return
+        with self._lock_:
+            self._bucket_(client, self._clock_())[1] -= size
+
+    @property
+    def stats(self):
+        """Clients tracked and requests rejected"""
+        with self._lock_:
+            return {'clients': len(self._buckets_), 'rejected': self._rejected_}
+
+
+class TransferSlots:
+    """Uploads and downloads running at once in the whole service (a limit of 0 is unlimited)"""
+
+    def __init__(self, limit, retry_after=1):
+        self._limit_ = limit
+        self._retry_after_ = retry_after
+        self._lock_ = threading.Lock()
+        self._running_ = 0
+        self._rejected_ = 0
+
+    @property
+    def retry_after(self):
+        """Seconds a rejected client should wait"""
+        return self._retry_after_
+
+    def acquire(self):
+        """Take a slot without waiting, return False if there are none left"""
+        with self._lock_:
+            if self._limit_ and self._running_ >= self._limit_:
+                self._rejected_ += 1
+                return False
+            self._running_ += 1
+            return True
+
+    def release(self):
+        """Return a slot"""
+        with self._lock_:
+            self._running_ -= 1
+
+    @property
+    def stats(self):
+        """Transfers running and rejected"""
+        with self._lock_:
+            return {'running': self._running_, 'limit': self._limit_, 'rejected': self._rejected_}
+
+
+def retry_after(seconds):
+    """Value of a Retry-After header (whole seconds, at least 1)"""
+    return max(1, math.ceil(seconds))
+
+
+def transfer_endpoint(method):
+    """Mark a method of a resource as an upload or download, limited by TransferSlots"""
+    method.transfer = True
+    return method
@@ -0,0 +1,225 @@
+"""Compact in-memory representation of the blob metadata."""
+
+import sys
+from collections.abc import Set
+
+_EMPTY_ACL = frozenset()
+
+# ACLs up to this size are kept as a sorted tuple instead of a hash table
+SMALL_ACL = 8
+
+
+class SmallAcl(Set, tuple):
+    """Immutable set of a few names, stored as a sorted tuple.
+
+    A frozenset of one to four names takes 216 bytes, the tuple less than a third
+    of that. Most blobs are shared with a handful of users, where a linear search
+    is as fast as hashing. Compares and hashes like the frozenset with the same
+    names, so both kinds can be mixed.
+    """
+
+    __slots__ = ()
+
+    __contains__ = tuple.__contains__
+    __iter__ = tuple.__iter__
+    __len__ = tuple.__len__
+    __hash__ = Set._hash
+
+    @classmethod
+    def _from_iterable(cls, names):
+        return intern_users(names)
+
+    def __repr__(self):
+        return f'SmallAcl({list(self)!r})'
+
+
+def intern_users(users):
+    """Immutable set of (interned) user names"""
+    if not users:
+        return _EMPTY_ACL
+    names = set(map(sys.intern, users))
+    if not names:
+        # Share a single empty set among all the blobs without permissions
+        return _EMPTY_ACL
+    if len(names) <= SMALL_ACL:
+        return tuple.__new__(SmallAcl, sorted(names))
+    return frozenset(names)
+
+
+def _version_entry_(entry):
+    """Copy of a version entry, with its pack location (if any) as a tuple"""
+    entry = dict(entry)
+    if entry.get('location') is not None:
+        entry['location'] = tuple(entry['location'])
+    return entry
+
+
+class BlobRecord:
+    """Metadata of one blob.
+
+    Uses __slots__ instead of a per-record dict, interns owner and user names
+    (shared by many blobs) and keeps the ACL as an immutable set (see intern_users).
+    The fields most blobs leave at their default ("encoding", "version", "location"
+    and "versions") live in a dict created only when one of them is set. Item
+    access with the keys of the stored format ("URL", "public", "users",
+    "owner"...) is still supported.
+
+    Blobs stored inside a pack file (see blobapi.packs) have a "location": a tuple
+    (pack, offset, length). The URL still names the blob in the storage. "digest" is
+    the SHA-256 of the original contents, if known. "versions" are the previous
+    contents kept, oldest first (see BlobDB.listVersions).
+    """
+
+    __slots__ = ('url', 'public', 'users', 'owner', 'size', 'digest', '_extra_')
+
+    _KEYS_ = {'URL': 'url', 'public': 'public', 'users': 'users', 'owner': 'owner',
+              'size': 'size', 'encoding': 'encoding', 'version': 'version', 'location': 'location',
+              'digest': 'digest', 'versions': 'versions'}
+    _DEFAULTS_ = {'size': None, 'encoding': None, 'version': 1, 'location': None, 'digest': None, 'versions': None}
+
+    def __init__(self, url, public, users, owner, size=None, encoding=None, version=1, location=None,
+                 digest=None, versions=None):
+        self._extra_ = None
+        self.url = url
+        self.public = public
+        self.users = intern_users(users)
+        self.owner = sys.intern(owner) if owner is not None else None
+        self.size = size
+        self.encoding = encoding
+        self.version = version
+        self.location = tuple(location) if location is not None else None
+        self.digest = digest
+        self.versions = [_version_entry_(entry) for entry in versions] if versions else None
+
+    @classmethod
+    def from_dict(cls, blob_data):
+        """Build a record from its stored (dict) format"""
+        if isinstance(blob_data, cls):
+            return blob_data
+        return cls(blob_data['URL'], blob_data['public'], blob_data.get('users'), blob_data['owner'],
+                   blob_data.get('size'), blob_data.get('encoding'), blob_data.get('version', 1),
+                   blob_data.get('location'), blob_data.get('digest'), blob_data.get('versions'))
+
+    def to_dict(self):
+        """Stored format of the record"""
+        blob_data = {'URL': self.url, 'public': self.public, 'users': sorted(self.users), 'owner': self.owner}
+        for key, default in self._DEFAULTS_.items():
+            value = getattr(self, key)
+            if value != default:
+                if key == 'location':
+                    value = list(value)
+                elif key == 'versions':
+                    value = [dict(entry, location=list(entry['location'])) if 'location' in entry else dict(entry)
+                             for entry in value]
+                blob_data[key] = value
+        return blob_data
+
+    def _attribute_(self, key):
+        try:
+            return self._KEYS_[key]
+        except KeyError:
+            raise KeyError(key) from None
+
+    def __getitem__(self, key):
+        return getattr(self, self._attribute_(key))
+
+    def __setitem__(self, key, value):
+        attribute = self._attribute_(key)
+        if attribute == 'users':
+            value = intern_users(value)
+        setattr(self, attribute, value)
+
+    def __contains__(self, key):
+        if key not in self._KEYS_:
+            return False
+        # Optional fields are "missing" while they hold their default value
+        return key not in self._DEFAULTS_ or self[key] != self._DEFAULTS_[key]
+
+    def get(self, key, default=None):
+        """Dict-like access"""
+        return getattr(self, self._KEYS_[key]) if key in self._KEYS_ else default
+
+    def pop(self, key, default=None):
+        """Reset a field to its default value"""
+        value = self.get(key, default)
+        setattr(self, self._attribute_(key), self._DEFAULTS_.get(key))
+        return value
+
+    def __eq__(self, other):
+        if isinstance(other, dict):
+            other = BlobRecord.from_dict(other)
+        if not isinstance(other, BlobRecord):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        return f'BlobRecord({self.to_dict()!r})'
+
+
+def _extra_field_(name):
+    """Property for a rarely set field of BlobRecord, kept in its _extra_ dict"""
+    default = BlobRecord._DEFAULTS_[name]
+
+    def getter(record):
+        extra = record._extra_
+        return default if extra is None else extra.get(name, default)
+
+    def setter(record, value):
+        extra = record._extra_
+        if value is default or value == default:
+            if extra is not None:
+                extra.pop(name, None)
+                if not extra:
+                    record._extra_ = None
+        elif extra is None:
+            record._extra_ = {name: value}
+        else:
+            extra[name] = value
+
+    return property(getter, setter)
+
+
+for _name_ in ('encoding', 'version', 'location', 'versions'):
+    setattr(BlobRecord, _name_, _extra_field_(_name_))
+del _name_
+
+
+class AclPool:
+    """Registry of shared ACL sets.
+
+    Blobs with the same set of allowed users/groups share a single set.
+    The pool counts how many records use each set, so unused sets are dropped.
+    Sets used by a single record (most of them) are not counted.
+    """
+
+    def __init__(self):
+        self._acls_ = {}
+        self._counts_ = {}
+
+    def acquire(self, users):
+        """Get the shared set for the given users (one more record using it)"""
+        acl = intern_users(users)
+        if not acl:
+            return acl
+        shared = self._acls_.setdefault(acl, acl)
+        if shared is not acl:
+            self._counts_[shared] = self._counts_.get(shared, 1) + 1
+        return shared
+
+    def release(self, acl):
+        """One record less using the set"""
+        if self._acls_.get(acl) is not acl:
+            return
+        count = self._counts_.pop(acl, 1) - 1
+        if count > 1:
+            self._counts_[acl] = count
+        elif count <= 0:
+            del self._acls_[acl]
+
+    def clear(self):
+        """Forget every set"""
+        self._acls_.clear()
+        self._counts_.clear()
+
+    def __len__(self):
+        return len(self._acls_)
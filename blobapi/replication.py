@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""Asynchronous replication of a blob database to a replica.
+
+Every committed change (see BlobDB.subscribe) queues the key of the changed blob
+(or the groups). A background thread ships the queued keys in batches: for every
+key it sends the current state of the blob (record and stored contents) or its
+removal, so the replica converges even if changes are coalesced. Failed batches
+are retried with exponential backoff; the request path never waits for them.
+
+Replicas can be:
+
+- a directory ("dir:/path/to/replica"), holding its own database and storage,
+- another blob service ("http://host:port"), through its /api/v1/replica
+  endpoint, authenticated by the shared REPLICATION_KEY.
+
+Run this module to resynchronize a replica which fell behind:
+
+    python3 -m blobapi.replication blobs.json http://replica:3002 --key secret
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+
+from blobapi import REPLICATION_BATCH, REPLICATION_RETRY, REPLICATION_KEY, AUTH_TIMEOUT
+from blobapi.errors import ServiceError
+from blobapi.storage import LocalBackend
+
+# Pending key of the groups (blob IDs are strings)
+GROUPS = ('groups',)
+REPLICATION_HEADER = 'ReplicationKey'
+MAX_RETRY_DELAY = 60
+
+
+class DirectoryReplica:
+    """Replica in a local directory, with its own database file and storage"""
+
+    def __init__(self, directory):
+        from blobapi.blob_service import BlobDB  # pylint: disable=import-outside-toplevel
+        os.makedirs(directory, exist_ok=True)
+        self._db_ = BlobDB(os.path.join(directory, 'blobs.json'), storage=os.path.join(directory, 'storage'),
+                           compression='none', cache_size=0, group_commit=False, packs=False, scrub_interval=0,
+                           backend=LocalBackend())
+
+    def apply(self, operations):
+        """Apply a batch of operations with a single commit"""
+        for operation in operations:
+            if operation['op'] == 'put':
+                self._db_.applyReplica(operation['id'], operation['blob'], operation['data'], commit=False)
+            elif operation['op'] == 'delete':
+                self._db_.dropReplica(operation['id'], commit=False)
+            else:
+                self._db_.setGroups(operation['groups'], commit=False)
+        self._db_.flush()
+
+    def inventory(self):
+        """Version and digest of every blob in the replica"""
+        return self._db_.blobVersions()
+
+
+class ServiceReplica:
+    """Replica in another blob service"""
+
+    def __init__(self, url, key=REPLICATION_KEY, timeout=AUTH_TIMEOUT * 15):
+        self._url_ = url[:-1] if url.endswith('/') else url
+        self._headers_ = {REPLICATION_HEADER: key}
+        self._timeout_ = timeout
+        self._session_ = requests.Session()
+
+    def apply(self, operations):
+        """Send a batch of operations in a single request"""
+        manifest, files = [], {}
+        for index, operation in enumerate(operations):
+            operation = dict(operation)
+            if operation['op'] == 'put':
+                part = f'blob{index}'
+                files[part] = (os.path.basename(operation['blob']['URL']), operation.pop('data'))
+                operation['part'] = part
+            manifest.append(operation)
+        result = self._session_.post(f'{self._url_}/api/v1/replica', headers=self._headers_, timeout=self._timeout_,
+                                     data={'manifest': json.dumps(manifest)}, files=files or None)
+        if result.status_code != 204:
+            raise ServiceError(self._url_, f'replication failed with status {result.status_code}')
+
+    def inventory(self):
+        """Version and digest of every blob in the replica"""
+        result = self._session_.get(f'{self._url_}/api/v1/replica', headers=self._headers_, timeout=self._timeout_)
+        if result.status_code != 200:
+            raise ServiceError(self._url_, f'replica inventory failed with status {result.status_code}')
+        return result.json()
+
+
+def make_replica(spec, key=REPLICATION_KEY):
+    """Build a replica from "dir:<path>" or a service URL"""
+    if spec.startswith('dir:'):
+        return DirectoryReplica(spec[len('dir:'):])
+    if spec.startswith(('http://', 'https://')):
+        return ServiceReplica(spec, key)
+    raise ValueError(f'Invalid replica "{spec}", use "dir:<path>" or a service URL')
+
+
+class Replicator:
+    """Ship the changes of a BlobDB to a replica in the background"""
+
+    def __init__(self, blobdb, replica, batch_size=REPLICATION_BATCH, retry_delay=REPLICATION_RETRY):
+        self._blobdb_ = blobdb
+        self._replica_ = replica
+        self._batch_size_ = max(1, batch_size)
+        self._retry_delay_ = retry_delay
+        self._condition_ = threading.Condition()
+        # Key -> (time of the oldest change not shipped, sequence number of the last change)
+        self._pending_ = {}
+        self._sequence_ = 0
+        self._closed_ = False
+        self._stats_ = {"shipped": 0, "batches": 0, "failures": 0, "last_error": None}
+        blobdb.subscribe(self._changed_)
+        self._thread_ = threading.Thread(target=self._run_, name='replication', daemon=True)
+        self._thread_.start()
+
+    def _changed_(self, event, key, blob_data=None, before=None):  # pylint: disable=unused-argument
+        self.enqueue(GROUPS if event == 'group' else key)
+
+    def enqueue(self, key):
+        """Queue the current state of a blob (or GROUPS) to be shipped"""
+        with self._condition_:
+            self._sequence_ += 1
+            since = self._pending_[key][0] if key in self._pending_ else time.time()
+            self._pending_[key] = (since, self._sequence_)
+            self._condition_.notify_all()
+
+    @property
+    def lag(self):
+        """Seconds since the oldest change not shipped yet"""
+        with self._condition_:
+            if not self._pending_:
+                return 0.0
+            return round(time.time() - min(since for since, _ in self._pending_.values()), 3)
+
+    @property
+    def stats(self):
+        """Pending changes, lag and counters"""
+        lag = self.lag
+        with self._condition_:
+            return dict(self._stats_, pending=len(self._pending_), lag_seconds=lag)
+
+    def flush(self, timeout=None):
+        """Wait until every queued change is shipped, return False on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition_:
+            while self._pending_:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._condition_.wait(remaining)
+        return True
+
+    def resync(self):
+        """Queue every blob which differs between the database and the replica, and the groups"""
+        inventory = self._replica_.inventory()
+        queued = 0
+        for blob_id, version in self._blobdb_.blobVersions().items():
+            if inventory.pop(blob_id, None) != version:
+                self.enqueue(blob_id)
+                queued += 1
+        # Blobs only in the replica are removed from it
+        for blob_id in inventory:
+            self.enqueue(blob_id)
+            queued += 1
+        self.enqueue(GROUPS)
+        return queued
+
+    def close(self, timeout=10):
+        """Try to ship the pending changes and stop"""
+        self.flush(timeout)
+        with self._condition_:
+            self._closed_ = True
+            self._condition_.notify_all()
+        self._thread_.join(timeout)
+
+    def _operation_(self, key):
+        if key == GROUPS:
+            return {'op': 'groups', 'groups': self._blobdb_.groupsSnapshot()}
+        blob_data = self._blobdb_.storedBlob(key)
+        if blob_data is None:
+            return {'op': 'delete', 'id': key}
+        blob = blob_data.to_dict()
+        blob.pop('location', None)
+        return {'op': 'put', 'id': key, 'blob': blob, 'data': self._blobdb_.openStored(blob_data)}
+
+    def _ship_(self, batch):
+        operations = []
+        try:
+            for key in batch:
+                try:
+                    operations.append(self._operation_(key))
+                except FileNotFoundError:
+                    # Removed meanwhile: a newer change is queued
+                    continue
+            self._replica_.apply(operations)
+        finally:
+            for operation in operations:
+                if 'data' in operation:
+                    operation['data'].close()
+
+    def _run_(self):
+        failures = 0
+        while True:
+            with self._condition_:
+                while not self._pending_ and not self._closed_:
+                    self._condition_.wait()
+                if self._closed_:
+                    return
+                batch = dict(list(self._pending_.items())[:self._batch_size_])
+            try:
+                self._ship_(batch)
+            except Exception as error:  # pylint: disable=broad-except
+                failures += 1
+                logging.warning(f'Replication failed ({failures} times in a row): {error}')
+                with self._condition_:
+                    self._stats_["failures"] += 1
+                    self._stats_["last_error"] = str(error)
+                    self._condition_.wait(min(self._retry_delay_ * 2 ** (failures - 1), MAX_RETRY_DELAY))
+                continue
+            failures = 0
+            with self._condition_:
+                for key, (_, sequence) in batch.items():
+                    # Changed again while shipping: ship it again
+                    if self._pending_.get(key, (None, None))[1] == sequence:
+                        del self._pending_[key]
+                self._stats_["shipped"] += len(batch)
+                self._stats_["batches"] += 1
+                self._condition_.notify_all()
+
+
+def parse_commandline():
+    """Parse command line"""
+    parser = argparse.ArgumentParser(description='Resynchronize a replica of a blob database')
+    parser.add_argument('db_file', help='Database file of the blob service')
+    parser.add_argument('replica', help='Replica: "dir:<path>" or the URL of a blob service')
+    parser.add_argument('--storage', default=None, help='Storage directory of the blob service')
+    parser.add_argument('--key', default=REPLICATION_KEY, help='Replication key of the replica service')
+    return parser.parse_args()
+
+
+def main():
+    """Entry point"""
+    options = parse_commandline()
+    from blobapi.blob_service import BlobDB  # pylint: disable=import-outside-toplevel
+    kwargs = {'storage': options.storage} if options.storage else {}
+    blobdb = BlobDB(options.db_file, group_commit=False, scrub_interval=0, compact_interval=0, **kwargs)
+    replicator = Replicator(blobdb, make_replica(options.replica, options.key))
+    queued = replicator.resync()
+    print(f'{queued} blobs to resynchronize')
+    replicator.flush()
+    replicator.close()
+    print(f'Replica is up to date ({replicator.stats["shipped"]} changes shipped)')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
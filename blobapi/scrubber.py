@@ -0,0 +1,156 @@
+"""Background consistency checker of the blob storage.
+
+removeBlob() and updateBlob() change the files and the database in two steps, so
+a crash in between can leave files no blob points to (orphans) or blobs whose
+file is gone (missing). The scrubber walks the catalog and FILE_STORAGE in small
+increments, paced by a budget of files and bytes per second so it never competes
+with the foreground traffic, and:
+
+- flags the blobs whose file is missing,
+- optionally re-reads the blobs and checks their SHA-256 digest (corrupt blobs),
+- quarantines (moves to FILE_STORAGE/.quarantine), deletes or just reports the
+  orphan files older than a grace period.
+"""
+
+import hashlib
+import logging
+import os
+import threading
+import time
+
+from blobapi import FILE_STORAGE, SCRUB_FILES_PER_SECOND, SCRUB_BYTES_PER_SECOND, SCRUB_VERIFY, SCRUB_ORPHANS, \
+    SCRUB_GRACE
+
+QUARANTINE_DIRECTORY = '.quarantine'
+ORPHAN_ACTIONS = ['quarantine', 'delete', 'report']
+
+
+class _Budget:
+    """Pace an activity to a rate (units per second, 0 for no limit)"""
+
+    def __init__(self, rate, stop):
+        self._rate_ = rate
+        self._stop_ = stop
+        self._next_ = time.monotonic()
+
+    def spend(self, amount):
+        """Wait until the amount fits in the budget"""
+        if self._rate_ <= 0 or amount <= 0:
+            return
+        now = time.monotonic()
+        self._next_ = max(self._next_, now) + amount / self._rate_
+        if self._next_ > now:
+            self._stop_.wait(self._next_ - now)
+
+
+class Scrubber:
+    """Incremental checker of a BlobDB against its storage directory"""
+
+    def __init__(self, blobdb, storage=FILE_STORAGE, files_per_second=SCRUB_FILES_PER_SECOND,
+                 bytes_per_second=SCRUB_BYTES_PER_SECOND, verify=SCRUB_VERIFY, orphans=SCRUB_ORPHANS,
+                 grace=SCRUB_GRACE):
+        if orphans not in ORPHAN_ACTIONS:
+            raise ValueError(f'Orphan action {orphans} is not supported. Supported: {ORPHAN_ACTIONS}')
+        self._blobdb_ = blobdb
+        self._storage_ = storage
+        self._verify_ = verify
+        self._orphans_ = orphans
+        self._grace_ = grace
+        self._stop_ = threading.Event()
+        self._files_ = _Budget(files_per_second, self._stop_)
+        self._bytes_ = _Budget(bytes_per_second, self._stop_)
+        self._stats_ = {"passes": 0, "checked": 0, "bytes_verified": 0, "orphans": 0,
+                        "missing": [], "corrupt": [], "last_pass_seconds": None}
+
+    @property
+    def stats(self):
+        """Counters of the scrubber, and the blobs flagged in the last pass"""
+        return dict(self._stats_, missing=list(self._stats_["missing"]), corrupt=list(self._stats_["corrupt"]))
+
+    def stop(self):
+        """Stop the pass in progress (and any later one)"""
+        self._stop_.set()
+
+    def run(self, interval):
+        """Run a pass every "interval" seconds until stopped"""
+        while not self._stop_.wait(interval):
+            try:
+                self.scrub()
+            except Exception as error:  # pylint: disable=broad-except
+                logging.error(f'Storage scrubbing failed: {error}')
+
+    def scrub(self):
+        """Run a whole pass over the catalog and the storage directory"""
+        start = time.monotonic()
+        missing, corrupt = [], []
+        for blob_id in self._blobdb_.blobIds():
+            if self._stop_.is_set():
+                return
+            self._files_.spend(1)
+            problem = self._check_blob_(blob_id)
+            if problem == 'missing':
+                missing.append(blob_id)
+            elif problem == 'corrupt':
+                corrupt.append(blob_id)
+            self._stats_["checked"] += 1
+        self._collect_orphans_()
+        if missing or corrupt:
+            logging.warning(f'Scrubber found {len(missing)} missing and {len(corrupt)} corrupt blobs')
+        self._stats_.update(missing=missing, corrupt=corrupt, passes=self._stats_["passes"] + 1,
+                            last_pass_seconds=round(time.monotonic() - start, 3))
+
+    def _check_blob_(self, blob_id):
+        """None if the blob is fine (or gone), "missing" or "corrupt" otherwise"""
+        blob_data = self._blobdb_.storedBlob(blob_id)
+        if blob_data is None:
+            return None
+        backend = self._blobdb_.backend
+        if blob_data.location is None and not backend.exists(blob_data.url):
+            # The blob may have been updated or removed meanwhile
+            current = self._blobdb_.storedBlob(blob_id)
+            if current is not None and current.version == blob_data.version and not backend.exists(current.url):
+                return 'missing'
+            return None
+        if not self._verify_ or not blob_data.digest:
+            return None
+        digest = hashlib.sha256()
+        try:
+            for chunk in self._blobdb_.readBlob(blob_data):
+                self._bytes_.spend(len(chunk))
+                self._stats_["bytes_verified"] += len(chunk)
+                digest.update(chunk)
+        except (OSError, ValueError) as error:
+            logging.warning(f'Cannot verify blob {blob_id}: {error}')
+            digest = None
+        if digest is not None and digest.hexdigest() == blob_data.digest:
+            return None
+        current = self._blobdb_.storedBlob(blob_id)
+        return 'corrupt' if current is not None and current.version == blob_data.version else None
+
+    def _collect_orphans_(self):
+        """Quarantine, delete or report files which no blob points to"""
+        backend = self._blobdb_.backend
+        known = self._blobdb_.storedUrls()
+        deadline = time.time() - self._grace_
+        for url, modified in backend.list(self._storage_):
+            if self._stop_.is_set():
+                return
+            self._files_.spend(1)
+            # Files being written (or written just before the last look at the catalog) are not orphans
+            if url in known or modified > deadline:
+                continue
+            if url in self._blobdb_.storedUrls():
+                continue
+            self._stats_["orphans"] += 1
+            self._handle_orphan_(backend, url)
+
+    def _handle_orphan_(self, backend, url):
+        if self._orphans_ == 'delete':
+            logging.warning(f'Deleting orphan file "{url}"')
+            backend.remove(url)
+        elif self._orphans_ == 'quarantine':
+            target = os.path.join(self._storage_, QUARANTINE_DIRECTORY, f'{os.path.basename(url)}.{int(time.time())}')
+            logging.warning(f'Moving orphan file "{url}" to "{target}"')
+            backend.rename(url, target)
+        else:
+            logging.warning(f'Orphan file "{url}"')
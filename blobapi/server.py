@@ -1,22 +1,47 @@
 """API blobapi"""
 
 import argparse
+import hmac
 import json
 import logging
 import os
 import sys
+import tarfile
+import time
+from io import BytesIO
+from urllib.parse import quote
 
-from flask import Flask, make_response, request, send_file
+from flask import Flask, Response, g, make_response, redirect, request, send_file, stream_with_context
 from flask_restx import Api, Resource, fields, reqparse
 from werkzeug.datastructures.file_storage import FileStorage
-from werkzeug.exceptions import Conflict, Unauthorized, BadRequest, NotFound
+from werkzeug.wsgi import ClosingIterator
+from werkzeug.exceptions import Conflict, Unauthorized, BadRequest, NotFound, ServiceUnavailable, TooManyRequests, \
+    RequestEntityTooLarge, Forbidden, RequestedRangeNotSatisfiable
 
 from blobapi.blob_service import BlobDB
-from blobapi.errors import ObjectAlreadyExists, ObjectNotFound, UnauthorizedBlob, StatusNotValid, UserNotExists
+from blobapi.errors import ObjectAlreadyExists, ObjectNotFound, UnauthorizedBlob, StatusNotValid, UserNotExists, \
+    ServiceError, QuotaExceeded, InvalidSignature
 from blobapi.auth_client import Client
-from blobapi import FILE_STORAGE, BLOB_DB, BLOB_SERVICE_ADDRESS, BLOB_SERVICE_PORT, HTTPS_DEBUG_MODE, AUTH_PORT, AUTH_ADDRESS
+from blobapi.signed_tokens import SignedTokenClient, TokenVerifier, parse_keys
+from blobapi.compression import GZIP, read_chunks, read_range, decompress
+from blobapi.replication import REPLICATION_HEADER, Replicator, make_replica
+from blobapi.archive import ARCHIVE_FORMATS, TAR, read_tar, stream_archive
+from blobapi.changes import ChangeFeed
+from blobapi.presigned import SIGNED_METHODS, URLSigner, parse_range
+from blobapi.ratelimit import RateLimiter, TransferSlots, retry_after, transfer_endpoint
+from blobapi.sharding import LOCAL_HEADER, HashRing, Shards
+from blobapi import FILE_STORAGE, BLOB_DB, BLOB_SERVICE_ADDRESS, BLOB_SERVICE_PORT, HTTPS_DEBUG_MODE, AUTH_PORT, \
+    AUTH_ADDRESS, SIGNED_TOKEN_KEYS, SIGNED_TOKEN_LEEWAY, REPLICA, REPLICATION_KEY, SHARD_NODES, SHARD_SELF, \
+    SHARD_VNODES, CHANGE_FEED_MAX_WAIT, CHANGE_FEED_HEARTBEAT, RATE_LIMIT_REQUESTS, RATE_LIMIT_REQUEST_BURST, \
+    RATE_LIMIT_BYTES, RATE_LIMIT_BYTE_BURST, RATE_LIMIT_CLIENTS, MAX_TRANSFERS, PRESIGN_KEYS, PRESIGN_TTL, \
+    PRESIGN_MAX_TTL
 
-def routeApp(app, client: Client, BLOBDB):
+# Bytes of a multipart upload besides the file (boundaries and part headers), not counted in the quota
+FORM_OVERHEAD = 8 * 1024
+
+
+def routeApp(app, client: Client, BLOBDB, replicator=None, shards=None, feed=None, limiter=None, slots=None,
+             signer=None):
     """Route API REST to web"""
 
     authorizations = {"AuthToken": {"type": "apiKey", "in": "header", "name": "AuthToken"}}
@@ -32,6 +57,10 @@ def routeApp(app, client: Client, BLOBDB):
     status_blob = api.namespace('api/v1/status', description='Status of the service')
     ns_blob = api.namespace('api/v1/blob', description='Blob operations')
     ns_blobs = api.namespace('api/v1/blobs', description='Blobs operations')
+    ns_changes = api.namespace('api/v1/changes', description='Feed of the changes of the blobs')
+    ns_usage = api.namespace('api/v1/usage', description='Storage used by the user and their quota')
+    ns_group = api.namespace('api/v1/group', description='Groups of users, usable in ACLs as "group:<name>"')
+    ns_replica = api.namespace('api/v1/replica', description='Replication from another blob service')
 
     file_upload_parser = reqparse.RequestParser()
     file_upload_parser.add_argument('file',
@@ -47,7 +76,8 @@ def routeApp(app, client: Client, BLOBDB):
     })
 
     blobs_model = api.model('Blobs', {
-        'blobs': fields.List(fields.String, description="A list of blob IDs")
+        'blobs': fields.List(fields.String, description="A list of blob IDs"),
+        'next': fields.Integer(description="Sequence number of the change feed to follow the listing from")
     })
 
     hash_arg_parser = api.parser()
@@ -67,18 +97,275 @@ def routeApp(app, client: Client, BLOBDB):
         'allowed_users': fields.List(fields.String, required=True, description='Allowed Users')
     })
 
+    copy_model = api.model('Copy', {
+        'name': fields.String(required=False, description='Name of the copy'),
+        'owner': fields.String(required=False, description='Owner of the copy')
+    })
+
+    export_model = api.model('Export', {
+        'blobs': fields.List(fields.String, required=False, description='Blob IDs (default: every blob listed)'),
+        'owner': fields.String(required=False, description='Without IDs, only the blobs of this owner'),
+        'pattern': fields.String(required=False, description='Without IDs, only the blobs whose name matches this '
+                                                             'glob pattern'),
+        'format': fields.String(required=False, description=f'Archive format: {", ".join(ARCHIVE_FORMATS)} '
+                                                            f'(default {TAR})')
+    })
+
+    imported_model = api.model('Imported', {
+        'name': fields.String(description='Name of the member in the archive'),
+        'blobId': fields.String(description='Blob ID, if created'),
+        'URL': fields.String(description='Blob URL, if created'),
+        'error': fields.String(description='Why the member was not imported')
+    })
+
+    import_model = api.model('Import', {
+        'blobs': fields.List(fields.Nested(imported_model, skip_none=True),
+                             description='Every member of the archive, in order'),
+        'error': fields.String(description='Why the archive could not be read to the end, if so')
+    })
+
+    presign_model = api.model('Presign', {
+        'method': fields.String(required=False, description=f'Method allowed: {", ".join(SIGNED_METHODS)} '
+                                                            f'(default GET)'),
+        'expires_in': fields.Integer(required=False, description=f'Seconds the URL is valid (default {PRESIGN_TTL})'),
+        'range': fields.String(required=False, description='Only these bytes of the blob, "first-last"')
+    })
+
+    presigned_model = api.model('Presigned', {
+        'URL': fields.String(description='Pre-signed URL, usable without AuthToken'),
+        'expires': fields.Integer(description='Expiration time (seconds since epoch)')
+    })
+
+    signed_url_parser = api.parser()
+    signed_url_parser.add_argument('expires', type=int, required=False, location='args',
+                                   help='Expiration of a pre-signed URL')
+    signed_url_parser.add_argument('range', type=str, required=False, location='args',
+                                   help='Bytes of a pre-signed URL')
+    signed_url_parser.add_argument('kid', type=str, required=False, location='args',
+                                   help='Signing key of a pre-signed URL')
+    signed_url_parser.add_argument('signature', type=str, required=False, location='args',
+                                   help='Signature of a pre-signed URL')
+
+    quota_model = api.model('Quota', {
+        'bytes': fields.Integer(description='Bytes allowed (null if unlimited)'),
+        'blobs': fields.Integer(description='Blobs allowed (null if unlimited)')
+    })
+
+    usage_model = api.model('Usage', {
+        'user': fields.String(description='User'),
+        'bytes': fields.Integer(description='Bytes stored (current contents of the blobs owned)'),
+        'blobs': fields.Integer(description='Blobs owned'),
+        'quota': fields.Nested(quota_model)
+    })
+
+    group_model = api.model('Group', {
+        'name': fields.String(required=False, description='Group name'),
+        'owner': fields.String(required=False, description='Group owner'),
+        'members': fields.List(fields.String, required=True, description='Users in the group')
+    })
+
+    def token_owner(auth_token):
+        """Owner of a token, asked only once per request"""
+        known = g.get('token_owner')
+        if known is None or known[0] != auth_token:
+            try:
+                known = (auth_token, client.token_owner(auth_token), None)
+            except (UserNotExists, ServiceError) as e:
+                known = (auth_token, None, e)
+            g.token_owner = known
+        if known[2] is not None:
+            raise known[2]
+        return known[1]
+
     def get_client_token():
         auth_token = request.headers.get('AuthToken')
         if auth_token:
             try:
-                return client.token_owner(auth_token)
+                return token_owner(auth_token)
             except UserNotExists:
                 raise Unauthorized('Invalid AuthToken')
+            except ServiceError as e:
+                raise ServiceUnavailable(description=str(e))
         raise Unauthorized(description="Missing token")
 
     def get_optional_client_token():
         auth_token = request.headers.get('AuthToken')
-        return client.token_owner(auth_token) if auth_token else None
+        try:
+            return token_owner(auth_token) if auth_token else None
+        except ServiceError as e:
+            raise ServiceUnavailable(description=str(e))
+
+    def gather_usage(owner, quota_only=True):
+        """Count the bytes and blobs of an owner in the other shards in their quota, and return them
+
+        They are only asked for owners with a quota, unless "quota_only" is False.
+        """
+        if not shards or request.headers.get(LOCAL_HEADER):
+            return 0, 0
+        if quota_only and not any(BLOBDB.usage(owner)['quota'].values()):
+            return 0, 0
+        try:
+            answers = shards.gather(f'/api/v1/usage?owner={quote(owner)}', {REPLICATION_HEADER: REPLICATION_KEY})
+        except (ServiceError, OSError) as e:
+            raise ServiceUnavailable(description=f'Cannot get the usage of every shard: {e}')
+        size, blobs = sum(answer['bytes'] for answer in answers), sum(answer['blobs'] for answer in answers)
+        BLOBDB.setRemoteUsage(owner, size, blobs)
+        return size, blobs
+
+    def check_upload_quota(user, blob_id=None):
+        """Reject an upload not fitting in the quota of the user before reading it, if its length is known"""
+        gather_usage(user)
+        if request.content_length:
+            try:
+                BLOBDB.checkQuota(user, request.content_length - FORM_OVERHEAD, blob_id)
+            except QuotaExceeded as e:
+                raise RequestEntityTooLarge(description=str(e))
+
+    def send_blob(blob_info):
+        """Send blob contents, compressed only if stored compressed and accepted by the client"""
+        filename = os.path.basename(blob_info['URL'])
+        data = blob_info.get('data')
+        # Blobs in a remote backend have no local path: they are streamed from it
+        file_path = blob_info.get('path', blob_info['URL'])
+        if file_path is not None:
+            file_path = os.path.join(os.getcwd(), file_path)
+        send_compressed = blob_info.get('encoding') == GZIP and request.accept_encodings[GZIP]
+        if data is not None:
+            if blob_info.get('encoding') == GZIP and not send_compressed:
+                data = decompress(data, GZIP)
+            response = send_file(BytesIO(data), as_attachment=True, download_name=filename)
+        elif file_path is not None and (blob_info.get('encoding') != GZIP or send_compressed):
+            response = send_file(file_path, as_attachment=True, download_name=filename)
+        else:
+            stored = blob_info['open']() if file_path is None else file_path
+            if blob_info.get('encoding') == GZIP and not send_compressed:
+                chunks = read_chunks(stored, GZIP)
+            else:
+                chunks = read_chunks(stored)
+            response = Response(stream_with_context(chunks), mimetype='application/octet-stream')
+            response.headers.set('Content-Disposition', 'attachment', filename=filename)
+            if blob_info.get('size') is not None and not send_compressed:
+                response.content_length = blob_info['size']
+        if send_compressed:
+            response.headers['Content-Encoding'] = GZIP
+        if blob_info.get('encoding') == GZIP:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def send_blob_range(blob_info, first, last):
+        """Send the original contents of a blob from "first" to "last" (inclusive), as a 206 Partial Content"""
+        size = blob_info.get('size')
+        if size is not None:
+            if first >= size:
+                raise RequestedRangeNotSatisfiable(length=size)
+            last = min(last, size - 1)
+        data = blob_info.get('data')
+        stored = BytesIO(data) if data is not None else blob_info['open']()
+        chunks = read_range(stored, first, last, blob_info.get('encoding'))
+        response = Response(stream_with_context(chunks), mimetype='application/octet-stream')
+        response.headers.set('Content-Disposition', 'attachment', filename=os.path.basename(blob_info['URL']))
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {first}-{last}/{"*" if size is None else size}'
+        if size is not None:
+            response.content_length = last - first + 1
+        return response
+
+    def verify_presigned(blob_id):
+        """Expiration and byte range of a pre-signed URL. A URL signed for GET also allows HEAD"""
+        try:
+            return signer.verify(blob_id, request.method, request.args)
+        except InvalidSignature:
+            if request.method != 'HEAD':
+                raise
+            return signer.verify(blob_id, 'GET', request.args)
+
+    def send_presigned(blob_id):
+        """Send a blob (or the bytes signed) to anyone with a valid pre-signed URL, without any auth lookup"""
+        if signer is None:
+            raise Forbidden(description='Pre-signed URLs are not enabled')
+        try:
+            expires, byte_range = verify_presigned(blob_id)
+            blob_info = BLOBDB.openBlob(blob_id, authorized=True)
+        except InvalidSignature as e:
+            raise Forbidden(description=str(e))
+        except ObjectNotFound as e:
+            raise NotFound(description=str(e))
+        response = send_blob(blob_info) if byte_range is None else send_blob_range(blob_info, *byte_range)
+        # The URL itself is the credential: shared caches can keep the answer until it expires
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = max(expires - int(time.time()), 0)
+        response.expires = expires
+        return response
+
+    @app.before_request
+    def redirect_to_shard():
+        """Send the requests for a blob to the node owning it, and those for a group to the node keeping groups"""
+        view_args = request.view_args or {}
+        blob_id = view_args.get('blobId')
+        if shards and blob_id and not shards.owns(blob_id):
+            return redirect(f'{shards.owner(blob_id)}{request.full_path.rstrip("?")}', code=307)
+        if shards and 'groupName' in view_args and not shards.owns_groups:
+            return redirect(f'{shards.groups_node}{request.full_path.rstrip("?")}', code=307)
+        return None
+
+    def share_groups():
+        """Send every group to the other shards, which check the ACLs of their blobs with them"""
+        if not shards:
+            return
+        try:
+            shards.broadcast([{'op': 'groups', 'groups': BLOBDB.groupsSnapshot()}], REPLICATION_KEY)
+        except (ServiceError, OSError) as e:
+            # Repeating the request sends the groups again
+            raise ServiceUnavailable(description=f'Group not sent to every shard: {e}')
+
+    def rate_client():
+        """Key of the rate limits: the user, or the address of anonymous (or invalid) requests"""
+        auth_token = request.headers.get('AuthToken')
+        if auth_token:
+            try:
+                return f'user:{token_owner(auth_token)}'
+            except (UserNotExists, ServiceError):
+                pass
+        return f'address:{request.remote_addr}'
+
+    def is_transfer():
+        """Check if the request uploads or downloads blob contents"""
+        view = app.view_functions.get(request.endpoint)
+        handler = getattr(getattr(view, 'view_class', None), request.method.lower(), None)
+        return getattr(handler, 'transfer', False)
+
+    @app.before_request
+    def admit_request():
+        """Reject the requests beyond the rate limits of the client, or the transfers beyond the global limit"""
+        if limiter and limiter.enabled:
+            g.rate_client = rate_client()
+            wait = limiter.admit(g.rate_client, request.content_length or 0)
+            if wait:
+                raise TooManyRequests(description='Rate limit exceeded', retry_after=retry_after(wait))
+        if slots and is_transfer():
+            if not slots.acquire():
+                raise ServiceUnavailable(description='Too many transfers running', retry_after=slots.retry_after)
+            g.transfer_slot = True
+
+    @app.after_request
+    def account_response(response):
+        """Take the bytes sent from the rate limits, keep the transfer slot until the response is sent"""
+        if limiter and 'rate_client' in g:
+            limiter.charge(g.rate_client, response.content_length or 0)
+        if g.pop('transfer_slot', False):
+            if response.direct_passthrough:
+                # Files are passed to the server as they are, so the callbacks of the response are not called
+                response.response = ClosingIterator(response.response, slots.release)
+            else:
+                response.call_on_close(slots.release)
+        return response
+
+    @app.teardown_request
+    def release_transfer(_error=None):
+        """Return the transfer slot of failed requests"""
+        if g.pop('transfer_slot', False):
+            slots.release()
 
     # Status endpoints
     @status_blob.route('/')
@@ -87,6 +374,29 @@ def routeApp(app, client: Client, BLOBDB):
         def get(self):
             return make_response('Service running', 200)
 
+    @status_blob.route('/metrics')
+    class StatusMetrics(Resource):
+        @api.doc('get internal metrics of the service')
+        def get(self):
+            """Get cache and catalog counters"""
+            metrics = BLOBDB.metrics()
+            if replicator:
+                metrics['replication'] = replicator.stats
+            if limiter:
+                metrics['rate_limits'] = limiter.stats
+            if slots:
+                metrics['transfers'] = slots.stats
+            return metrics
+
+    @status_blob.route('/ring')
+    class StatusRing(Resource):
+        @api.doc('get the ring of shards')
+        def get(self):
+            """Get the nodes and the points of the consistent-hash ring (empty if not sharded)"""
+            if not shards:
+                return {'nodes': [], 'points': []}
+            return {'nodes': shards.ring.nodes, 'points': shards.ring.points}
+
     @ns_blobs.route('')
     class BlobsCollection(Resource):
         @api.doc('get_blobs')
@@ -94,17 +404,154 @@ def routeApp(app, client: Client, BLOBDB):
         @api.marshal_list_with(blobs_model)
         def get(self):
             """Get all blobs"""
-            return BLOBDB.getBlobs(user=get_optional_client_token())
+            user = get_optional_client_token()
+            # Taken before listing: replaying a change already listed is harmless, missing one is not
+            sequence = feed.last if feed and not shards else None
+            blobs = BLOBDB.getBlobs(user=user)
+            blobs['next'] = sequence
+            if shards and not request.headers.get(LOCAL_HEADER):
+                # Scatter the request to every shard and merge the answers
+                headers = {'AuthToken': request.headers['AuthToken']} if 'AuthToken' in request.headers else {}
+                try:
+                    for answer in shards.gather('/api/v1/blobs', headers):
+                        blobs['blobs'].extend(answer['blobs'])
+                except (ServiceError, OSError) as e:
+                    raise ServiceUnavailable(description=f'Cannot list every shard: {e}')
+            return blobs
+
+    @ns_blobs.route('/export')
+    class BlobsExport(Resource):
+        @transfer_endpoint
+        @api.doc('export_blobs')
+        @api.expect(export_model)
+        @api.response(200, 'Archive with the blobs readable by the user and a manifest')
+        @api.response(400, 'Bad Request')
+        def post(self):
+            """Download many blobs as a single archive, generated while it is sent"""
+            try:
+                args = json.loads(request.get_data() or '{}')
+            except json.JSONDecodeError:
+                raise BadRequest(description="Invalid JSON")
+            if not isinstance(args, dict) or not all(
+                    isinstance(args.get(field), (str, type(None))) for field in ('owner', 'pattern', 'format')):
+                raise BadRequest(description="Owner, pattern and format must be strings")
+            blob_ids = args.get('blobs')
+            if blob_ids is not None and (not isinstance(blob_ids, list) or
+                                         not all(isinstance(blob_id, str) for blob_id in blob_ids)):
+                raise BadRequest(description="Blobs must be a list of blob IDs")
+            archive_format = args.get('format') or TAR
+            if archive_format not in ARCHIVE_FORMATS:
+                raise BadRequest(description=f'Unknown format, use one of {", ".join(ARCHIVE_FORMATS)}')
+            if shards and not request.headers.get(LOCAL_HEADER) and (
+                    blob_ids is None or not all(shards.owns(blob_id) for blob_id in blob_ids)):
+                # The archive would miss the blobs of the other shards
+                raise BadRequest(description=f'Blobs are sharded: export the blobs of each node of the ring '
+                                             f'(/api/v1/status/ring) from it, with the {LOCAL_HEADER} header')
+            user = get_optional_client_token()
+            if blob_ids is None:
+                blob_ids = BLOBDB.getBlobs(user, owner=args.get('owner'), pattern=args.get('pattern'))['blobs']
+            rate_client = g.get('rate_client')
+
+            def chunks():
+                for chunk in stream_archive(BLOBDB.exportBlobs(blob_ids, user), archive_format):
+                    if limiter and rate_client:
+                        # The size of the archive is not known in advance: bytes are taken as they are sent
+                        limiter.charge(rate_client, len(chunk))
+                    yield chunk
+            response = Response(stream_with_context(chunks()), mimetype=ARCHIVE_FORMATS[archive_format])
+            response.headers.set('Content-Disposition', 'attachment', filename=f'blobs.{archive_format}')
+            return response
+
+    @ns_blobs.route('/import')
+    class BlobsImport(Resource):
+        @transfer_endpoint
+        @api.doc('import_blobs')
+        @api.marshal_with(import_model, skip_none=True)
+        @api.response(401, 'Unauthorized')
+        @api.response(413, 'Quota exceeded')
+        def post(self):
+            """Create a blob for every file of a tar archive (optionally compressed), stored while it is received"""
+            user = get_client_token()
+            gather_usage(user)
+            try:
+                # The size of the members is not known in advance: only reject users who cannot add any blob
+                BLOBDB.checkQuota(user, 0)
+            except QuotaExceeded as e:
+                raise RequestEntityTooLarge(description=str(e))
+            results = {'blobs': []}
+            try:
+                for result in BLOBDB.importBlobs(read_tar(request.stream), user):
+                    results['blobs'].append(result)
+            except (tarfile.TarError, EOFError) as e:
+                # The members read until then are kept
+                results['error'] = f'Invalid archive: {e}'
+            return results
+
+    changes_parser = api.parser()
+    changes_parser.add_argument('since', type=int, required=False, location='args',
+                                help='Last sequence number seen (Last-Event-ID for event streams)')
+    changes_parser.add_argument('wait', type=float, required=False, location='args',
+                                help=f'Seconds to wait for changes (up to {CHANGE_FEED_MAX_WAIT})')
+
+    def stream_changes(since, user):
+        """Server-sent events with the changes after a sequence number, with heartbeats while idle"""
+        while True:
+            result = feed.read(since, user, timeout=CHANGE_FEED_HEARTBEAT)
+            since = result['next']
+            if result['reset']:
+                yield f'id: {since}\nevent: reset\ndata: {json.dumps({"next": since})}\n\n'
+            for change in result['changes']:
+                yield f'id: {change["sequence"]}\nevent: {change["event"]}\n' \
+                      f'data: {json.dumps({"blobId": change["blobId"]})}\n\n'
+            if not result['changes'] and not result['reset']:
+                yield ': heartbeat\n\n'
+
+    # Change feed endpoint
+    @ns_changes.route('')
+    class ChangesCollection(Resource):
+        @api.doc('get_changes')
+        @api.expect(changes_parser)
+        @api.response(400, 'Bad Request')
+        @api.response(401, 'Unauthorized')
+        def get(self):
+            """Changes of the visible blobs after a sequence number (long poll, or server-sent events)"""
+            if not feed:
+                raise NotFound(description='The change feed is not enabled')
+            since = request.args.get('since', request.headers.get('Last-Event-ID'))
+            wait = request.args.get('wait', CHANGE_FEED_MAX_WAIT)
+            try:
+                since = int(since) if since is not None else None
+                wait = min(max(float(wait), 0.0), CHANGE_FEED_MAX_WAIT)
+            except ValueError:
+                raise BadRequest(description='Invalid since or wait')
+            user = get_optional_client_token()
+            events = request.accept_mimetypes.best_match(['application/json', 'text/event-stream']) == \
+                'text/event-stream'
+            if since is None:
+                since = feed.last
+                if not events:
+                    # Only the sequence number to follow the feed from now on
+                    return {'changes': [], 'next': since, 'reset': False}
+            if events:
+                response = Response(stream_changes(since, user), mimetype='text/event-stream')
+                response.headers['Cache-Control'] = 'no-cache'
+                response.headers['X-Accel-Buffering'] = 'no'
+                return response
+            return feed.read(since, user, timeout=wait)
 
     # Blob endpoints
     @ns_blob.route('')
     class BlobCollection(Resource):
+        @transfer_endpoint
         @api.doc('create_blob')
         @api.expect(file_upload_parser)
         @api.marshal_with(blob_model, code=201)
         @api.response(409, 'Conflict')
         @api.response(401, 'Unauthorized')
+        @api.response(413, 'Quota exceeded')
         def post(self):
+            user = get_client_token()
+            check_upload_quota(user)
 
             # Check if the post request has the file part
             if 'file' not in request.files:
@@ -114,21 +561,27 @@ def routeApp(app, client: Client, BLOBDB):
             if file.filename == '':
                 return BadRequest('No selected file')
             try:
-                blob_id, url = BLOBDB.newBlob(file, get_client_token())
+                blob_id, url = BLOBDB.newBlob(file, user)
             except ObjectAlreadyExists as e:
                 raise Conflict(description=str(e))
+            except QuotaExceeded as e:
+                raise RequestEntityTooLarge(description=str(e))
             return {'blobId': blob_id, 'URL': url}, 201
 
     @ns_blob.route('/<string:blobId>')
     @api.doc(params={'blobId': 'A Blob ID'})
     class BlobItem(Resource):
+        @transfer_endpoint
         @api.doc('get_blob')
+        @api.expect(signed_url_parser)
         @api.response(404, 'Not Found')
         @api.response(401, 'Unauthorized')
+        @api.response(403, 'Invalid pre-signed URL')
         def get(self, blobId):
+            if 'signature' in request.args:
+                return send_presigned(blobId)
             try:
-                file_path = BLOBDB.getBlob(blobId, get_optional_client_token())
-                return send_file(os.path.join(os.getcwd(), file_path), as_attachment=True)
+                return send_blob(BLOBDB.openBlob(blobId, get_optional_client_token()))
             except ObjectNotFound as e:
                 raise NotFound(description=str(e))
             except UnauthorizedBlob as e:
@@ -147,14 +600,18 @@ def routeApp(app, client: Client, BLOBDB):
             except UnauthorizedBlob as e:
                 raise Unauthorized(description=str(e))
 
+        @transfer_endpoint
         @api.doc('update_blob')
         @api.response(204, 'Updated')
         @api.response(404, 'Not Found')
         @api.marshal_with(blob_model, code=204)
         @api.response(409, 'Conflict')
         @api.response(401, 'Unauthorized')
+        @api.response(413, 'Quota exceeded')
         @api.expect(file_upload_parser)
         def put(self, blobId):
+            user = get_client_token()
+            check_upload_quota(user, blobId)
             if 'file' not in request.files:
                 return BadRequest('No  file')
 
@@ -162,15 +619,54 @@ def routeApp(app, client: Client, BLOBDB):
             if file.filename == '':
                 return BadRequest('No selected file')
             try:
-                BLOBDB.updateBlob(blobId, file, get_client_token())
+                BLOBDB.updateBlob(blobId, file, user)
             except ObjectAlreadyExists as e:
                 raise Conflict(description=str(e))
+            except QuotaExceeded as e:
+                raise RequestEntityTooLarge(description=str(e))
             except UnauthorizedBlob as e:
                 raise Unauthorized(description=str(e))
             except ObjectNotFound as e:
                 raise NotFound(description=str(e))
             return '', 204
 
+    @ns_blob.route('/<string:blobId>/presign')
+    @api.doc(params={'blobId': 'A Blob ID'})
+    class BlobPresign(Resource):
+
+        @api.doc('presign_blob')
+        @api.expect(presign_model)
+        @api.marshal_with(presigned_model)
+        @api.response(400, 'Bad Request')
+        @api.response(401, 'Unauthorized')
+        @api.response(403, 'Pre-signed URLs not enabled')
+        @api.response(404, 'Not Found')
+        def post(self, blobId):
+            """Create a time-limited URL to download a blob without AuthToken (only the owner)"""
+            if signer is None:
+                raise Forbidden(description='Pre-signed URLs are not enabled')
+            try:
+                args = json.loads(request.get_data() or '{}')
+            except json.JSONDecodeError:
+                raise BadRequest(description="Invalid JSON")
+            if not isinstance(args, dict) or not all(
+                    isinstance(args.get(field), (str, type(None))) for field in ('method', 'range')):
+                raise BadRequest(description="Method and range must be strings")
+            ttl = args.get('expires_in', PRESIGN_TTL)
+            if not isinstance(ttl, int) or isinstance(ttl, bool):
+                raise BadRequest(description="Expires_in must be a number of seconds")
+            try:
+                BLOBDB.checkOwner(blobId, get_client_token())
+                byte_range = parse_range(args['range']) if args.get('range') else None
+                query, expires = signer.sign(blobId, (args.get('method') or 'GET').upper(), ttl, byte_range)
+            except ValueError as e:
+                raise BadRequest(description=str(e))
+            except ObjectNotFound as e:
+                raise NotFound(description=str(e))
+            except UnauthorizedBlob as e:
+                raise Unauthorized(description=str(e))
+            return {'URL': f'{request.host_url}api/v1/blob/{blobId}?{query}', 'expires': expires}
+
     @ns_blob.route('/<string:blobId>/hash')
     @api.doc(params={'blobId': 'A Blob ID'})
     class BlobHash(Resource):
@@ -191,6 +687,101 @@ def routeApp(app, client: Client, BLOBDB):
             except UnauthorizedBlob as e:
                 raise Unauthorized(description=str(e))
 
+    @ns_blob.route('/<string:blobId>/copy')
+    @api.doc(params={'blobId': 'A Blob ID'})
+    class BlobCopy(Resource):
+
+        @api.doc('copy_blob')
+        @api.expect(copy_model)
+        @api.marshal_with(blob_model, code=201)
+        @api.response(400, 'Bad Request')
+        @api.response(401, 'Unauthorized')
+        @api.response(404, 'Not Found')
+        @api.response(409, 'Conflict')
+        @api.response(413, 'Quota exceeded')
+        def post(self, blobId):
+            """Create a new blob with the contents of another one, without uploading them"""
+            try:
+                args = json.loads(request.get_data() or '{}')
+            except json.JSONDecodeError:
+                raise BadRequest(description="Invalid JSON")
+            if not isinstance(args, dict) or not all(
+                    isinstance(args.get(field), (str, type(None))) for field in ('name', 'owner')):
+                raise BadRequest(description="Name and owner must be strings")
+            user = get_client_token()
+            gather_usage(args.get('owner') or user)
+            try:
+                blob_id, url = BLOBDB.copyBlob(blobId, user, args.get('name'), args.get('owner'))
+            except ValueError as e:
+                raise BadRequest(description=str(e))
+            except ObjectNotFound as e:
+                raise NotFound(description=str(e))
+            except UnauthorizedBlob as e:
+                raise Unauthorized(description=str(e))
+            except ObjectAlreadyExists as e:
+                raise Conflict(description=str(e))
+            except QuotaExceeded as e:
+                raise RequestEntityTooLarge(description=str(e))
+            return {'blobId': blob_id, 'URL': url}, 201
+
+    @ns_blob.route('/<string:blobId>/versions')
+    @api.doc(params={'blobId': 'A Blob ID'})
+    class BlobVersions(Resource):
+
+        @api.doc('list_blob_versions')
+        @api.response(401, 'Unauthorized')
+        @api.response(404, 'Not Found')
+        def get(self, blobId):
+            """Current version of a blob and the previous versions kept"""
+            try:
+                return BLOBDB.listVersions(blobId, get_optional_client_token())
+            except ObjectNotFound as e:
+                raise NotFound(description=str(e))
+            except UnauthorizedBlob as e:
+                raise Unauthorized(description=str(e))
+
+    @ns_blob.route('/<string:blobId>/versions/<int:version>/restore')
+    @api.doc(params={'blobId': 'A Blob ID', 'version': 'A previous version'})
+    class BlobVersionRestore(Resource):
+
+        @api.doc('restore_blob_version')
+        @api.response(204, 'Version restored')
+        @api.response(401, 'Unauthorized')
+        @api.response(404, 'Blob or version Not Found')
+        @api.response(413, 'Quota exceeded')
+        def post(self, blobId, version):
+            """Make a previous version the current contents of a blob"""
+            user = get_client_token()
+            gather_usage(user)
+            try:
+                BLOBDB.restoreVersion(blobId, version, user)
+                return '', 204
+            except ObjectNotFound as e:
+                raise NotFound(description=str(e))
+            except UnauthorizedBlob as e:
+                raise Unauthorized(description=str(e))
+            except QuotaExceeded as e:
+                raise RequestEntityTooLarge(description=str(e))
+
+    # Usage endpoint
+    @ns_usage.route('')
+    class UsageItem(Resource):
+        @api.doc('get_usage')
+        @api.marshal_with(usage_model)
+        @api.response(401, 'Unauthorized')
+        def get(self):
+            """Bytes and blobs stored by the user, and their quota"""
+            if 'owner' in request.args:
+                # Usage in this node, asked by another shard
+                check_replication_key()
+                return BLOBDB.usage(request.args['owner'])
+            user = get_client_token()
+            size, blobs = gather_usage(user, quota_only=False)
+            usage = BLOBDB.usage(user)
+            usage['bytes'] += size
+            usage['blobs'] += blobs
+            return usage
+
     @ns_blob.route('/<string:blobId>/visibility')
     @api.doc(params={'blobId': 'A Blob ID'})
     class BlobVisibility(Resource):
@@ -306,19 +897,140 @@ def routeApp(app, client: Client, BLOBDB):
                 raise NotFound(description=str(e))
             return '', 204
 
+    @ns_group.route('/<string:groupName>')
+    @api.doc(params={'groupName': 'A Group name'})
+    class GroupItem(Resource):
+
+        @api.doc('set_group')
+        @api.expect(group_model)
+        @api.response(204, 'Group Updated')
+        @api.response(401, 'Unauthorized')
+        @api.response(400, 'Bad Request')
+        def put(self, groupName):
+            """Create a group or replace its members"""
+            data = request.json
+            members = data.get('members') if isinstance(data, dict) else None
+            if not isinstance(members, list) or not all(isinstance(item, str) for item in members):
+                raise BadRequest(description="Members must be a list of strings")
+            try:
+                BLOBDB.setGroup(groupName, members, get_client_token())
+            except UnauthorizedBlob as e:
+                raise Unauthorized(description=str(e))
+            share_groups()
+            return '', 204
+
+        @api.doc('get_group')
+        @api.response(404, 'Group Not Found')
+        @api.response(401, 'Unauthorized')
+        @api.marshal_with(group_model, 200)
+        def get(self, groupName):
+            """Get the members of a group"""
+            try:
+                return BLOBDB.getGroup(groupName, get_client_token())
+            except ObjectNotFound as e:
+                raise NotFound(description=str(e))
+            except UnauthorizedBlob as e:
+                raise Unauthorized(description=str(e))
+
+        @api.doc('remove_group')
+        @api.response(204, 'Group removed')
+        @api.response(404, 'Group Not Found')
+        @api.response(401, 'Unauthorized')
+        def delete(self, groupName):
+            """Remove a group"""
+            try:
+                BLOBDB.removeGroup(groupName, get_client_token())
+            except ObjectNotFound as e:
+                raise NotFound(description=str(e))
+            except UnauthorizedBlob as e:
+                raise Unauthorized(description=str(e))
+            share_groups()
+            return '', 204
+
+    def check_replication_key():
+        if not REPLICATION_KEY:
+            raise NotFound(description='Replication is not enabled')
+        if not hmac.compare_digest(request.headers.get(REPLICATION_HEADER, ''), REPLICATION_KEY):
+            raise Unauthorized(description='Invalid replication key')
+
+    @ns_replica.route('')
+    class ReplicaCollection(Resource):
+
+        @api.doc('apply_replica_batch')
+        @api.response(204, 'Batch applied')
+        @api.response(400, 'Bad Request')
+        @api.response(401, 'Unauthorized')
+        def post(self):
+            """Apply a batch of replicated changes"""
+            check_replication_key()
+            try:
+                manifest = json.loads(request.form['manifest'])
+                for operation in manifest:
+                    if operation['op'] == 'put':
+                        BLOBDB.applyReplica(operation['id'], operation['blob'],
+                                            request.files[operation['part']].stream, commit=False)
+                    elif operation['op'] == 'delete':
+                        BLOBDB.dropReplica(operation['id'], commit=False)
+                    elif operation['op'] == 'groups':
+                        BLOBDB.setGroups(operation['groups'], commit=False)
+                    else:
+                        raise BadRequest(description=f'Unknown operation {operation["op"]}')
+            except (KeyError, TypeError, ValueError) as e:
+                raise BadRequest(description=f'Invalid replication batch: {e}')
+            finally:
+                BLOBDB.flush()
+            return '', 204
+
+        @api.doc('get_replica_inventory')
+        @api.response(401, 'Unauthorized')
+        def get(self):
+            """Get version and digest of every blob"""
+            check_replication_key()
+            return BLOBDB.blobVersions()
+
+    @ns_replica.route('/<string:replicaId>')
+    @api.doc(params={'replicaId': 'A Blob ID'})
+    class ReplicaItem(Resource):
+
+        @api.doc('get_replica_blob')
+        @api.response(404, 'Not Found')
+        @api.response(401, 'Unauthorized')
+        def get(self, replicaId):
+            """Get the stored contents of a blob, with its record in the X-Blob-Record header"""
+            check_replication_key()
+            blob_data = BLOBDB.storedBlob(replicaId)
+            if blob_data is None:
+                raise NotFound(description=f'Blob {replicaId} not found')
+            blob = blob_data.to_dict()
+            blob.pop('location', None)
+            response = Response(stream_with_context(read_chunks(BLOBDB.openStored(blob_data))),
+                                mimetype='application/octet-stream')
+            response.headers['X-Blob-Record'] = json.dumps(blob)
+            return response
+
 
 class ApiService:
     """Wrap all components used by the service"""
 
     def __init__(self, db_file, client, host=BLOB_SERVICE_ADDRESS, port=BLOB_SERVICE_PORT):
-        self._blobdb_ = BlobDB(db_file)
+        # Blobs are spread across the nodes of SHARD_NODES, if configured
+        self._shards_ = Shards(HashRing(SHARD_NODES, SHARD_VNODES), SHARD_SELF) if SHARD_NODES else None
+        # Load the catalog in background, so the service answers while loading big databases
+        self._blobdb_ = BlobDB(db_file, background_load=True, owns=self._shards_.owns if self._shards_ else None)
         self._client_ = client
         self._host_ = host
         self._port_ = port
 
         self._app_ = Flask(__name__.split('.', maxsplit=1)[0])
         self._app_.config['ERROR_404_HELP'] = False
-        routeApp(self._app_, self._client_, self._blobdb_)
+        # Changes are shipped to the replica in background
+        self._replicator_ = Replicator(self._blobdb_, make_replica(REPLICA)) if REPLICA else None
+        limiter = RateLimiter(RATE_LIMIT_REQUESTS, RATE_LIMIT_REQUEST_BURST, RATE_LIMIT_BYTES, RATE_LIMIT_BYTE_BURST,
+                              RATE_LIMIT_CLIENTS) if RATE_LIMIT_REQUESTS or RATE_LIMIT_BYTES else None
+        slots = TransferSlots(MAX_TRANSFERS) if MAX_TRANSFERS else None
+        signer = URLSigner(parse_keys(PRESIGN_KEYS), PRESIGN_MAX_TTL) if PRESIGN_KEYS else None
+        routeApp(self._app_, self._client_, self._blobdb_, self._replicator_, self._shards_,
+                 ChangeFeed(self._blobdb_), limiter, slots, signer)
 
     @property
     def base_uri(self):
@@ -358,6 +1070,9 @@ def main():
     """Entry point for the API"""
     user_options = parse_commandline()
     client = Client(f'http://{AUTH_ADDRESS}:{AUTH_PORT}', check_service=True)
+    if SIGNED_TOKEN_KEYS:
+        # Signed tokens are verified locally, opaque tokens are still checked by the auth service
+        client = SignedTokenClient(client, TokenVerifier(parse_keys(SIGNED_TOKEN_KEYS), SIGNED_TOKEN_LEEWAY))
     service = ApiService(user_options.db_file, client, user_options.address, user_options.port)
     try:
         print(f'Starting service on: {service.base_uri}')
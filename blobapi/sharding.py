@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Sharding of the blobs across several blob service nodes.
+
+Blob IDs are mapped to nodes with a consistent-hash ring: every node owns
+SHARD_VNODES points of the ring (virtual nodes) and a blob belongs to the node of
+the first point after the hash of its ID. Adding a node only moves the blobs of
+the ring ranges it takes over.
+
+- New blobs get an ID owned by the node which receives the upload.
+- Requests for a blob sent to another node are redirected (307) to its owner.
+- Listing the blobs gathers the lists of every node.
+- Exports only include the blobs of one node: they are rejected unless every blob
+  is owned by the node, or the request selects its blobs only (LOCAL_HEADER).
+- Groups of users live in the first node of the ring: requests for a group are
+  redirected to it, and it sends every group to the other nodes after a change,
+  so ACLs granting a group work on every node.
+- GET /api/v1/status/ring publishes the ring, so clients can talk to the owner directly.
+
+Run this module to move the blobs to their new owners after adding nodes:
+
+    python3 -m blobapi.sharding --key secret --nodes http://a:3002 http://b:3002 --add http://c:3002
+"""
+
+import argparse
+import bisect
+import hashlib
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from blobapi import SHARD_VNODES, REPLICATION_KEY, DEFAULT_ENCODING
+from blobapi.errors import ServiceError
+from blobapi.replication import REPLICATION_HEADER, ServiceReplica
+
+# Header of the requests between nodes which must not be forwarded again
+LOCAL_HEADER = 'X-Shard-Local'
+TIMEOUT = 30
+
+
+def ring_hash(key):
+    """Position of a key in the ring"""
+    return int.from_bytes(hashlib.md5(key.encode(DEFAULT_ENCODING)).digest()[:8], 'big')
+
+
+class HashRing:
+    """Consistent-hash ring of nodes with virtual nodes"""
+
+    def __init__(self, nodes, vnodes=SHARD_VNODES):
+        self.nodes = sorted({node.rstrip('/') for node in nodes})
+        if not self.nodes:
+            raise ValueError('A ring needs at least one node')
+        points = sorted((ring_hash(f'{node}#{index}'), node) for node in self.nodes for index in range(vnodes))
+        self._hashes_ = [point for point, _ in points]
+        self._owners_ = [node for _, node in points]
+
+    def node_for(self, key):
+        """Node owning a key"""
+        return self._owners_[bisect.bisect(self._hashes_, ring_hash(key)) % len(self._hashes_)]
+
+    @property
+    def points(self):
+        """Every point of the ring as [hash, node]"""
+        return [[point, node] for point, node in zip(self._hashes_, self._owners_)]
+
+
+class Shards:
+    """The ring as seen by one of its nodes"""
+
+    def __init__(self, ring, self_url):
+        self.ring = ring
+        self.self_url = self_url.rstrip('/')
+        if self.self_url not in ring.nodes:
+            raise ValueError(f'Node {self.self_url} is not in the ring {ring.nodes}')
+
+    def owns(self, blob_id):
+        """Check if a blob belongs to this node"""
+        return self.ring.node_for(blob_id) == self.self_url
+
+    def owner(self, blob_id):
+        """Base URL of the node owning a blob"""
+        return self.ring.node_for(blob_id)
+
+    @property
+    def groups_node(self):
+        """Base URL of the node keeping the groups of users"""
+        return self.ring.nodes[0]
+
+    @property
+    def owns_groups(self):
+        """Check if this node keeps the groups of users"""
+        return self.groups_node == self.self_url
+
+    def broadcast(self, operations, key=REPLICATION_KEY):
+        """Apply replication operations (without blob contents) in every other node concurrently"""
+        others = [node for node in self.ring.nodes if node != self.self_url]
+        if not others:
+            return
+        with ThreadPoolExecutor(max_workers=len(others)) as executor:
+            list(executor.map(lambda node: ServiceReplica(node, key).apply(operations), others))
+
+    def gather(self, path, headers):
+        """GET a path from every other node concurrently and return their JSON answers"""
+        others = [node for node in self.ring.nodes if node != self.self_url]
+        headers = dict(headers, **{LOCAL_HEADER: '1'})
+
+        def fetch(node):
+            result = requests.get(f'{node}{path}', headers=headers, timeout=TIMEOUT)
+            if result.status_code != 200:
+                raise ServiceError(node, f'GET {path} failed with status {result.status_code}')
+            return result.json()
+        if not others:
+            return []
+        with ThreadPoolExecutor(max_workers=len(others)) as executor:
+            return list(executor.map(fetch, others))
+
+
+def _inventory_(node, key):
+    result = requests.get(f'{node}/api/v1/replica', headers={REPLICATION_HEADER: key}, timeout=TIMEOUT)
+    if result.status_code != 200:
+        raise ServiceError(node, f'inventory failed with status {result.status_code}')
+    return result.json()
+
+
+def rebalance(old_nodes, new_nodes, key=REPLICATION_KEY, vnodes=SHARD_VNODES):
+    """Move every blob of the old nodes which belongs to another node in the new ring
+
+    Blobs are copied to the new owner (through its replica endpoint) before being removed from the old one.
+    Returns the number of blobs moved.
+    """
+    ring = HashRing(new_nodes, vnodes)
+    moved = 0
+    for node in HashRing(old_nodes, vnodes).nodes:
+        source = ServiceReplica(node, key)
+        for blob_id in _inventory_(node, key):
+            owner = ring.node_for(blob_id)
+            if owner == node:
+                continue
+            result = requests.get(f'{node}/api/v1/replica/{blob_id}', headers={REPLICATION_HEADER: key},
+                                  timeout=TIMEOUT, stream=True)
+            if result.status_code != 200:
+                raise ServiceError(node, f'reading blob {blob_id} failed with status {result.status_code}')
+            blob = json.loads(result.headers['X-Blob-Record'])
+            result.raw.decode_content = False
+            ServiceReplica(owner, key).apply([{'op': 'put', 'id': blob_id, 'blob': blob, 'data': result.raw}])
+            source.apply([{'op': 'delete', 'id': blob_id}])
+            moved += 1
+    return moved
+
+
+def parse_commandline():
+    """Parse command line"""
+    parser = argparse.ArgumentParser(description='Move the blobs to their owners after adding nodes to the ring')
+    parser.add_argument('--nodes', nargs='+', required=True, help='Nodes of the current ring')
+    parser.add_argument('--add', nargs='+', required=True, help='Nodes added to the ring')
+    parser.add_argument('--vnodes', type=int, default=SHARD_VNODES, help='Virtual nodes (default: %(default)s)')
+    parser.add_argument('--key', default=REPLICATION_KEY, help='Replication key of the nodes')
+    return parser.parse_args()
+
+
+def main():
+    """Entry point"""
+    options = parse_commandline()
+    moved = rebalance(options.nodes, options.nodes + options.add, options.key, options.vnodes)
+    print(f'{moved} blobs moved')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
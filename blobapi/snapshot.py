@@ -0,0 +1,74 @@
+"""On-disk snapshot format of the blob database.
+
+The snapshot is still a valid JSON object (so it can be read with json.load),
+but it is written with one blob per line, preceded by a header line:
+
+    {"__blobdb__": {"format": 1, "blobs": 2},
+    "<blob id>": {...},
+    "<blob id>": {...}
+    }
+
+This allows loading it incrementally, in batches of lines, without reading the
+whole file in memory first. Files written by json.dump (the previous format)
+are still accepted.
+"""
+
+import json
+import os
+
+from blobapi import DEFAULT_ENCODING
+
+SNAPSHOT_KEY = '__blobdb__'
+SNAPSHOT_FORMAT = 1
+_HEADER_PREFIX = ('{' + json.dumps(SNAPSHOT_KEY) + ':').encode(DEFAULT_ENCODING)
+_COMPACT = (',', ':')
+
+
+def _stored_(value):
+    """Stored format of in-memory records (see blobapi.records)"""
+    return value.to_dict()
+
+
+def write_snapshot(contents, blobs, header=None):
+    """Write the catalog (and extra header fields) to an open text file"""
+    header = dict(header or {}, format=SNAPSHOT_FORMAT, blobs=len(blobs))
+    encode = json.JSONEncoder(separators=_COMPACT, default=_stored_).encode
+    contents.write(f'{_HEADER_PREFIX.decode(DEFAULT_ENCODING)} {encode(header)}')
+    for blob_id, blob_data in blobs.items():
+        contents.write(f',\n{encode(blob_id)}: {encode(blob_data)}')
+    contents.write('\n}\n')
+
+
+def _decode_lines_(lines):
+    """Decode a batch of '"id": {...},' lines"""
+    batch = b''.join(lines).rstrip().rstrip(b',')
+    return json.loads(b'{' + batch + b'}') if batch else {}
+
+
+def read_snapshot(db_file, batch_size=10000):
+    """Iterate over a database file.
+
+    Yields the header (a dict, empty for files in the previous format) and then
+    tuples (blobs, bytes_read) with batches of blobs until the whole file is read.
+    """
+    with open(db_file, 'rb') as contents:
+        first_line = contents.readline()
+        if not first_line.startswith(_HEADER_PREFIX):
+            # Previous format: a plain JSON document
+            contents.seek(0)
+            yield {}
+            yield json.load(contents), os.path.getsize(db_file)
+            return
+        header = json.loads(first_line.rstrip().rstrip(b',') + b'}')[SNAPSHOT_KEY]
+        yield header
+        bytes_read = len(first_line)
+        lines = []
+        for line in contents:
+            bytes_read += len(line)
+            if line.startswith(b'}'):
+                break
+            lines.append(line)
+            if len(lines) >= batch_size:
+                yield _decode_lines_(lines), bytes_read
+                lines = []
+        yield _decode_lines_(lines), bytes_read
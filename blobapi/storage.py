@@ -0,0 +1,305 @@
+"""Storage backends for the blob contents.
+
+BlobDB stores the contents of every blob (except those in pack files) as an
+object named after its URL ("storage/<filename>") in a backend:
+
+- LocalBackend: files in the local filesystem (the URL is the file path).
+- S3Backend: objects in a bucket of an S3-compatible service, so the storage can
+  scale independently of the API nodes. Uploads bigger than a part use multipart
+  uploads, downloads are streamed, and connections are pooled.
+
+Every backend implements the same methods: writer(), open(), path(), size(),
+exists(), remove(), list(), rename() and copy().
+
+Objects are never modified in place (writers replace them), so copies can share
+their data: see LocalBackend.copy().
+"""
+
+import datetime
+import errno
+import fcntl
+import hashlib
+import hmac
+import os
+import shutil
+import uuid
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import quote, urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from blobapi import STORAGE_BACKEND, S3_ENDPOINT, S3_BUCKET, S3_ACCESS_KEY, S3_SECRET_KEY, S3_REGION, S3_PART_SIZE, \
+    S3_POOL_SIZE
+from blobapi.errors import ServiceError
+
+SUPPORTED_BACKENDS = ['local', 's3']
+# ioctl to clone a file sharing its blocks (Linux: btrfs, XFS, ...)
+_FICLONE = 0x40049409
+
+
+class _AtomicFile:
+    """Binary file written to a temporary name and renamed when closed without errors"""
+
+    def __init__(self, path):
+        self._path_ = path
+        directory, name = os.path.split(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # secure_filename() never produces names starting with a dot
+        self._temp_ = os.path.join(directory, f'.{name}.{uuid.uuid4().hex}.part')
+        self._file_ = open(self._temp_, 'wb')
+
+    def write(self, data):
+        """Write data"""
+        return self._file_.write(data)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        self._file_.close()
+        if error_type is None:
+            os.replace(self._temp_, self._path_)
+        else:
+            os.remove(self._temp_)
+
+
+class LocalBackend:
+    """Blobs stored as files in the local filesystem"""
+
+    def writer(self, key):
+        """Context manager with a binary file to write an object; replaced atomically when closed"""
+        return _AtomicFile(key)
+
+    def open(self, key):
+        """Binary file to read an object"""
+        return open(key, 'rb')
+
+    def path(self, key):
+        """Local path of an object"""
+        return key
+
+    def size(self, key):
+        """Size of an object"""
+        return os.path.getsize(key)
+
+    def exists(self, key):
+        """Check if an object exists"""
+        return os.path.isfile(key)
+
+    def remove(self, key):
+        """Remove an object"""
+        os.remove(key)
+
+    def list(self, prefix):
+        """Iterate over (key, modification time) of the objects directly under a prefix (a directory)"""
+        if not os.path.isdir(prefix):
+            return
+        with os.scandir(prefix) as entries:
+            for entry in entries:
+                if entry.is_file(follow_symlinks=False):
+                    yield os.path.join(prefix, entry.name), entry.stat().st_mtime
+
+    def rename(self, key, new_key):
+        """Move an object to another key"""
+        os.makedirs(os.path.dirname(new_key) or '.', exist_ok=True)
+        shutil.move(key, new_key)
+
+    def copy(self, key, new_key):
+        """Copy an object sharing its data if possible: reflink, hardlink or (as last resort) a real copy.
+
+        Hardlinks are safe because files are never written in place: updating either copy
+        replaces its file. Returns the method used.
+        """
+        os.makedirs(os.path.dirname(new_key) or '.', exist_ok=True)
+        try:
+            with open(key, 'rb') as source, open(new_key, 'xb') as target:
+                fcntl.ioctl(target.fileno(), _FICLONE, source.fileno())
+            return 'reflink'
+        except OSError as error:
+            if error.errno == errno.EEXIST:
+                raise
+            if os.path.exists(new_key):
+                os.remove(new_key)
+        try:
+            os.link(key, new_key)
+            return 'hardlink'
+        except OSError as error:
+            if error.errno == errno.EEXIST:
+                raise
+        shutil.copyfile(key, new_key)
+        return 'copy'
+
+
+def _xml_(content):
+    """Parse an XML document dropping the namespaces of the tags"""
+    root = ElementTree.fromstring(content)
+    for element in root.iter():
+        element.tag = element.tag.rsplit('}', 1)[-1]
+    return root
+
+
+class _MultipartWriter:
+    """Upload an object in parts of "part_size" bytes (a single PUT if it fits in one part)"""
+
+    def __init__(self, backend, key, part_size):
+        self._backend_ = backend
+        self._key_ = key
+        self._part_size_ = part_size
+        self._buffer_ = bytearray()
+        self._upload_id_ = None
+        self._parts_ = []
+
+    def write(self, data):
+        """Write data"""
+        self._buffer_ += data
+        while len(self._buffer_) >= self._part_size_:
+            part = bytes(self._buffer_[:self._part_size_])
+            del self._buffer_[:self._part_size_]
+            self._upload_part_(part)
+        return len(data)
+
+    def _upload_part_(self, part):
+        if self._upload_id_ is None:
+            result = self._backend_.request('POST', self._key_, {'uploads': ''})
+            self._upload_id_ = _xml_(result.content).findtext('UploadId')
+        number = len(self._parts_) + 1
+        result = self._backend_.request('PUT', self._key_, {'partNumber': str(number), 'uploadId': self._upload_id_},
+                                        data=part)
+        self._parts_.append((number, result.headers['ETag']))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, error_type, error, traceback):
+        if error_type is not None:
+            if self._upload_id_ is not None:
+                self._backend_.request('DELETE', self._key_, {'uploadId': self._upload_id_})
+            return
+        if self._upload_id_ is None:
+            self._backend_.request('PUT', self._key_, data=bytes(self._buffer_))
+            return
+        if self._buffer_:
+            self._upload_part_(bytes(self._buffer_))
+        parts = ''.join(f'<Part><PartNumber>{number}</PartNumber><ETag>{etag}</ETag></Part>'
+                        for number, etag in self._parts_)
+        self._backend_.request('POST', self._key_, {'uploadId': self._upload_id_},
+                               data=f'<CompleteMultipartUpload>{parts}</CompleteMultipartUpload>'.encode())
+
+
+class S3Backend:
+    """Blobs stored as objects in a bucket of an S3-compatible service (path-style URLs, SigV4)"""
+
+    def __init__(self, endpoint=S3_ENDPOINT, bucket=S3_BUCKET, access_key=S3_ACCESS_KEY, secret_key=S3_SECRET_KEY,
+                 region=S3_REGION, part_size=S3_PART_SIZE, pool_size=S3_POOL_SIZE):
+        self._endpoint_ = endpoint[:-1] if endpoint.endswith('/') else endpoint
+        self._host_ = urlsplit(self._endpoint_).netloc
+        self._bucket_ = bucket
+        self._access_key_ = access_key
+        self._secret_key_ = secret_key
+        self._region_ = region
+        self._part_size_ = part_size
+        self._session_ = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self._session_.mount('http://', adapter)
+        self._session_.mount('https://', adapter)
+
+    def _sign_(self, method, path, query, headers):
+        """Add the AWS Signature Version 4 headers (the payload is not signed, so it can be streamed)"""
+        now = datetime.datetime.now(datetime.timezone.utc)
+        amz_date = now.strftime('%Y%m%dT%H%M%SZ')
+        scope = f'{now:%Y%m%d}/{self._region_}/s3/aws4_request'
+        headers.update({'host': self._host_, 'x-amz-date': amz_date, 'x-amz-content-sha256': 'UNSIGNED-PAYLOAD'})
+        signed_headers = sorted(name.lower() for name in headers)
+        canonical_headers = ''.join(
+            f'{name}:{str(value).strip()}\n' for name, value in sorted((k.lower(), v) for k, v in headers.items())
+        )
+        canonical_request = '\n'.join([method, path, query, canonical_headers, ';'.join(signed_headers),
+                                       'UNSIGNED-PAYLOAD'])
+        string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', amz_date, scope,
+                                    hashlib.sha256(canonical_request.encode()).hexdigest()])
+        key = f'AWS4{self._secret_key_}'.encode()
+        for part in (f'{now:%Y%m%d}', self._region_, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode(), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode(), hashlib.sha256).hexdigest()
+        headers['Authorization'] = (f'AWS4-HMAC-SHA256 Credential={self._access_key_}/{scope}, '
+                                    f'SignedHeaders={";".join(signed_headers)}, Signature={signature}')
+
+    def request(self, method, key=None, query=None, headers=None, data=None, stream=False, expected=(200, 204)):
+        """Signed request for an object (or the bucket if no key)"""
+        path = quote(f'/{self._bucket_}' + (f'/{key}' if key is not None else ''), safe='/-_.~')
+        query = '&'.join(f'{quote(name, safe="-_.~")}={quote(value, safe="-_.~")}'
+                         for name, value in sorted((query or {}).items()))
+        headers = dict(headers or {})
+        self._sign_(method, path, query, headers)
+        result = self._session_.request(method, f'{self._endpoint_}{path}' + (f'?{query}' if query else ''),
+                                        headers=headers, data=data, stream=stream)
+        if result.status_code == 404:
+            result.close()
+            raise FileNotFoundError(key)
+        if result.status_code not in expected:
+            result.close()
+            raise ServiceError(self._endpoint_, f'{method} {key} failed with status {result.status_code}')
+        return result
+
+    def writer(self, key):
+        """Context manager with a binary file to write an object; visible only when closed"""
+        return _MultipartWriter(self, key, self._part_size_)
+
+    def open(self, key):
+        """Binary stream of an object"""
+        result = self.request('GET', key, stream=True)
+        result.raw.decode_content = False
+        return result.raw
+
+    def path(self, key):  # pylint: disable=unused-argument
+        """Objects have no local path"""
+        return None
+
+    def size(self, key):
+        """Size of an object"""
+        return int(self.request('HEAD', key).headers['Content-Length'])
+
+    def exists(self, key):
+        """Check if an object exists"""
+        try:
+            self.request('HEAD', key)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def remove(self, key):
+        """Remove an object"""
+        self.request('DELETE', key)
+
+    def list(self, prefix):
+        """Iterate over (key, modification time) of the objects directly under a prefix"""
+        query = {'list-type': '2', 'prefix': f'{prefix}/', 'delimiter': '/'}
+        while True:
+            listing = _xml_(self.request('GET', query=query).content)
+            for item in listing.iter('Contents'):
+                modified = datetime.datetime.fromisoformat(item.findtext('LastModified').replace('Z', '+00:00'))
+                yield item.findtext('Key'), modified.timestamp()
+            if listing.findtext('IsTruncated') != 'true':
+                return
+            query['continuation-token'] = listing.findtext('NextContinuationToken')
+
+    def rename(self, key, new_key):
+        """Move an object to another key (server-side copy)"""
+        self.copy(key, new_key)
+        self.remove(key)
+
+    def copy(self, key, new_key):
+        """Copy an object inside the service, without downloading it"""
+        self.request('PUT', new_key, headers={'x-amz-copy-source': quote(f'/{self._bucket_}/{key}', safe='/-_.~')})
+        return 'server-side'
+
+
+def make_backend(name=STORAGE_BACKEND):
+    """Build the configured backend"""
+    if name == 'local':
+        return LocalBackend()
+    if name == 's3':
+        return S3Backend()
+    raise ValueError(f'Storage backend {name} is not supported. Supported: {SUPPORTED_BACKENDS}')
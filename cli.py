@@ -9,8 +9,10 @@ import logging
 import argparse
 from io import StringIO
 
+from cli import CACHE_FILE
 from cli.blobservice import BlobService, AuthService
 from cli.errors import CMDCLI_ERROR, NO_ERROR, SCRIPT_ERROR
+from cli.pipeline import Pipeline
 from cli.shell import Shell, prompt_password
 
 _DEB = logging.debug
@@ -43,7 +45,8 @@ def main():
     if user_options.BLOBURL is not None and user_options.AUTHURL is not None:
         if user_options.authtoken:
             _DEB('Using Auth token')
-            blob_client = BlobService(user_options.BLOBURL, authToken=user_options.authtoken)
+            blob_client = BlobService(user_options.BLOBURL, authToken=user_options.authtoken,
+                                      cacheFile=user_options.cache)
             auth_client = AuthService(user_options.AUTHURL, authToken=user_options.authtoken)
         else:
             auth_client = AuthService(user_options.AUTHURL)
@@ -52,7 +55,8 @@ def main():
                 if not user_options.password:
                     user_options.password = prompt_password()
                 auth_client.login(user_options.username, user_options.password)
-                blob_client = BlobService(user_options.BLOBURL, authToken=auth_client.auth_token)
+                blob_client = BlobService(user_options.BLOBURL, authToken=auth_client.auth_token,
+                                          user=auth_client.user, cacheFile=user_options.cache)
             else:
                 raise Exception('Username is required')
 
@@ -77,7 +81,11 @@ def main():
         if user_options.force:
             shell.stop_on_error = False
         shell.output = stdout_output
-        shell.cmdloop()
+        if input_file is not sys.stdin and user_options.jobs > 1:
+            _DEB(f'Running {input_file.name} with {user_options.jobs} concurrent commands')
+            shell.bad_exit = not Pipeline(shell, user_options.jobs).run(input_file.readlines(), input_file.name)
+        else:
+            shell.cmdloop()
         if shell.bad_exit:
             _ERR('Command process interrupted')
             _ERR(shell.error_cause)
@@ -113,6 +121,13 @@ def parse_command_line():
     running = parser.add_argument_group('Running options')
     running.add_argument('--force', action='store_true', default=False,
                          dest='force', help='Continue even if some error is reported')
+    running.add_argument('-j', '--jobs', type=int, default=1,
+                         dest='jobs', help='Run independent commands of the scripts concurrently, '
+                                           'up to JOBS at once (default: %(default)s)')
+    running.add_argument('--cache', default=CACHE_FILE,
+                         dest='cache', help='Local cache of the blob listings (default: %(default)s)')
+    running.add_argument('--no-cache', action='store_const', const=None,
+                         dest='cache', help='Do not use the local cache of the blob listings')
 
     debopts = parser.add_argument_group('Debugging options')
     debopts.add_argument('--debug', '-d', action='store_true', default=False,
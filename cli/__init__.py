@@ -1,4 +1,4 @@
-
+import os
 
 DEFAULT_ENCODING = 'utf-8'
 DEFAULT_PORT = 3001
@@ -7,3 +7,6 @@ HASH_PASS = 'hash-pass'
 USER = 'user'
 TOKEN = 'token'
 DOWNLOAD_FOLDER = 'download'
+# Client-side cache of the blob metadata (listings, digests and ETags)
+CACHE_FILE = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')),
+                          'blobapi', 'metadata.sqlite')
@@ -1,44 +1,150 @@
 """Library to access the blob service"""
 
+import bisect
 import json
 import hashlib
 import os
+import tarfile
+import uuid
+import zipfile
 from pathlib import Path
 
 import requests
 from typing import Optional, Union, List
 
-from cli import USER_TOKEN, DEFAULT_ENCODING, HASH_PASS, USER, TOKEN, DOWNLOAD_FOLDER
+from cli import USER_TOKEN, DEFAULT_ENCODING, HASH_PASS, USER, TOKEN, DOWNLOAD_FOLDER, CACHE_FILE
 from cli.blob import Blob
+from cli.cache import MetadataCache
 from cli.errors import Unauthorized, BlobServiceError, UserNotExists, AlreadyLogged
 
 CONTENT_JSON = {'Content-Type': 'application/json'}
+# Most changes returned by the change feed in one answer
+CHANGES_LIMIT = 1000
+# Last member of the archives of blobs, with their digests
+ARCHIVE_MANIFEST = '.manifest.json'
+
+
+def tar_stream(directory: Union[str, Path], chunkSize: int = 64 * 1024):
+    """Tar archive of the files in a directory (recursively), generated while it is read"""
+    written = 0
+    for path in sorted(Path(directory).rglob('*')):
+        if not path.is_file():
+            continue
+        info = tarfile.TarInfo(path.relative_to(directory).as_posix())
+        stat = path.stat()
+        info.size, info.mtime, info.mode = stat.st_size, int(stat.st_mtime), 0o644
+        header = info.tobuf(tarfile.PAX_FORMAT, DEFAULT_ENCODING)
+        written += len(header)
+        yield header
+        remaining = info.size
+        with open(path, 'rb') as file:
+            while remaining:
+                # Exactly the size in the header, even if the file changes meanwhile
+                chunk = file.read(min(chunkSize, remaining)) or bytes(remaining)
+                remaining -= len(chunk)
+                written += len(chunk)
+                yield chunk
+        if info.size % tarfile.BLOCKSIZE:
+            padding = tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE
+            written += padding
+            yield bytes(padding)
+    end = 2 * tarfile.BLOCKSIZE
+    yield bytes(end + -(written + end) % tarfile.RECORDSIZE)
+
+
+def archive_manifest(archive: Union[str, Path], archiveFormat: str = 'tar') -> dict:
+    """Manifest of a saved export archive"""
+    if archiveFormat == 'zip':
+        with zipfile.ZipFile(archive) as contents:
+            return json.loads(contents.read(ARCHIVE_MANIFEST))
+    with tarfile.open(archive) as contents:
+        return json.load(contents.extractfile(ARCHIVE_MANIFEST))
+
+
+def extract_archive(stream, directory: Union[str, Path]) -> tuple:
+    """Extract a tar archive while it is read, flattened into a directory.
+
+    Returns its manifest (None if missing) and the SHA-256 of every file extracted, by name.
+    """
+    digests = {}
+    manifest = None
+    with tarfile.open(fileobj=stream, mode='r|*') as contents:
+        for member in contents:
+            if not member.isfile():
+                continue
+            if member.name == ARCHIVE_MANIFEST:
+                manifest = json.load(contents.extractfile(member))
+                continue
+            # Never outside the directory
+            filename = os.path.basename(member.name)
+            digest = hashlib.sha256()
+            source = contents.extractfile(member)
+            with open(os.path.join(directory, filename), 'wb') as file:
+                for chunk in iter(lambda: source.read(8192), b''):
+                    file.write(chunk)
+                    digest.update(chunk)
+            digests[filename] = digest.hexdigest()
+    return manifest, digests
 
 
 class BlobService:
     """BlobService implementation"""
 
-    def __init__(self, serviceURL: str, authToken: Optional[str] = None):
+    def __init__(self, serviceURL: str, authToken: Optional[str] = None, user: Optional[str] = None,
+                 cacheFile: Optional[str] = CACHE_FILE):
         self._url_ = serviceURL[:-1] if serviceURL.endswith('/') else serviceURL
         self._authToken_ = authToken
         self._headers_ = {'AuthToken': authToken} if authToken else {}
         self._blobs_ = []
         if not self.service_up:
             raise BlobServiceError(serviceURL, 'service seems down')
+        self._ring_ = self._get_ring_()
+        # Listings are cached per user (or token, if the user is unknown)
+        principal = user or (hashlib.sha256(authToken.encode(DEFAULT_ENCODING)).hexdigest() if authToken else '')
+        self._cache_ = MetadataCache(cacheFile, self._url_, principal) if cacheFile else None
+
+    def _get_ring_(self) -> Optional[tuple]:
+        """Get the consistent-hash ring of a sharded service: (hashes, nodes), None if not sharded"""
+        try:
+            response = requests.get(f"{self._url_}/api/v1/status/ring")
+        except requests.RequestException:
+            return None
+        points = response.json().get('points') if response.status_code == 200 else None
+        if not points:
+            return None
+        return [point for point, _ in points], [node for _, node in points]
+
+    def _node_url_(self, blobId: str) -> str:
+        """URL of the node owning a blob (the service URL if not sharded)"""
+        if not self._ring_:
+            return self._url_
+        hashes, nodes = self._ring_
+        position = int.from_bytes(hashlib.md5(blobId.encode(DEFAULT_ENCODING)).digest()[:8], 'big')
+        return nodes[bisect.bisect(hashes, position) % len(hashes)]
 
     def createBlob(self, localFilename: Union[str, Path]) -> Blob:
         """Upload a file to the blob service"""
+        # Spread the new blobs across the shards
+        url = self._node_url_(str(uuid.uuid4()))
         with open(localFilename, 'rb') as file:
-            response = requests.post(f"{self._url_}/api/v1/blob", headers=self._headers_, files={'file': file})
+            response = requests.post(f"{url}/api/v1/blob", headers=self._headers_, files={'file': file})
         if response.status_code == 201:
             blob_data = response.json()
+            if self._cache_:
+                self._cache_.add(blob_data['blobId'])
             return Blob(blobId=blob_data['blobId'], authToken=self._authToken_)
         else:
-            raise BlobServiceError(f"{self._url_}/api/v1/blob", response.content)
+            raise BlobServiceError(f"{url}/api/v1/blob", response.content)
 
     def getBlob(self, blobId: str) -> Blob:
-        """Download a file from the blob service"""
-        response = requests.get(f"{self._url_}/api/v1/blob/{blobId}", headers=self._headers_)
+        """Download a file from the blob service (not again if the last download is unchanged)"""
+        headers = dict(self._headers_)
+        filename, digest, etag = self._cache_.download(blobId) if self._cache_ else (None, None, None)
+        if etag and filename and os.path.exists(os.path.join(DOWNLOAD_FOLDER, filename)):
+            headers['If-None-Match'] = etag
+        response = requests.get(f"{self._node_url_(blobId)}/api/v1/blob/{blobId}", headers=headers, stream=True)
+        if response.status_code == 304:
+            return Blob(blobId=blobId, authToken=self._authToken_)
         if response.status_code == 200:
             content_dispo = response.headers.get('Content-Disposition', '')
             filename = None
@@ -47,28 +153,162 @@ class BlobService:
             if not filename:
                 filename = f"blob_{blobId}"
             file_path = os.path.join(DOWNLOAD_FOLDER, filename)
+            digest = hashlib.sha256()
             with open(file_path, 'wb') as file:
                 for chunk in response.iter_content(chunk_size=8192):
                     if chunk:
                         file.write(chunk)
+                        digest.update(chunk)
+            if self._cache_:
+                self._cache_.downloaded(blobId, filename, digest.hexdigest(), response.headers.get('ETag'))
             return Blob(blobId=blobId, authToken=self._authToken_)
         else:
             raise BlobServiceError(f"{self._url_}/api/v1/blob/{blobId}", response.content)
 
     def deleteBlob(self, blobId: str) -> None:
         """Delete a blob from the blob service"""
-        response = requests.delete(f"{self._url_}/api/v1/blob/{blobId}", headers=self._headers_)
+        response = requests.delete(f"{self._node_url_(blobId)}/api/v1/blob/{blobId}", headers=self._headers_)
         if response.status_code != 204:
             raise BlobServiceError(f"{self._url_}/api/v1/blob/{blobId}", response.content)
+        if self._cache_:
+            self._cache_.remove(blobId)
 
-    def getBlobs(self) -> List[str]:
-        """Get all blobs from the blob service"""
+    def copyBlob(self, blobId: str, name: Optional[str] = None, owner: Optional[str] = None) -> Blob:
+        """Copy a blob inside the blob service (nothing is downloaded or uploaded)"""
+        url = f"{self._node_url_(blobId)}/api/v1/blob/{blobId}/copy"
+        body = {key: value for key, value in (('name', name), ('owner', owner)) if value is not None}
+        response = requests.post(url, headers=self._headers_, json=body)
+        if response.status_code == 201:
+            if self._cache_:
+                self._cache_.add(response.json()['blobId'])
+            return Blob(blobId=response.json()['blobId'], authToken=self._authToken_)
+        else:
+            raise BlobServiceError(url, response.content)
+
+    def presignBlob(self, blobId: str, expiresIn: Optional[int] = None, byteRange: Optional[str] = None,
+                    method: str = 'GET') -> str:
+        """Get a time-limited URL to download a blob (or a byte range, "first-last") without auth token"""
+        url = f"{self._node_url_(blobId)}/api/v1/blob/{blobId}/presign"
+        body = {key: value for key, value in (('expires_in', expiresIn), ('range', byteRange), ('method', method))
+                if value is not None}
+        response = requests.post(url, headers=self._headers_, json=body)
+        if response.status_code == 200:
+            return response.json()['URL']
+        else:
+            raise BlobServiceError(url, response.content)
+
+    def exportBlobs(self, blobIds: Optional[List[str]] = None, archive: Optional[Union[str, Path]] = None,
+                    archiveFormat: str = 'tar', owner: Optional[str] = None, pattern: Optional[str] = None) -> dict:
+        """Download many blobs (every blob listed, or those of an owner or matching a pattern) in one request.
+
+        The archive is saved as it is in "archive" or, if not given, extracted into the download folder
+        while it is received, checking the digest of every blob. Returns the manifest of the archive.
+        """
+        if archive is None and archiveFormat == 'zip':
+            raise ValueError('Zip archives cannot be extracted while they are received, save them instead')
+        url = f"{self._url_}/api/v1/blobs/export"
+        body = {key: value for key, value in (('blobs', blobIds), ('owner', owner), ('pattern', pattern),
+                                              ('format', archiveFormat)) if value is not None}
+        response = requests.post(url, headers=self._headers_, json=body, stream=True)
+        if response.status_code != 200:
+            raise BlobServiceError(url, response.content)
+        if archive is not None:
+            with open(archive, 'wb') as file:
+                for chunk in response.iter_content(chunk_size=8192):
+                    file.write(chunk)
+            return archive_manifest(archive, archiveFormat)
+        manifest, digests = extract_archive(response.raw, DOWNLOAD_FOLDER)
+        if manifest is None:
+            raise BlobServiceError(url, 'incomplete archive, without manifest')
+        for entry in manifest['blobs']:
+            if digests.get(entry['name']) != entry['sha256']:
+                raise BlobServiceError(url, f'corrupted download of blob {entry["blobId"]}')
+            if self._cache_:
+                self._cache_.downloaded(entry['blobId'], entry['name'], entry['sha256'], None)
+        return manifest
+
+    def importBlobs(self, directory: Union[str, Path]) -> dict:
+        """Upload every file of a directory (recursively) in one request, as a tar archive built while it is sent.
+
+        Returns the answer of the service: the blob ID (or the error) of every file, by its path in the directory.
+        """
+        if not os.path.isdir(directory):
+            raise ValueError(f'{directory} is not a directory')
+        url = f"{self._url_}/api/v1/blobs/import"
+        headers = dict(self._headers_, **{'Content-Type': 'application/x-tar'})
+        response = requests.post(url, headers=headers, data=tar_stream(directory))
+        if response.status_code != 200:
+            raise BlobServiceError(url, response.content)
+        result = response.json()
+        if self._cache_:
+            for entry in result['blobs']:
+                if 'blobId' in entry:
+                    self._cache_.add(entry['blobId'])
+        return result
+
+    def _list_blobs_(self) -> dict:
+        """Full listing: blob IDs and the change feed sequence number to follow it from (if any)"""
         response = requests.get(f"{self._url_}/api/v1/blobs", headers=self._headers_)
         if response.status_code == 200:
             return response.json()
         else:
             raise BlobServiceError(f"{self._url_}/api/v1/blobs", response.content)
 
+    def _readable_(self, blobId: str) -> bool:
+        """Check if a blob still exists and can be read"""
+        response = requests.get(f"{self._node_url_(blobId)}/api/v1/blob/{blobId}/versions", headers=self._headers_)
+        if response.status_code in (401, 404):
+            return False
+        if response.status_code != 200:
+            raise BlobServiceError(f"{self._url_}/api/v1/blob/{blobId}/versions", response.content)
+        return True
+
+    def _refresh_(self) -> None:
+        """Bring the cached listing up to date, with the changes since the last listing if possible"""
+        cursor = self._cache_.cursor()
+        while cursor is not None:
+            response = requests.get(f"{self._url_}/api/v1/changes", params={'since': cursor, 'wait': 0},
+                                    headers=self._headers_)
+            if response.status_code != 200 or response.json()['reset']:
+                # Changes were lost, or the user joined or left a group: list the blobs again
+                break
+            feed = response.json()
+            added, changed, removed = set(), set(), set()
+            for change in feed['changes']:
+                blobId = change['blobId']
+                added.discard(blobId)
+                changed.discard(blobId)
+                removed.discard(blobId)
+                if change['event'] == 'delete':
+                    removed.add(blobId)
+                elif change['event'] in ('visibility', 'acl'):
+                    # It may not be visible anymore
+                    (added if self._readable_(blobId) else removed).add(blobId)
+                else:
+                    added.add(blobId)
+                    if change['event'] == 'update':
+                        changed.add(blobId)
+            self._cache_.apply(added, changed, removed, feed['next'])
+            if len(feed['changes']) < CHANGES_LIMIT:
+                return
+            cursor = feed['next']
+        listing = self._list_blobs_()
+        self._cache_.replace(listing['blobs'], listing.get('next'))
+
+    def getBlobs(self) -> List[str]:
+        """Get all blobs from the blob service"""
+        if not self._cache_:
+            return self._list_blobs_()['blobs']
+        self._refresh_()
+        return self._cache_.blobs()
+
+    def blobExists(self, blobId: str) -> bool:
+        """Check if a blob is listed in the blob service"""
+        if not self._cache_:
+            return blobId in self._list_blobs_()['blobs']
+        self._refresh_()
+        return self._cache_.contains(blobId)
+
     @property
     def service_up(self) -> bool:
         """Check if service is running or not"""
@@ -0,0 +1,111 @@
+"""On-disk cache of the blob metadata known by the client"""
+
+import os
+import sqlite3
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    service TEXT NOT NULL,
+    principal TEXT NOT NULL,
+    blob_id TEXT NOT NULL,
+    filename TEXT,
+    digest TEXT,
+    etag TEXT,
+    PRIMARY KEY (service, principal, blob_id)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    service TEXT NOT NULL,
+    principal TEXT NOT NULL,
+    cursor INTEGER,
+    PRIMARY KEY (service, principal)
+);
+"""
+
+
+class MetadataCache:
+    """Blobs visible for a principal (user) in a service, and the change feed cursor of the listing"""
+
+    def __init__(self, path: str, service: str, principal: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._scope_ = (service, principal)
+        self._lock_ = threading.Lock()
+        self._db_ = sqlite3.connect(path, check_same_thread=False)
+        self._db_.executescript(_SCHEMA)
+
+    def cursor(self) -> Optional[int]:
+        """Sequence number of the change feed the cached listing is up to date with"""
+        with self._lock_:
+            row = self._db_.execute('SELECT cursor FROM listings WHERE service = ? AND principal = ?',
+                                    self._scope_).fetchone()
+        return row[0] if row else None
+
+    def _set_cursor_(self, cursor: Optional[int]) -> None:
+        self._db_.execute('INSERT OR REPLACE INTO listings (service, principal, cursor) VALUES (?, ?, ?)',
+                          self._scope_ + (cursor,))
+
+    def replace(self, blob_ids: Iterable[str], cursor: Optional[int]) -> None:
+        """Store a full listing, keeping what is known of the blobs still listed"""
+        blob_ids = set(blob_ids)
+        with self._lock_, self._db_:
+            known = {row[0] for row in self._db_.execute(
+                'SELECT blob_id FROM blobs WHERE service = ? AND principal = ?', self._scope_)}
+            self._db_.executemany('DELETE FROM blobs WHERE service = ? AND principal = ? AND blob_id = ?',
+                                  [self._scope_ + (blob_id,) for blob_id in known - blob_ids])
+            self._db_.executemany('INSERT INTO blobs (service, principal, blob_id) VALUES (?, ?, ?)',
+                                  [self._scope_ + (blob_id,) for blob_id in blob_ids - known])
+            self._set_cursor_(cursor)
+
+    def apply(self, added: Iterable[str], changed: Iterable[str], removed: Iterable[str], cursor: int) -> None:
+        """Apply a delta of the listing: blobs added, blobs whose contents changed and blobs removed"""
+        with self._lock_, self._db_:
+            self._db_.executemany('INSERT OR IGNORE INTO blobs (service, principal, blob_id) VALUES (?, ?, ?)',
+                                  [self._scope_ + (blob_id,) for blob_id in added])
+            self._db_.executemany('UPDATE blobs SET digest = NULL, etag = NULL '
+                                  'WHERE service = ? AND principal = ? AND blob_id = ?',
+                                  [self._scope_ + (blob_id,) for blob_id in changed])
+            self._db_.executemany('DELETE FROM blobs WHERE service = ? AND principal = ? AND blob_id = ?',
+                                  [self._scope_ + (blob_id,) for blob_id in removed])
+            self._set_cursor_(cursor)
+
+    def blobs(self) -> List[str]:
+        """Cached listing"""
+        with self._lock_:
+            return [row[0] for row in self._db_.execute(
+                'SELECT blob_id FROM blobs WHERE service = ? AND principal = ? ORDER BY blob_id', self._scope_)]
+
+    def contains(self, blob_id: str) -> bool:
+        """Check if a blob is in the cached listing"""
+        with self._lock_:
+            return self._db_.execute('SELECT 1 FROM blobs WHERE service = ? AND principal = ? AND blob_id = ?',
+                                     self._scope_ + (blob_id,)).fetchone() is not None
+
+    def add(self, blob_id: str) -> None:
+        """Add a blob created by this client"""
+        self.apply([blob_id], [], [], self.cursor())
+
+    def remove(self, blob_id: str) -> None:
+        """Remove a blob deleted by this client"""
+        self.apply([], [], [blob_id], self.cursor())
+
+    def download(self, blob_id: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
+        """Filename, digest and ETag of the last download of a blob"""
+        with self._lock_:
+            row = self._db_.execute('SELECT filename, digest, etag FROM blobs '
+                                    'WHERE service = ? AND principal = ? AND blob_id = ?',
+                                    self._scope_ + (blob_id,)).fetchone()
+        return row if row else (None, None, None)
+
+    def downloaded(self, blob_id: str, filename: str, digest: str, etag: Optional[str]) -> None:
+        """Remember the last download of a blob"""
+        with self._lock_, self._db_:
+            self._db_.execute('INSERT OR REPLACE INTO blobs (service, principal, blob_id, filename, digest, etag) '
+                              'VALUES (?, ?, ?, ?, ?, ?)', self._scope_ + (blob_id, filename, digest, etag))
+
+    def close(self) -> None:
+        """Close the database"""
+        with self._lock_:
+            self._db_.close()
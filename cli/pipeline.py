@@ -0,0 +1,276 @@
+"""Pipelined execution of script files.
+
+The commands of a script run concurrently as long as they do not depend on each
+other. A command depends on an earlier one if both use the same resource and one
+of them changes it:
+
+- get_blob, blob_exists and presign_blob read a blob; delete_blob writes it and copy_blob reads it.
+- get_blobs reads the listing; create_blob, copy_blob and delete_blob update it
+  (updates of the listing do not depend on each other).
+- create_blob and copy_blob write the name of the new blob.
+- "$<n>" in a command is replaced with the output of line <n> (i.e. the blob ID
+  printed by create_blob, see Shell.precmd), so the command runs after it.
+- Any other command (connect, login, logout, quit...) runs alone, after every
+  previous command and before every next one.
+
+The output and the log messages of every command are written in script order,
+and the script stops at the first failed command (in script order) unless
+errors are ignored. Commands after it that were already running finish, but
+their output is not written. A timing report is logged at the end.
+"""
+
+import io
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cli.shell import Shell, _COMMENT_TAG_
+
+_INF = logging.info
+
+READ, UPDATE, WRITE = 'read', 'update', 'write'
+LISTING = 'listing'
+# Commands ending the script without an error
+QUIT_COMMANDS = ('quit', 'EOF')
+# Most commands shown in the slowest commands of the timing report
+REPORT_SLOWEST = 3
+
+_local = threading.local()
+
+
+class _ThreadOutput(io.TextIOBase):
+    """Standard output which keeps what the commands running in each thread write"""
+
+    def __init__(self, stream):
+        self._stream_ = stream
+
+    def write(self, data):
+        buffer = getattr(_local, 'buffer', None)
+        return (buffer if buffer is not None else self._stream_).write(data)
+
+    def flush(self):
+        self._stream_.flush()
+
+
+class _CaptureLogs(logging.Filter):
+    """Keep the log records of the commands running in each thread, instead of emitting them"""
+
+    def filter(self, record):
+        records = getattr(_local, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+
+class Command:
+    """A line of a script"""
+
+    def __init__(self, number, line):
+        self.number = number
+        self.line = line
+        words = line.split()
+        self.name = words[0] if words else ''
+        self.args = words[1:]
+        self.depends = set()
+        self.output = ''
+        self.records = []
+        self.failed = False
+        self.stop = False
+        self.seconds = 0.0
+        self.started = False
+        self.done = False
+        self.references = {int(word[1:]) for word in self.args if word[1:].isdigit() and word.startswith('$')}
+
+    @property
+    def resources(self):
+        """(resource, mode) used by the command, None if it must run alone"""
+        target = self.args[0] if self.args else None
+        if self.name in ('get_blob', 'blob_exists', 'presign_blob') and target:
+            return [(f'blob:{target}', READ)]
+        if self.name == 'delete_blob' and target:
+            return [(f'blob:{target}', WRITE), (LISTING, UPDATE)]
+        if self.name == 'copy_blob' and target:
+            resources = [(f'blob:{target}', READ), (LISTING, UPDATE)]
+            if len(self.args) > 1:
+                resources.append((f'name:{self.args[1]}', WRITE))
+            return resources
+        if self.name == 'create_blob' and target:
+            return [(f'name:{target.replace(chr(92), "/").rsplit("/", 1)[-1]}', WRITE), (LISTING, UPDATE)]
+        if self.name == 'get_blobs':
+            return [(LISTING, READ)]
+        return None
+
+
+def _use_resource_(resources, command, resource, mode):
+    """Make "command" depend on the earlier users of "resource" it conflicts with, and record it as one"""
+    writer, readers, updaters = resources.setdefault(resource, [None, [], []])
+    if writer:
+        command.depends.add(writer)
+    if mode != READ:
+        command.depends.update(readers)
+    if mode != UPDATE:
+        command.depends.update(updaters)
+    if mode == WRITE:
+        command.depends.update(readers + updaters)
+        resources[resource] = [command, [], []]
+    else:
+        (readers if mode == READ else updaters).append(command)
+
+
+def parse_script(lines):
+    """Commands of a script (skipping blank lines and comments) with their dependencies"""
+    commands = []
+    by_number = {}
+    # Resource -> [last writer, readers since, updaters since]
+    resources = {}
+    since_barrier = []
+    barrier = None
+    for number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line or line.startswith(_COMMENT_TAG_):
+            continue
+        command = Command(number, line)
+        used = command.resources
+        if used is None:
+            command.depends.update(since_barrier)
+            if barrier:
+                command.depends.add(barrier)
+            barrier = command
+            since_barrier = []
+            resources = {}
+        else:
+            if barrier:
+                command.depends.add(barrier)
+            for resource, mode in used:
+                _use_resource_(resources, command, resource, mode)
+            since_barrier.append(command)
+        command.depends.update(by_number[reference] for reference in command.references if reference in by_number)
+        command.depends.discard(command)
+        commands.append(command)
+        by_number[number] = command
+    return commands
+
+
+class Pipeline:
+    """Run the commands of a script with a shell, up to "parallelism" of them at once"""
+
+    def __init__(self, shell: Shell, parallelism: int):
+        self._shell_ = shell
+        self._parallelism_ = max(1, parallelism)
+        self._condition_ = threading.Condition()
+
+    def _worker_shell_(self):
+        """Shell sharing the clients of the main one"""
+        shell = Shell(stdout=self._shell_.stdout)
+        shell.auth_client = self._shell_.auth_client
+        shell.blob_client = self._shell_.blob_client
+        shell.stop_on_error = self._shell_.stop_on_error
+        shell.interactive = False
+        shell.output = self._shell_.output
+        shell.results = self._shell_.results
+        return shell
+
+    def _execute_(self, command, shell):
+        _local.buffer = io.StringIO()
+        _local.records = command.records
+        start = time.perf_counter()
+        try:
+            # The same line number as running the script line by line, for "$<n>"
+            shell.line_no = command.number - 1
+            command.stop = bool(shell.onecmd(shell.precmd(command.line)))
+        except Exception as error:  # pylint: disable=broad-except
+            logging.error(f'Line {command.number}: {error}')
+        finally:
+            command.seconds = time.perf_counter() - start
+            command.output = _local.buffer.getvalue()
+            command.failed = any(record.levelno >= logging.ERROR for record in command.records) or (
+                command.stop and command.name not in QUIT_COMMANDS)
+            _local.buffer = None
+            _local.records = None
+            with self._condition_:
+                command.done = True
+                self._condition_.notify_all()
+
+    def _emit_(self, command):
+        """Write the output and the log messages of a command"""
+        sys.stdout.write(command.output)
+        for record in command.records:
+            logging.getLogger(record.name).handle(record)
+
+    def _start_(self, pending, running, executor):
+        """Start the pending commands whose dependencies are done, in script order"""
+        for command in list(pending):
+            if len(running) >= self._parallelism_:
+                return
+            if not all(depend.done for depend in command.depends):
+                if command.resources is None:
+                    # Nothing after a session command can start before it
+                    return
+                continue
+            command.started = True
+            pending.remove(command)
+            running.add(command)
+            # Commands changing the session run alone, with the main shell
+            shell = self._shell_ if command.resources is None else self._worker_shell_()
+            executor.submit(self._execute_, command, shell)
+
+    def run(self, lines, name='script'):
+        """Run a script, return False if it was interrupted by an error"""
+        commands = parse_script(lines)
+        stdout = sys.stdout
+        capture = _CaptureLogs()
+        handlers = logging.getLogger().handlers
+        sys.stdout = _ThreadOutput(stdout)
+        for handler in handlers:
+            handler.addFilter(capture)
+        start = time.perf_counter()
+        ok = True
+        emitted = 0
+        try:
+            with ThreadPoolExecutor(max_workers=self._parallelism_) as executor:
+                stopping = False
+                pending = list(commands)
+                running = set()
+                while emitted < len(commands):
+                    command = commands[emitted]
+                    if command.done:
+                        self._emit_(command)
+                        emitted += 1
+                        if command.failed and self._shell_.stop_on_error:
+                            ok = False
+                            stopping = True
+                        elif command.stop:
+                            stopping = True
+                        continue
+                    with self._condition_:
+                        running = {command for command in running if not command.done}
+                        if not stopping:
+                            self._start_(pending, running, executor)
+                        elif not command.started:
+                            break
+                        if not command.done:
+                            self._condition_.wait()
+        finally:
+            sys.stdout = stdout
+            for handler in handlers:
+                handler.removeFilter(capture)
+        self._report_(name, commands[:emitted], time.perf_counter() - start)
+        return ok
+
+    def _report_(self, name, commands, seconds):
+        """Log how long the script and its commands took"""
+        busy = sum(command.seconds for command in commands)
+        _INF(f'{name}: {len(commands)} commands in {seconds:.3f}s '
+             f'({busy:.3f}s running commands, parallelism {self._parallelism_}, '
+             f'speedup {busy / seconds if seconds else 0:.2f}x)')
+        by_name = {}
+        for command in commands:
+            by_name.setdefault(command.name, []).append(command.seconds)
+        for command_name, times in sorted(by_name.items()):
+            _INF(f'  {command_name}: {len(times)} in {sum(times):.3f}s '
+                 f'(average {sum(times) / len(times):.3f}s, max {max(times):.3f}s)')
+        for command in sorted(commands, key=lambda command: command.seconds, reverse=True)[:REPORT_SLOWEST]:
+            _INF(f'  line {command.number}: {command.line} ({command.seconds:.3f}s)')
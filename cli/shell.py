@@ -3,10 +3,13 @@
 import cmd
 import getpass
 import logging
+import re
 
 from cli.blobservice import BlobService, AuthService
 
 _COMMENT_TAG_ = '#'
+# "$<n>": the output of line <n>
+_REFERENCE_ = re.compile(r'(?<!\S)\$(\d+)(?!\S)')
 
 
 class Shell(cmd.Cmd):
@@ -19,6 +22,12 @@ class Shell(cmd.Cmd):
     error_cause = 'Unknown error, see logs'
     _auth_ = None
     _blob_ = None
+    _invalid_line_ = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Line number -> last line written by the command (i.e. a blob ID)
+        self.results = {}
 
     @property
     def interrupted(self):
@@ -59,7 +68,31 @@ class Shell(cmd.Cmd):
         cleanLine = line.strip()
         if cleanLine.startswith(_COMMENT_TAG_):
             return ""
-        return super().precmd(line)
+        return super().precmd(self.__substitute__(line))
+
+    def emptyline(self) -> bool:
+        # Blank lines and comments do nothing, instead of repeating the last command
+        return False
+
+    def onecmd(self, line: str) -> bool:
+        if self._invalid_line_:
+            self._invalid_line_ = False
+            return self.stop_on_error
+        return super().onecmd(line)
+
+    def result(self, value):
+        """Write a result of the command, "$<line>" in the next commands"""
+        self.results[self.line_no] = str(value)
+        print(value)
+
+    def __substitute__(self, line):
+        """Replace "$<n>" with the output of line <n>"""
+        for reference in _REFERENCE_.findall(line):
+            if int(reference) >= self.line_no or int(reference) not in self.results:
+                logging.error(f'Line {self.line_no}: line {reference} failed or is not a previous command')
+                self._invalid_line_ = True
+                return line
+        return _REFERENCE_.sub(lambda match: self.results[int(match.group(1))], line)
 
     def postcmd(self, stop: bool, line: str) -> bool:
         self.__select_prompt__()
@@ -88,7 +121,7 @@ class Shell(cmd.Cmd):
         try:
             blobs = self.blob_client.getBlobs()
             for blob in blobs:
-                print(blob)
+                self.result(blob)
         except Exception as error:
             logging.error(f'Cannot get blobs: {error}')
             return self.stop_on_error
@@ -105,11 +138,26 @@ class Shell(cmd.Cmd):
         blob_id = line[0]
         try:
             blob = self.blob_client.getBlob(blob_id)
-            print(blob.blobId)
+            self.result(blob.blobId)
         except Exception as error:
             logging.error(f'Cannot get blob: {error}')
             return self.stop_on_error
 
+    def do_blob_exists(self, line):
+        """Check if a blob exists"""
+        if not self.blob_client:
+            logging.error('No connected to a Blob service, connect first')
+            return self.stop_on_error
+        line = line.strip().split()
+        if len(line) != 1:
+            logging.error('blob_exists takes one argument only')
+            return self.stop_on_error
+        try:
+            self.result(self.blob_client.blobExists(line[0]))
+        except Exception as error:
+            logging.error(f'Cannot check blob: {error}')
+            return self.stop_on_error
+
     def do_delete_blob(self, line):
         """Delete the blob"""
         if not self.blob_client:
@@ -138,11 +186,77 @@ class Shell(cmd.Cmd):
         path = line[0]
         try:
             blob = self.blob_client.createBlob(path)
-            print(blob.blobId)
+            self.result(blob.blobId)
         except Exception as error:
             logging.error(f'Cannot create blob: {error}')
             return self.stop_on_error
 
+    def do_copy_blob(self, line):
+        """Copy a blob in the service: copy_blob <blob_id> [<name>]"""
+        if not self.blob_client:
+            logging.error('No connected to a Blob service, connect first')
+            return self.stop_on_error
+        line = line.strip().split()
+        if len(line) not in (1, 2):
+            logging.error('copy_blob takes a blob ID and an optional name')
+            return self.stop_on_error
+        try:
+            blob = self.blob_client.copyBlob(*line)
+            self.result(blob.blobId)
+        except Exception as error:
+            logging.error(f'Cannot copy blob: {error}')
+            return self.stop_on_error
+
+    def do_presign_blob(self, line):
+        """Get a URL to download a blob without auth token: presign_blob <blob_id> [<seconds>] [<first>-<last>]"""
+        if not self.blob_client:
+            logging.error('No connected to a Blob service, connect first')
+            return self.stop_on_error
+        line = line.strip().split()
+        if len(line) not in (1, 2, 3) or (len(line) > 1 and not line[1].isdigit()):
+            logging.error('presign_blob takes a blob ID, optional seconds and an optional byte range')
+            return self.stop_on_error
+        try:
+            self.result(self.blob_client.presignBlob(line[0], int(line[1]) if len(line) > 1 else None,
+                                                     line[2] if len(line) > 2 else None))
+        except Exception as error:
+            logging.error(f'Cannot presign blob: {error}')
+            return self.stop_on_error
+
+    def do_export_blobs(self, line):
+        """Download many blobs in one archive"""
+        if not self.blob_client:
+            logging.error('No connected to a Blob service, connect first')
+            return self.stop_on_error
+        try:
+            manifest = self.blob_client.exportBlobs(line.strip().split() or None)
+        except Exception as error:
+            logging.error(f'Cannot export blobs: {error}')
+            return self.stop_on_error
+        for entry in manifest['blobs']:
+            self.result(entry['blobId'])
+        for entry in manifest['skipped']:
+            logging.warning(f'Blob {entry["blobId"]} skipped: {entry["reason"]}')
+
+    def do_import_blobs(self, directory):
+        """Upload every file of a directory in one request"""
+        if not self.blob_client:
+            logging.error('No connected to a Blob service, connect first')
+            return self.stop_on_error
+        try:
+            result = self.blob_client.importBlobs(directory.strip())
+        except Exception as error:
+            logging.error(f'Cannot import blobs: {error}')
+            return self.stop_on_error
+        for entry in result['blobs']:
+            if 'blobId' in entry:
+                self.result(entry['blobId'])
+            else:
+                logging.warning(f'{entry["name"]} not imported: {entry["error"]}')
+        if result.get('error'):
+            logging.error(f'Import stopped: {result["error"]}')
+            return self.stop_on_error
+
     def do_connect_to_auth(self, auth_url):
         """Set the auth service URI"""
         if self.auth_client is None:
@@ -236,6 +350,11 @@ Get the list of blobs""")
 \tget_blob <BLOB_ID>
 Get the blob""")
 
+    def help_blob_exists(self):
+        self.output("""Usage:
+\tblob_exists <BLOB_ID>
+Check if the blob exists (using the local cache of the listing)""")
+
     def help_delete_blob(self):
         self.output("""Usage:
 \tdelete_blob <BLOB_ID>
@@ -245,6 +364,27 @@ Delete the blob""")
         self.output("""Usage:
 \tcreate_blob <PATH>
 Create a blob""")
+
+    def help_copy_blob(self):
+        self.output("""Usage:
+\tcopy_blob <BLOB_ID> [<NAME>]
+Copy the blob inside the service""")
+
+    def help_presign_blob(self):
+        self.output("""Usage:
+\tpresign_blob <BLOB_ID> [<SECONDS>] [<FIRST>-<LAST>]
+Get a time-limited URL to download the blob (or only those bytes) without auth token""")
+
+    def help_export_blobs(self):
+        self.output("""Usage:
+\texport_blobs [<BLOB_ID> ...]
+Download the given blobs (or every blob listed) in a single archive""")
+
+    def help_import_blobs(self):
+        self.output("""Usage:
+\timport_blobs <DIRECTORY>
+Upload every file of the directory (recursively) in a single archive""")
+
     def help_connect_to_auth(self):
         self.output("""Usage:
 \tconnect_to_auth <AUTH_uri>
@@ -0,0 +1,26 @@
+"""Helpers shared by the test modules."""
+
+from io import BytesIO
+
+from werkzeug.datastructures import FileStorage
+
+from blobapi.errors import UserNotExists
+
+
+def upload(data, filename):
+    """File uploaded with the given contents"""
+    return FileStorage(stream=BytesIO(data), filename=filename)
+
+
+class MockClient:
+    """Auth client where the token is the user name (of any user, or only of "users")"""
+
+    def __init__(self, users=None):
+        self.users = users
+        self.lookups = 0
+
+    def token_owner(self, token):
+        self.lookups += 1
+        if self.users is not None and token not in self.users:
+            raise UserNotExists(token)
+        return token
@@ -1,4 +1,5 @@
 import os
+import time
 
 from flask import Flask, jsonify
 from dotenv import load_dotenv
@@ -8,6 +9,11 @@ load_dotenv()
 
 AUTH_PORT=os.getenv('AUTH_PORT', '3001')
 MOCK_ADDRESS=os.getenv('MOCK_ADDRESS', '127.0.0.1')
+# Artificial delay (in seconds) added to every token lookup, to emulate a remote auth service
+MOCK_LATENCY=float(os.getenv('MOCK_LATENCY', '0'))
+TOKEN_SUFFIX = '_TOKEN'
+
+
 @app.route('/api/v1/status', methods=['GET'])
 def status():
     return '', 200
@@ -21,10 +27,13 @@ def user(user):
 
 @app.route('/api/v1/token/<token>', methods=['GET'])
 def token(token):
-    if token == "USER_TOKEN":
-        return jsonify(user="USER"), 200
+    if MOCK_LATENCY > 0:
+        time.sleep(MOCK_LATENCY)
+    # Any "<NAME>_TOKEN" belongs to "<NAME>" (so "USER_TOKEN" is owned by "USER")
+    if token.endswith(TOKEN_SUFFIX) and len(token) > len(TOKEN_SUFFIX):
+        return jsonify(user=token[:-len(TOKEN_SUFFIX)]), 200
     else:
         return '', 404
 
 if __name__ == '__main__':
-    app.run(host=MOCK_ADDRESS, port=int(AUTH_PORT))
\ No newline at end of file
+    app.run(host=MOCK_ADDRESS, port=int(AUTH_PORT))
@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+from flask import Flask, Response, request
+from dotenv import load_dotenv
+app = Flask(__name__)
+
+load_dotenv()
+
+S3_PORT = os.getenv('MOCK_S3_PORT', '9000')
+MOCK_ADDRESS = os.getenv('MOCK_ADDRESS', '127.0.0.1')
+ACCESS_KEY = os.getenv('S3_ACCESS_KEY', '')
+XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+# Bucket -> key -> (contents, modification time), and upload ID -> part number -> contents
+OBJECTS = {}
+UPLOADS = {}
+STATS = {'multipart_uploads': 0, 'parts': 0}
+LOCK = threading.Lock()
+
+
+def _authorized_():
+    return request.headers.get('Authorization', '').startswith(f'AWS4-HMAC-SHA256 Credential={ACCESS_KEY}/')
+
+
+def _xml_(body):
+    return Response(f'<?xml version="1.0" encoding="UTF-8"?>{body}', mimetype='application/xml')
+
+
+@app.before_request
+def check_signature():
+    if not _authorized_():
+        return _xml_('<Error><Code>AccessDenied</Code></Error>'), 403
+
+
+@app.route('/<bucket>', methods=['GET'])
+def list_objects(bucket):
+    prefix = request.args.get('prefix', '')
+    delimiter = request.args.get('delimiter')
+    max_keys = int(request.args.get('max-keys', '1000'))
+    start = int(request.args.get('continuation-token', '0'))
+    with LOCK:
+        keys = sorted(key for key in OBJECTS.get(bucket, {}) if key.startswith(prefix)
+                      and not (delimiter and delimiter in key[len(prefix):]))
+        page = keys[start:start + max_keys]
+        contents = ''.join(
+            f'<Contents><Key>{key}</Key><Size>{len(OBJECTS[bucket][key][0])}</Size><LastModified>'
+            f'{datetime.fromtimestamp(OBJECTS[bucket][key][1], timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}'
+            f'</LastModified></Contents>' for key in page
+        )
+    truncated = start + max_keys < len(keys)
+    token = f'<NextContinuationToken>{start + max_keys}</NextContinuationToken>' if truncated else ''
+    return _xml_(f'<ListBucketResult xmlns="{XMLNS}">{contents}'
+                 f'<IsTruncated>{str(truncated).lower()}</IsTruncated>{token}</ListBucketResult>')
+
+
+@app.route('/<bucket>/<path:key>', methods=['PUT'])
+def put_object(bucket, key):
+    with LOCK:
+        if 'uploadId' in request.args:
+            UPLOADS[request.args['uploadId']][int(request.args['partNumber'])] = request.get_data()
+            STATS['parts'] += 1
+            return '', 200, {'ETag': f'"{uuid.uuid4().hex}"'}
+        source = request.headers.get('x-amz-copy-source')
+        if source:
+            source_bucket, source_key = source.lstrip('/').split('/', 1)
+            if source_key not in OBJECTS.get(source_bucket, {}):
+                return '', 404
+            OBJECTS.setdefault(bucket, {})[key] = (OBJECTS[source_bucket][source_key][0], time.time())
+            return _xml_('<CopyObjectResult></CopyObjectResult>')
+        OBJECTS.setdefault(bucket, {})[key] = (request.get_data(), time.time())
+    return '', 200, {'ETag': f'"{uuid.uuid4().hex}"'}
+
+
+@app.route('/<bucket>/<path:key>', methods=['POST'])
+def multipart(bucket, key):
+    with LOCK:
+        if 'uploads' in request.args:
+            upload_id = uuid.uuid4().hex
+            UPLOADS[upload_id] = {}
+            return _xml_(f'<InitiateMultipartUploadResult xmlns="{XMLNS}"><Bucket>{bucket}</Bucket>'
+                         f'<Key>{key}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+        parts = UPLOADS.pop(request.args['uploadId'], None)
+        if parts is None:
+            return '', 404
+        OBJECTS.setdefault(bucket, {})[key] = (b''.join(parts[number] for number in sorted(parts)), time.time())
+        STATS['multipart_uploads'] += 1
+    return _xml_(f'<CompleteMultipartUploadResult xmlns="{XMLNS}"><Key>{key}</Key></CompleteMultipartUploadResult>')
+
+
+@app.route('/<bucket>/<path:key>', methods=['GET'])
+def get_object(bucket, key):
+    with LOCK:
+        stored = OBJECTS.get(bucket, {}).get(key)
+    if stored is None:
+        return '', 404
+    data = stored[0]
+
+    def chunks():
+        for offset in range(0, len(data), 4096):
+            yield data[offset:offset + 4096]
+    return Response(chunks(), mimetype='application/octet-stream', headers={'Content-Length': str(len(data))})
+
+
+@app.route('/<bucket>/<path:key>', methods=['DELETE'])
+def delete_object(bucket, key):
+    with LOCK:
+        if 'uploadId' in request.args:
+            UPLOADS.pop(request.args['uploadId'], None)
+        else:
+            OBJECTS.get(bucket, {}).pop(key, None)
+    return '', 204
+
+
+if __name__ == '__main__':
+    app.run(host=MOCK_ADDRESS, port=int(S3_PORT))
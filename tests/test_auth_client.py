@@ -0,0 +1,103 @@
+import json
+import threading
+import time
+import unittest
+from unittest import mock
+
+import requests
+
+from blobapi.auth_client import CircuitBreaker, Client
+from blobapi.errors import ServiceError, UserNotExists
+
+
+class Response:
+    def __init__(self, status_code, user=None):
+        self.status_code = status_code
+        self.content = json.dumps({'user': user}).encode('utf-8')
+
+
+class FakeAuthService:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+        self.down = False
+        self.lock = threading.Lock()
+
+    def get(self, url, **kwargs):
+        with self.lock:
+            self.calls += 1
+        time.sleep(self.delay)
+        if self.down:
+            raise requests.ConnectionError('auth service is down')
+        token = url.rsplit('/', 1)[-1]
+        if token.endswith('_TOKEN'):
+            return Response(200, token[:-len('_TOKEN')])
+        return Response(404)
+
+
+class TestAuthClient(unittest.TestCase):
+
+    def setUp(self):
+        self.service = FakeAuthService()
+        patcher = mock.patch('blobapi.auth_client.requests.get', side_effect=self.service.get)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def client(self, **kwargs):
+        return Client('http://auth', check_service=False, **kwargs)
+
+    def test_concurrent_lookups_are_coalesced(self):
+        self.service.delay = 0.1
+        client = self.client()
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(client.token_owner('USER_TOKEN')))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['USER'] * 10)
+        self.assertEqual(self.service.calls, 1)
+
+    def test_unknown_token(self):
+        client = self.client()
+        with self.assertRaises(UserNotExists):
+            client.token_owner('wrong')
+        self.assertEqual(client.token_owner('USER_TOKEN'), 'USER')
+
+    def test_breaker_fails_fast(self):
+        client = self.client(breaker=CircuitBreaker(failures=2, reset_timeout=60))
+        self.service.down = True
+        for _ in range(2):
+            with self.assertRaises(ServiceError):
+                client.token_owner('USER_TOKEN')
+        with self.assertRaises(ServiceError):
+            client.token_owner('USER_TOKEN')
+        self.assertEqual(self.service.calls, 2)
+
+    def test_breaker_recovers(self):
+        breaker = CircuitBreaker(failures=1, reset_timeout=0.05)
+        client = self.client(breaker=breaker)
+        self.service.down = True
+        with self.assertRaises(ServiceError):
+            client.token_owner('USER_TOKEN')
+        self.assertEqual(breaker.state, 'open')
+        self.service.down = False
+        time.sleep(0.06)
+        self.assertEqual(client.token_owner('USER_TOKEN'), 'USER')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_stale_results_during_outage(self):
+        client = self.client(stale_grace=60)
+        self.assertEqual(client.token_owner('USER_TOKEN'), 'USER')
+        self.service.down = True
+        self.assertEqual(client.token_owner('USER_TOKEN'), 'USER')
+        with self.assertRaises(ServiceError):
+            client.token_owner('OTHER_TOKEN')
+
+    def test_no_stale_results_by_default(self):
+        client = self.client()
+        client.token_owner('USER_TOKEN')
+        self.service.down = True
+        with self.assertRaises(ServiceError):
+            client.token_owner('USER_TOKEN')
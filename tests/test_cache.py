@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.cache import BlobCache
+
+USER1 = 'test_user1'
+
+
+class TestBlobCache(unittest.TestCase):
+
+    def test_lru_eviction_by_bytes(self):
+        cache = BlobCache(max_bytes=10, max_object_size=10)
+        cache.put('a', 1, b'aaaa')
+        cache.put('b', 1, b'bbbb')
+        self.assertEqual(cache.get('a', 1), b'aaaa')
+        cache.put('c', 1, b'cccc')
+        # "b" was the least recently used entry
+        self.assertIsNone(cache.get('b', 1))
+        self.assertEqual(cache.get('a', 1), b'aaaa')
+        self.assertEqual(cache.stats['bytes'], 8)
+        self.assertEqual(cache.stats['evictions'], 1)
+
+    def test_object_size_cap(self):
+        cache = BlobCache(max_bytes=100, max_object_size=4)
+        cache.put('a', 1, b'too big')
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(cache.stats['entries'], 0)
+
+    def test_versions_and_invalidation(self):
+        cache = BlobCache(max_bytes=100, max_object_size=100)
+        cache.put('a', 1, b'old')
+        cache.put('a', 2, b'new')
+        self.assertIsNone(cache.get('a', 1))
+        self.assertEqual(cache.stats['bytes'], 3)
+        cache.invalidate('a')
+        self.assertIsNone(cache.get('a', 2))
+        self.assertEqual(cache.stats['bytes'], 0)
+
+    def test_stats(self):
+        cache = BlobCache(max_bytes=100, max_object_size=100)
+        cache.put('a', 1, b'data')
+        cache.get('a', 1)
+        cache.get('b', 1)
+        self.assertEqual(cache.stats['hits'], 1)
+        self.assertEqual(cache.stats['misses'], 1)
+        self.assertEqual(cache.stats['hit_ratio'], 0.5)
+
+
+class TestBlobDBCache(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(db_file=Path(self.workspace.name).joinpath('dbfile.json'),
+                                   cache_size=1024, cache_max_object=512)
+
+    def tearDown(self):
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def test_small_blob_served_from_cache(self):
+        blob_id, _ = self.blob_service.newBlob(FileStorage(stream=BytesIO(b'small'), filename='small.txt'), USER1)
+        self.assertEqual(self.blob_service.openBlob(blob_id)['data'], b'small')
+        self.assertEqual(self.blob_service.openBlob(blob_id)['data'], b'small')
+        self.assertEqual(self.blob_service.metrics()['cache']['hits'], 1)
+
+    def test_big_blob_not_cached(self):
+        blob_id, _ = self.blob_service.newBlob(FileStorage(stream=BytesIO(b'x' * 600), filename='big.txt'), USER1)
+        self.assertIsNone(self.blob_service.openBlob(blob_id)['data'])
+        self.assertEqual(self.blob_service.metrics()['cache']['entries'], 0)
+
+    def test_update_and_remove_invalidate(self):
+        blob_id, _ = self.blob_service.newBlob(FileStorage(stream=BytesIO(b'v1'), filename='small.txt'), USER1)
+        self.blob_service.openBlob(blob_id)
+        self.blob_service.updateBlob(blob_id, FileStorage(stream=BytesIO(b'v2'), filename='small.txt'), USER1)
+        blob_info = self.blob_service.openBlob(blob_id)
+        self.assertEqual(blob_info['version'], 2)
+        self.assertEqual(blob_info['data'], b'v2')
+        self.blob_service.removeBlob(blob_id, USER1)
+        self.assertEqual(self.blob_service.metrics()['cache']['entries'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
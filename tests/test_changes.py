@@ -0,0 +1,124 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from flask import Flask
+
+from blobapi.blob_service import BlobDB
+from blobapi.changes import ChangeFeed
+from blobapi.server import routeApp
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+
+
+class TestChangeFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(Path(self.workspace.name).joinpath('dbfile.json'),
+                                   storage=str(Path(self.workspace.name).joinpath('storage')))
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def events(self, result):
+        return [(change['event'], change['blobId']) for change in result['changes']]
+
+    def test_changes_visible_to_each_user(self):
+        feed = ChangeFeed(self.blob_service)
+        start = feed.last
+        public_id, _ = self.blob_service.newBlob(upload(b'public', 'public.txt'), USER1)
+        private_id, _ = self.blob_service.newBlob(upload(b'private', 'private.txt'), USER1)
+        self.blob_service.setVisibility(private_id, False, USER1)
+        self.blob_service.updateBlob(private_id, upload(b'changed', 'private.txt'), USER1)
+        self.blob_service.setGroup('team', [USER2], USER1)
+        self.blob_service.addPermission(private_id, ['group:team'], USER1)
+        self.blob_service.removeBlob(private_id, USER1)
+
+        owner = feed.read(start, USER1)
+        self.assertEqual(self.events(owner), [('create', public_id), ('create', private_id),
+                                              ('visibility', private_id), ('update', private_id),
+                                              ('acl', private_id), ('delete', private_id)])
+        self.assertEqual(owner['next'], feed.last)
+        # The private blob was visible for USER2 (through a group) only until it was hidden, and since the
+        # ACL change. Hiding it is the last change visible for everyone else
+        self.assertEqual(self.events(feed.read(start, USER2)), [('create', public_id), ('create', private_id),
+                                                                ('visibility', private_id), ('acl', private_id),
+                                                                ('delete', private_id)])
+        self.assertEqual(self.events(feed.read(start)), [('create', public_id), ('create', private_id),
+                                                         ('visibility', private_id)])
+        self.assertEqual(feed.read(owner['next'], USER1)['changes'], [])
+
+    def test_reset_when_changes_are_lost(self):
+        feed = ChangeFeed(self.blob_service, size=2)
+        start = feed.last
+        for index in range(3):
+            self.blob_service.newBlob(upload(b'data', f'blob{index}.txt'), USER1)
+        self.assertTrue(feed.read(start, USER1)['reset'])
+        self.assertFalse(feed.read(start + 1, USER1)['reset'])
+        # Sequence numbers from the future (i.e. before a restart)
+        self.assertTrue(feed.read(feed.last + 10, USER1)['reset'])
+
+    def test_reset_when_group_members_change(self):
+        feed = ChangeFeed(self.blob_service)
+        blob_id, _ = self.blob_service.newBlob(upload(b'data', 'blob.txt'), USER1)
+        self.blob_service.setVisibility(blob_id, False, USER1)
+        self.blob_service.setGroup('team', [USER2], USER1)
+        self.blob_service.addPermission(blob_id, ['group:team'], USER1)
+        start = feed.last
+        # USER2 can no longer read the blob, but no event of the blob says so
+        self.blob_service.setGroup('team', [], USER1)
+        result = feed.read(start, USER2)
+        self.assertTrue(result['reset'])
+        self.assertEqual(result['next'], feed.last)
+        self.assertFalse(feed.read(result['next'], USER2)['reset'])
+        # Other users keep following the feed
+        self.assertFalse(feed.read(start, USER1)['reset'])
+        self.assertFalse(feed.read(start)['reset'])
+
+        start = feed.last
+        self.blob_service.setGroup('team', [USER2], USER1)
+        self.assertTrue(feed.read(start, USER2)['reset'])
+        start = feed.last
+        self.blob_service.removeGroup('team', USER1)
+        self.assertTrue(feed.read(start, USER2)['reset'])
+        self.assertEqual(self.events(feed.read(start, USER1)), [('acl', blob_id)])
+
+        # Groups granted nowhere do not change what anybody can read
+        start = feed.last
+        self.blob_service.setGroup('other', [USER2], USER1)
+        self.assertEqual(feed.read(start, USER2), {"changes": [], "next": start, "reset": False})
+
+    def test_long_poll_wakes_up(self):
+        feed = ChangeFeed(self.blob_service)
+        start = feed.last
+        timer = threading.Timer(0.1, self.blob_service.newBlob, (upload(b'data', 'blob.txt'), USER1))
+        timer.start()
+        result = feed.read(start, USER1, timeout=5)
+        timer.join()
+        self.assertEqual([change['event'] for change in result['changes']], ['create'])
+
+    def test_changes_endpoint(self):
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service, feed=ChangeFeed(self.blob_service))
+        client = app.test_client()
+        start = client.get('/api/v1/changes', headers={'AuthToken': USER1}).json['next']
+        blob_id, _ = self.blob_service.newBlob(upload(b'data', 'blob.txt'), USER1)
+        response = client.get(f'/api/v1/changes?since={start}&wait=0', headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.events(response.json), [('create', blob_id)])
+        self.assertEqual(client.get('/api/v1/changes?since=x').status_code, 400)
+
+        response = client.get('/api/v1/changes', headers={'AuthToken': USER1, 'Accept': 'text/event-stream',
+                                                          'Last-Event-ID': str(start)}, buffered=False)
+        self.assertEqual(response.mimetype, 'text/event-stream')
+        event = next(response.response)
+        response.close()
+        self.assertIn(f'event: create\ndata: {{"blobId": "{blob_id}"}}', event.decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
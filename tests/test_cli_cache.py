@@ -0,0 +1,112 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+from flask import Flask
+from werkzeug.serving import make_server
+
+from blobapi.blob_service import BlobDB
+from blobapi.changes import ChangeFeed
+from blobapi.server import routeApp
+from cli.blobservice import BlobService
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+
+
+class TestCliCache(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(Path(self.workspace.name).joinpath('dbfile.json'),
+                                   storage=os.path.join(self.workspace.name, 'storage'), cache_size=0)
+        self.feed = ChangeFeed(self.blob_service)
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service, feed=self.feed)
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.cache_file = os.path.join(self.workspace.name, 'cache', 'metadata.sqlite')
+        downloads = os.path.join(self.workspace.name, 'download')
+        os.makedirs(downloads)
+        patcher = mock.patch('cli.blobservice.DOWNLOAD_FOLDER', downloads)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.workspace.cleanup()
+
+    def upload(self, name, user=USER1):
+        return self.blob_service.newBlob(upload(name.encode(), name), user)[0]
+
+    def client(self, user):
+        return BlobService(self.url, authToken=user, user=user, cacheFile=self.cache_file)
+
+    def test_delta_listing(self):
+        first = self.upload('first.txt')
+        self.assertEqual(self.client(USER1).getBlobs(), [first])
+
+        # A new client (i.e. the next run of the shell) only asks for the changes
+        second = self.upload('second.txt')
+        self.blob_service.removeBlob(first, USER1)
+        client = self.client(USER1)
+        with mock.patch('cli.blobservice.requests.get', wraps=requests.get) as get:
+            self.assertEqual(client.getBlobs(), [second])
+            self.assertTrue(client.blobExists(second))
+            self.assertFalse(client.blobExists(first))
+        urls = [call.args[0] for call in get.call_args_list]
+        self.assertNotIn(f'{self.url}/api/v1/blobs', urls)
+        self.assertEqual(urls, [f'{self.url}/api/v1/changes'] * 3)
+
+    def test_revoked_blobs_are_removed(self):
+        blob_id = self.upload('shared.txt')
+        self.blob_service.setVisibility(blob_id, False, USER1)
+        self.blob_service.addPermission(blob_id, [USER2], USER1)
+        client = self.client(USER2)
+        self.assertEqual(client.getBlobs(), [blob_id])
+        self.blob_service.removePermission(blob_id, USER2, USER1)
+        self.assertEqual(client.getBlobs(), [])
+
+    def test_group_membership_changes(self):
+        blob_id = self.upload('team.txt')
+        self.blob_service.setVisibility(blob_id, False, USER1)
+        self.blob_service.setGroup('team', [USER2], USER1)
+        self.blob_service.addPermission(blob_id, ['group:team'], USER1)
+        client = self.client(USER2)
+        self.assertEqual(client.getBlobs(), [blob_id])
+        # No event of the blob tells the client, the feed makes it list the blobs again
+        self.blob_service.setGroup('team', [], USER1)
+        with mock.patch('cli.blobservice.requests.get', wraps=requests.get) as get:
+            self.assertEqual(client.getBlobs(), [])
+        self.assertIn(f'{self.url}/api/v1/blobs', [call.args[0] for call in get.call_args_list])
+        self.blob_service.setGroup('team', [USER2], USER1)
+        self.assertEqual(client.getBlobs(), [blob_id])
+        self.assertTrue(client.blobExists(blob_id))
+        # Listings of other users are cached apart
+        self.assertEqual(self.client(USER1).getBlobs(), [blob_id])
+
+    def test_reset_lists_again(self):
+        client = self.client(USER1)
+        self.assertEqual(client.getBlobs(), [])
+        blob_id = self.upload('blob.txt')
+        with mock.patch.object(self.feed, '_last_', self.feed.last - 10 ** 9):
+            # The cursor of the cache is from the future: the listing is fetched again
+            self.assertEqual(client.getBlobs(), [blob_id])
+
+    def test_unchanged_blobs_are_not_downloaded_again(self):
+        blob_id = self.upload('blob.txt')
+        client = self.client(USER1)
+        client.getBlob(blob_id)
+        with mock.patch('cli.blobservice.requests.get', wraps=requests.get) as get:
+            client.getBlob(blob_id)
+        self.assertIn('If-None-Match', get.call_args.kwargs['headers'])
+
+
+if __name__ == '__main__':
+    unittest.main()
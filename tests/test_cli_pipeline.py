@@ -0,0 +1,141 @@
+import io
+import logging
+import threading
+import time
+import unittest
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+from cli.pipeline import Pipeline, parse_script
+from cli.shell import Shell
+
+
+class MockBlobClient:
+    """Blob client which takes some time for each request"""
+
+    def __init__(self, delay=0.2):
+        self.delay = delay
+        self.blobs = {}
+        self.running = 0
+        self.most_running = 0
+        self._lock_ = threading.Lock()
+
+    def _request_(self):
+        with self._lock_:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        time.sleep(self.delay)
+        with self._lock_:
+            self.running -= 1
+
+    def createBlob(self, path):
+        self._request_()
+        blob_id = f'id-{path}'
+        self.blobs[blob_id] = path
+        return SimpleNamespace(blobId=blob_id)
+
+    def getBlob(self, blob_id):
+        self._request_()
+        if blob_id not in self.blobs:
+            raise Exception(f'{blob_id} not found')
+        return SimpleNamespace(blobId=blob_id)
+
+    def deleteBlob(self, blob_id):
+        self._request_()
+        self.blobs.pop(blob_id)
+
+    def getBlobs(self):
+        self._request_()
+        return sorted(self.blobs)
+
+
+class TestCliPipeline(unittest.TestCase):
+
+    def run_script(self, script, jobs=4, stop_on_error=True):
+        shell = Shell(stdout=io.StringIO())
+        shell.blob_client = self.client = MockBlobClient()
+        shell.interactive = False
+        shell.stop_on_error = stop_on_error
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertLogs(level=logging.INFO) as logs:
+            ok = Pipeline(shell, jobs).run(script.splitlines())
+        return ok, output.getvalue().splitlines(), logs.output
+
+    def test_dependencies(self):
+        commands = parse_script(['create_blob a', 'create_blob b', '# comment', 'get_blob x', 'get_blobs',
+                                 'delete_blob x', 'get_blob $1', 'login user', 'get_blob x'])
+        by_line = {command.number: command for command in commands}
+        depends = {number: {depend.number for depend in command.depends} for number, command in by_line.items()}
+        self.assertNotIn(3, by_line)
+        self.assertEqual(depends[1], set())
+        self.assertEqual(depends[2], set())
+        self.assertEqual(depends[4], set())
+        self.assertEqual(depends[5], {1, 2})
+        self.assertEqual(depends[6], {4, 5})
+        self.assertEqual(depends[7], {1})
+        self.assertEqual(depends[8], {1, 2, 4, 5, 6, 7})
+        self.assertEqual(depends[9], {8})
+
+    def test_independent_commands_run_concurrently(self):
+        start = time.perf_counter()
+        ok, output, logs = self.run_script('\n'.join(f'create_blob file{index}' for index in range(4)) +
+                                           '\nget_blobs\nget_blob $1\ndelete_blob $2')
+        elapsed = time.perf_counter() - start
+        self.assertTrue(ok)
+        self.assertEqual(self.client.most_running, 4)
+        # Four concurrent creations, the listing and the download, and the deletion (after the listing)
+        self.assertLess(elapsed, 0.2 * 5)
+        self.assertEqual(output, [f'id-file{index}' for index in range(4)] +
+                         [f'id-file{index}' for index in range(4)] + ['id-file0'])
+        self.assertNotIn('id-file1', self.client.blobs)
+        self.assertTrue(any('7 commands in' in line for line in logs))
+
+    def test_stop_on_error(self):
+        ok, output, logs = self.run_script('create_blob a\nget_blob missing\ncreate_blob b\nget_blob $1', jobs=1)
+        self.assertFalse(ok)
+        self.assertEqual(output, ['id-a'])
+        self.assertIn('missing not found', logs[0])
+        self.assertNotIn('id-b', self.client.blobs)
+
+        ok, output, _ = self.run_script('create_blob a\nget_blob missing\ncreate_blob b\nget_blob $1',
+                                        stop_on_error=False)
+        self.assertTrue(ok)
+        self.assertEqual(output, ['id-a', 'id-b', 'id-a'])
+
+    def test_references_without_pipeline(self):
+        script = 'create_blob a\n# comment\n\ncreate_blob b\nget_blob $4\ndelete_blob $1\nget_blobs\nget_blob $5'
+        ok, pipelined, _ = self.run_script(script)
+        self.assertTrue(ok)
+        shell = Shell(stdin=io.StringIO(script), stdout=io.StringIO())
+        shell.blob_client = self.client = MockBlobClient(delay=0)
+        shell.interactive = False
+        shell.use_rawinput = False
+        output = io.StringIO()
+        with redirect_stdout(output):
+            shell.cmdloop()
+        self.assertEqual(output.getvalue().splitlines(), pipelined)
+        self.assertEqual(pipelined, ['id-a', 'id-b', 'id-b', 'id-b', 'id-b'])
+
+        # References to a later line or to a failed one are errors, with and without the pipeline
+        for jobs in (1, 4):
+            ok, output, logs = self.run_script('get_blob $2\ncreate_blob a', jobs=jobs)
+            self.assertFalse(ok)
+            self.assertIn('line 2 failed', logs[0])
+        shell = Shell(stdin=io.StringIO('get_blob missing\nget_blob $1\ncreate_blob a'), stdout=io.StringIO())
+        shell.blob_client = self.client = MockBlobClient(delay=0)
+        shell.use_rawinput = False
+        shell.stop_on_error = False
+        with self.assertLogs(level=logging.ERROR) as logs:
+            shell.cmdloop()
+        self.assertIn('line 1 failed', logs.output[1])
+        self.assertIn('id-a', self.client.blobs)
+
+    def test_failed_reference(self):
+        ok, output, logs = self.run_script('get_blob missing\nget_blob $1', stop_on_error=False)
+        self.assertTrue(ok)
+        self.assertEqual(output, [])
+        self.assertIn('line 1 failed', logs[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+import gzip
+import hashlib
+import os
+import tempfile
+import unittest
+from io import BytesIO
+from pathlib import Path
+
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.compression import GZIP
+from blobapi.server import routeApp
+
+USER1 = 'test_user1'
+TEXT = b'2024-01-01 INFO request served in 12ms\n' * 2000
+
+
+class MockClient:
+    def token_owner(self, auth_token):
+        return USER1
+
+
+class TestCompression(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(db_file=Path(self.workspace.name).joinpath('dbfile.json'), compression=GZIP)
+
+    def tearDown(self):
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def test_compressible_blob_stored_compressed(self):
+        blob_id, url = self.blob_service.newBlob(FileStorage(stream=BytesIO(TEXT), filename='log.txt'), USER1)
+        self.assertEqual(self.blob_service._blobs_[blob_id]['encoding'], GZIP)
+        self.assertEqual(self.blob_service._blobs_[blob_id]['size'], len(TEXT))
+        self.assertLess(os.path.getsize(url), len(TEXT) / 5)
+        with gzip.open(url) as contents:
+            self.assertEqual(contents.read(), TEXT)
+
+    def test_incompressible_blob_stored_as_is(self):
+        data = os.urandom(4096)
+        blob_id, url = self.blob_service.newBlob(FileStorage(stream=BytesIO(data), filename='random.bin'), USER1)
+        self.assertNotIn('encoding', self.blob_service._blobs_[blob_id])
+        with open(url, 'rb') as contents:
+            self.assertEqual(contents.read(), data)
+
+    def test_hash_of_original_contents(self):
+        blob_id, _ = self.blob_service.newBlob(FileStorage(stream=BytesIO(TEXT), filename='log.txt'), USER1)
+        hash_data = self.blob_service.getBlobHash(blob_id, USER1, 'sha256')
+        self.assertEqual(hash_data['hexdigest'], hashlib.sha256(TEXT).hexdigest())
+
+    def test_update_changes_encoding(self):
+        blob_id, _ = self.blob_service.newBlob(FileStorage(stream=BytesIO(TEXT), filename='log.txt'), USER1)
+        data = os.urandom(4096)
+        self.blob_service.updateBlob(blob_id, FileStorage(stream=BytesIO(data), filename='log.txt'), USER1)
+        self.assertNotIn('encoding', self.blob_service._blobs_[blob_id])
+        self.assertEqual(self.blob_service.getBlobHash(blob_id, USER1)['hexdigest'], hashlib.md5(data).hexdigest())
+
+    def test_download_negotiation(self):
+        blob_id, _ = self.blob_service.newBlob(FileStorage(stream=BytesIO(TEXT), filename='log.txt'), USER1)
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service)
+        app.testing = True
+        client = app.test_client()
+
+        response = client.get(f'/api/v1/blob/{blob_id}', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], GZIP)
+        self.assertEqual(gzip.decompress(response.data), TEXT)
+
+        response = client.get(f'/api/v1/blob/{blob_id}', headers={'Accept-Encoding': 'identity'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.data, TEXT)
+
+
+if __name__ == '__main__':
+    unittest.main()
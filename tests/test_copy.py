@@ -0,0 +1,132 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from flask import Flask
+
+from blobapi.blob_service import BlobDB
+from blobapi.errors import ObjectAlreadyExists, UnauthorizedBlob
+from blobapi.server import routeApp
+from blobapi.storage import LocalBackend
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+
+
+class TestCopyBlob(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.storage = os.path.join(self.workspace.name, 'storage')
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def new_service(self, **options):
+        return BlobDB(Path(self.workspace.name).joinpath('dbfile.json'), storage=self.storage, cache_size=0,
+                      **options)
+
+    def read(self, blob_service, blob_id):
+        return b''.join(blob_service.readBlob(blob_service.storedBlob(blob_id)))
+
+    def test_backend_copy_shares_the_file(self):
+        source = os.path.join(self.storage, 'source.txt')
+        with LocalBackend().writer(source) as contents:
+            contents.write(b'data')
+        method = LocalBackend().copy(source, os.path.join(self.storage, 'copy.txt'))
+        self.assertIn(method, ('reflink', 'hardlink', 'copy'))
+        if method == 'hardlink':
+            self.assertTrue(os.path.samefile(source, os.path.join(self.storage, 'copy.txt')))
+
+    def test_copy_and_update_either(self):
+        blob_service = self.new_service(compression='none')
+        blob_id, _ = blob_service.newBlob(upload(b'original', 'blob.txt'), USER1)
+        copy_id, url = blob_service.copyBlob(blob_id, USER1, name='copy.txt')
+        self.assertEqual(url, os.path.join(self.storage, 'copy.txt'))
+        self.assertEqual(self.read(blob_service, copy_id), b'original')
+        self.assertEqual(sum(blob_service.metrics()['copies'].values()), 1)
+
+        # Updating a copy never changes the other one
+        blob_service.updateBlob(copy_id, upload(b'changed', 'copy.txt'), USER1)
+        self.assertEqual(self.read(blob_service, blob_id), b'original')
+        self.assertEqual(self.read(blob_service, copy_id), b'changed')
+        blob_service.updateBlob(blob_id, upload(b'source changed', 'blob.txt'), USER1)
+        self.assertEqual(self.read(blob_service, copy_id), b'changed')
+        blob_service.removeBlob(blob_id, USER1)
+        self.assertEqual(self.read(blob_service, copy_id), b'changed')
+
+    def test_real_copy_without_the_lock(self):
+        blob_service = self.new_service(compression='none')
+        blob_id, _ = blob_service.newBlob(upload(b'original', 'blob.txt'), USER1)
+        backend_copy = blob_service.backend.copy
+        seen = []
+
+        def slow_copy(key, new_key):
+            method = backend_copy(key, new_key)
+            if os.path.basename(new_key) != 'copy.txt':
+                # Versions kept by updateBlob
+                return method
+            seen.append(method)
+            if len(seen) == 1:
+                # The catalog can be changed meanwhile, but not the name of the copy
+                with self.assertRaises(ObjectAlreadyExists):
+                    blob_service.newBlob(upload(b'other', 'copy.txt'), USER2)
+                blob_service.updateBlob(blob_id, upload(b'updated', 'blob.txt'), USER1)
+            return 'copy'
+        with mock.patch.object(blob_service.backend, 'copy', slow_copy):
+            copy_id, _ = blob_service.copyBlob(blob_id, USER1, name='copy.txt')
+        # Copied again after the update, so the contents match the record
+        self.assertEqual(len(seen), 2)
+        self.assertEqual(self.read(blob_service, copy_id), b'updated')
+        self.assertEqual(blob_service.storedBlob(copy_id).digest, blob_service.storedBlob(blob_id).digest)
+
+    def test_copy_in_packs(self):
+        blob_service = self.new_service(packs=True, pack_threshold=1024, compact_interval=0)
+        blob_id, _ = blob_service.newBlob(upload(b'small', 'small.txt'), USER1)
+        copy_id, _ = blob_service.copyBlob(blob_id, USER1)
+        self.assertEqual(blob_service.storedBlob(copy_id).location, blob_service.storedBlob(blob_id).location)
+        blob_service.removeBlob(blob_id, USER1)
+        self.assertEqual(self.read(blob_service, copy_id), b'small')
+        blob_service.close()
+
+    def test_permissions(self):
+        blob_service = self.new_service()
+        blob_id, _ = blob_service.newBlob(upload(b'data', 'blob.txt'), USER1)
+        blob_service.setVisibility(blob_id, False, USER1)
+        with self.assertRaises(UnauthorizedBlob):
+            blob_service.copyBlob(blob_id, USER2)
+        blob_service.addPermission(blob_id, [USER2], USER1)
+        copy_id, _ = blob_service.copyBlob(blob_id, USER2)
+        copy = blob_service.storedBlob(copy_id)
+        self.assertEqual(copy.owner, USER2)
+        self.assertFalse(copy.public)
+        self.assertEqual(copy.users, frozenset())
+        # Only the owner of the source can give a copy away
+        with self.assertRaises(UnauthorizedBlob):
+            blob_service.copyBlob(blob_id, USER2, owner=USER1)
+        with self.assertRaises(ObjectAlreadyExists):
+            blob_service.copyBlob(blob_id, USER1, name='blob.txt')
+
+    def test_copy_endpoint(self):
+        blob_service = self.new_service()
+        blob_id, _ = blob_service.newBlob(upload(b'data', 'blob.txt'), USER1)
+        app = Flask(__name__)
+        routeApp(app, MockClient(), blob_service)
+        client = app.test_client()
+        response = client.post(f'/api/v1/blob/{blob_id}/copy', json={'name': 'copy.txt', 'owner': USER2},
+                               headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 201)
+        copy_id = response.json['blobId']
+        self.assertEqual(client.get(f'/api/v1/blob/{copy_id}').data, b'data')
+        self.assertEqual(blob_service.storedBlob(copy_id).owner, USER2)
+        response = client.post(f'/api/v1/blob/{blob_id}/copy', json={'name': 'copy.txt'}, headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 409)
+        response = client.post('/api/v1/blob/missing/copy', headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
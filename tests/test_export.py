@@ -0,0 +1,110 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import threading
+import unittest
+import zipfile
+from pathlib import Path
+from unittest import mock
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from blobapi.archive import MANIFEST_NAME, stream_archive
+from blobapi.blob_service import BlobDB
+from blobapi.server import routeApp
+from cli.blobservice import BlobService
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+
+
+class TestExport(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(Path(self.workspace.name).joinpath('dbfile.json'),
+                                   storage=os.path.join(self.workspace.name, 'storage'), cache_size=0,
+                                   compression='gzip')
+        self.contents = {
+            'first.txt': b'first ' * 1000,
+            'second.bin': os.urandom(1500),
+            'empty.txt': b'',
+        }
+        self.ids = {name: self.blob_service.newBlob(upload(data, name), USER1)[0]
+                    for name, data in self.contents.items()}
+        self.private, _ = self.blob_service.newBlob(upload(b'private', 'private.txt'), USER2)
+        self.blob_service.setVisibility(self.private, False, USER2)
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service)
+        self.app = app
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def export(self, **body):
+        response = self.client.post('/api/v1/blobs/export', headers={'AuthToken': USER1}, json=body)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def check_manifest(self, manifest, members):
+        self.assertEqual({entry['name']: entry['sha256'] for entry in manifest['blobs']},
+                         {name: hashlib.sha256(data).hexdigest() for name, data in self.contents.items()})
+        self.assertEqual(members, self.contents)
+
+    def test_tar(self):
+        for archive_format, mode in (('tar', 'r:'), ('tar.gz', 'r:gz')):
+            response = self.export(blobs=list(self.ids.values()) + [self.private, 'missing'], format=archive_format)
+            with tarfile.open(fileobj=io.BytesIO(response.data), mode=mode) as archive:
+                members = {member.name: archive.extractfile(member).read() for member in archive}
+            manifest = json.loads(members.pop(MANIFEST_NAME))
+            self.check_manifest(manifest, members)
+            self.assertEqual([entry['blobId'] for entry in manifest['skipped']], [self.private, 'missing'])
+
+    def test_zip_with_filter(self):
+        response = self.export(owner=USER1, format='zip')
+        self.assertEqual(response.mimetype, 'application/zip')
+        with zipfile.ZipFile(io.BytesIO(response.data)) as archive:
+            members = {name: archive.read(name) for name in archive.namelist()}
+        self.check_manifest(json.loads(members.pop(MANIFEST_NAME)), members)
+
+        response = self.export(pattern='*.txt')
+        with tarfile.open(fileobj=io.BytesIO(response.data)) as archive:
+            self.assertEqual(sorted(archive.getnames()), sorted([MANIFEST_NAME, 'first.txt', 'empty.txt']))
+        self.assertEqual(self.client.post('/api/v1/blobs/export', json={'format': 'rar'}).status_code, 400)
+
+    def test_changed_contents(self):
+        # Contents not matching the size announced are cut (or padded) and reported
+        blobs = [{"blobId": "a", "name": "a", "size": 3, "chunks": iter([b'abcdef'])},
+                 {"blobId": "b", "name": "b", "size": 3, "chunks": iter([b'b'])}]
+        with tarfile.open(fileobj=io.BytesIO(b''.join(stream_archive(blobs)))) as archive:
+            self.assertEqual(archive.extractfile('a').read(), b'abc')
+            self.assertEqual(archive.extractfile('b').read(), b'b\0\0')
+            manifest = json.load(archive.extractfile(MANIFEST_NAME))
+        self.assertEqual([entry['error'] for entry in manifest['blobs']], ['changed while exporting'] * 2)
+
+    def test_cli_bulk_download(self):
+        server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        downloads = os.path.join(self.workspace.name, 'download')
+        os.makedirs(downloads)
+        with mock.patch('cli.blobservice.DOWNLOAD_FOLDER', downloads):
+            client = BlobService(f'http://127.0.0.1:{server.server_port}', authToken=USER1, cacheFile=None)
+            manifest = client.exportBlobs()
+            self.assertEqual(len(manifest['blobs']), 3)
+            for name, data in self.contents.items():
+                self.assertEqual(Path(downloads).joinpath(name).read_bytes(), data)
+
+            archive = os.path.join(self.workspace.name, 'blobs.zip')
+            manifest = client.exportBlobs([self.ids['first.txt']], archive=archive, archiveFormat='zip')
+            self.assertEqual([entry['name'] for entry in manifest['blobs']], ['first.txt'])
+
+
+if __name__ == '__main__':
+    unittest.main()
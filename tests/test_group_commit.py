@@ -0,0 +1,78 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from io import BytesIO
+from pathlib import Path
+
+from werkzeug.datastructures import FileStorage
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.group_commit import GroupCommitter
+
+USER1 = 'test_user1'
+
+
+class TestGroupCommitter(unittest.TestCase):
+
+    def test_concurrent_commits_are_coalesced(self):
+        writes = []
+
+        def slow_write():
+            time.sleep(0.01)
+            writes.append(time.monotonic())
+
+        committer = GroupCommitter(slow_write, window=0.02, batch_size=1000)
+        threads = [threading.Thread(target=committer.commit) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        committer.close()
+        self.assertEqual(committer.stats['requests'], 20)
+        self.assertLess(len(writes), 20)
+
+    def test_failed_write_is_reported(self):
+        def broken_write():
+            raise OSError('disk full')
+
+        committer = GroupCommitter(broken_write, window=0)
+        with self.assertRaises(OSError):
+            committer.commit()
+        committer.close()
+
+
+class TestBlobDBGroupCommit(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.dbfile = Path(self.workspace.name).joinpath('dbfile.json')
+        self.blob_service = BlobDB(db_file=self.dbfile, group_commit=True, commit_window=0.01)
+
+    def tearDown(self):
+        self.blob_service.close()
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def test_acknowledged_changes_are_durable(self):
+        blob_id, _ = self.blob_service.newBlob(FileStorage(stream=BytesIO(b'data'), filename='a.txt'), USER1)
+        threads = [
+            threading.Thread(target=self.blob_service.addPermission, args=(blob_id, [f'user{index}'], USER1))
+            for index in range(16)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with open(self.dbfile, encoding='utf-8') as contents:
+            stored = json.load(contents)
+        self.assertCountEqual(stored[blob_id]['users'], [f'user{index}' for index in range(16)])
+        stats = self.blob_service.metrics()['group_commit']
+        self.assertLess(stats['writes'], stats['requests'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from flask import Flask
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.errors import UnauthorizedBlob, ObjectNotFound
+from blobapi.server import routeApp
+from tests.helpers import MockClient, upload
+
+OWNER = 'owner'
+MEMBER = 'member'
+OTHER = 'other'
+
+
+class TestGroups(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.dbfile = Path(self.workspace.name).joinpath('dbfile.json')
+        self.blob_service = BlobDB(db_file=self.dbfile)
+        self.blob_id = self.new_blob('first.txt')
+        self.blob_service.setVisibility(self.blob_id, False, OWNER)
+
+    def tearDown(self):
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def new_blob(self, name):
+        blob_id, _ = self.blob_service.newBlob(upload(b'data', name), OWNER)
+        return blob_id
+
+    def test_group_grants_access(self):
+        self.blob_service.setGroup('team', [MEMBER], OWNER)
+        self.blob_service.addPermission(self.blob_id, ['group:team'], OWNER)
+        self.assertTrue(self.blob_service.getBlob(self.blob_id, MEMBER))
+        self.assertIn(self.blob_id, self.blob_service.getBlobs(MEMBER)['blobs'])
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.getBlob(self.blob_id, OTHER)
+        self.assertNotIn(self.blob_id, self.blob_service.getBlobs(OTHER)['blobs'])
+
+    def test_membership_changes_are_applied(self):
+        self.blob_service.setGroup('team', [MEMBER], OWNER)
+        self.blob_service.addPermission(self.blob_id, ['group:team'], OWNER)
+        self.blob_service.getBlob(self.blob_id, MEMBER)
+        self.blob_service.setGroup('team', [OTHER], OWNER)
+        self.assertTrue(self.blob_service.getBlob(self.blob_id, OTHER))
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.getBlob(self.blob_id, MEMBER)
+        self.blob_service.removeGroup('team', OWNER)
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.getBlob(self.blob_id, OTHER)
+
+    def test_only_owner_manages_group(self):
+        self.blob_service.setGroup('team', [MEMBER], OWNER)
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.setGroup('team', [OTHER], MEMBER)
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.getGroup('team', OTHER)
+        with self.assertRaises(ObjectNotFound):
+            self.blob_service.removeGroup('unknown', OWNER)
+        self.assertEqual(self.blob_service.getGroup('team', MEMBER)['members'], [MEMBER])
+
+    def test_cannot_grant_unknown_or_foreign_groups(self):
+        # Granted before it exists, anyone could create it and read the blob
+        with self.assertRaises(ObjectNotFound):
+            self.blob_service.addPermission(self.blob_id, ['group:team'], OWNER)
+        self.blob_service.setGroup('team', [OTHER], OTHER)
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.updatePermission(self.blob_id, [MEMBER, 'group:team'], OWNER)
+        self.assertEqual(self.blob_service.getPermissions(self.blob_id, OWNER), [OWNER])
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.getBlob(self.blob_id, OTHER)
+        # Members of a group can grant it
+        self.blob_service.setGroup('team', [OWNER], OTHER)
+        self.blob_service.addPermission(self.blob_id, ['group:team'], OWNER)
+
+    def test_removed_group_is_revoked(self):
+        self.blob_service.setGroup('ops', [MEMBER], OWNER)
+        self.blob_service.addPermission(self.blob_id, ['group:ops', MEMBER], OWNER)
+        self.blob_service.removeGroup('ops', OWNER)
+        self.assertEqual(self.blob_service.getPermissions(self.blob_id, OWNER), [MEMBER, OWNER])
+        # A new group with the same name gets nothing
+        self.blob_service.setGroup('ops', [OTHER], OTHER)
+        self.assertNotIn(self.blob_id, self.blob_service.getBlobs(OTHER)['blobs'])
+        with self.assertRaises(UnauthorizedBlob):
+            self.blob_service.getBlob(self.blob_id, OTHER)
+
+    def test_identical_acls_are_shared(self):
+        second = self.new_blob('second.txt')
+        self.blob_service.updatePermission(self.blob_id, [MEMBER, OTHER], OWNER)
+        self.blob_service.addPermission(second, [OTHER, MEMBER], OWNER)
+        self.assertIs(self.blob_service._blobs_[self.blob_id].users, self.blob_service._blobs_[second].users)
+        self.assertEqual(self.blob_service.metrics()['acl_sets'], 1)
+        self.blob_service.removePermission(second, OTHER, OWNER)
+        self.assertEqual(self.blob_service.metrics()['acl_sets'], 2)
+        self.blob_service.removeBlob(self.blob_id, OWNER)
+        self.assertEqual(self.blob_service.metrics()['acl_sets'], 1)
+
+    def test_groups_are_persisted(self):
+        self.blob_service.setGroup('team', [MEMBER], OWNER)
+        self.blob_service.addPermission(self.blob_id, ['group:team'], OWNER)
+        reloaded = BlobDB(db_file=self.dbfile)
+        self.assertTrue(reloaded.getBlob(self.blob_id, MEMBER))
+
+
+class TestGroupApi(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(db_file=Path(self.workspace.name).joinpath('dbfile.json'))
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service)
+        app.testing = True
+        self.app = app.test_client()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def test_group_endpoints(self):
+        response = self.app.put('/api/v1/group/team', json={'members': [MEMBER]}, headers={'AuthToken': OWNER})
+        self.assertEqual(response.status_code, 204)
+        response = self.app.get('/api/v1/group/team', headers={'AuthToken': MEMBER})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['members'], [MEMBER])
+        response = self.app.put('/api/v1/group/team', json={'members': 'x'}, headers={'AuthToken': OWNER})
+        self.assertEqual(response.status_code, 400)
+        response = self.app.delete('/api/v1/group/team', headers={'AuthToken': MEMBER})
+        self.assertEqual(response.status_code, 401)
+        response = self.app.delete('/api/v1/group/team', headers={'AuthToken': OWNER})
+        self.assertEqual(response.status_code, 204)
+        response = self.app.get('/api/v1/group/team', headers={'AuthToken': OWNER})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import io
+import os
+import tarfile
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from blobapi.blob_service import BlobDB
+from blobapi.server import routeApp
+from cli.blobservice import BlobService, tar_stream
+from tests.helpers import MockClient
+
+USER1 = 'test_user1'
+
+
+def tar_archive(members, mode='w'):
+    data = io.BytesIO()
+    with tarfile.open(fileobj=data, mode=mode) as archive:
+        for name, contents in members:
+            info = tarfile.TarInfo(name)
+            if contents is None:
+                info.type = tarfile.SYMTYPE
+                info.linkname = 'elsewhere'
+                archive.addfile(info)
+            else:
+                info.size = len(contents)
+                archive.addfile(info, io.BytesIO(contents))
+    return data.getvalue()
+
+
+class TestImport(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.db_file = Path(self.workspace.name).joinpath('dbfile.json')
+        self.blob_service = BlobDB(self.db_file, storage=os.path.join(self.workspace.name, 'storage'),
+                                   cache_size=0, quota=(0, 3), quotas={})
+        self.commits = 0
+        write_db = self.blob_service._write_db_
+
+        def counted():
+            self.commits += 1
+            write_db()
+        self.blob_service._write_db_ = counted
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service)
+        self.app = app
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def post(self, data):
+        response = self.client.post('/api/v1/blobs/import', headers={'AuthToken': USER1}, data=data,
+                                    content_type='application/x-tar')
+        self.assertEqual(response.status_code, 200)
+        return response.json
+
+    def test_import(self):
+        members = [('first.txt', b'first'), ('dir/second.txt', b'second' * 1000), ('link', None),
+                   ('first.txt', b'again'), ('third.txt', b''), ('fourth.txt', b'too many')]
+        result = self.post(tar_archive(members, 'w:gz'))
+        self.assertEqual([entry['name'] for entry in result['blobs']], [name for name, _ in members])
+        self.assertEqual([('blobId' in entry) for entry in result['blobs']], [True, True, False, False, True, False])
+        self.assertNotIn('error', result)
+        # A single commit for the whole archive
+        self.assertEqual(self.commits, 1)
+        second = result['blobs'][1]['blobId']
+        self.assertEqual(os.path.basename(self.blob_service.getBlob(second, USER1)), 'dir_second.txt')
+        self.assertEqual(self.blob_service.openBlob(second, USER1)['size'], 6000)
+        self.assertEqual(self.blob_service.usage(USER1)['blobs'], 3)
+        self.assertEqual(self.client.post('/api/v1/blobs/import', data=b'').status_code, 401)
+
+    def test_broken_archive(self):
+        data = tar_archive([('first.txt', b'first'), ('second.txt', b'x' * 10000)])
+        result = self.post(data[:3000])
+        # The members read before the archive breaks are kept
+        self.assertIn('Invalid archive', result['error'])
+        self.assertEqual(result['blobs'][0]['name'], 'first.txt')
+        self.assertEqual(len(self.blob_service.getBlobs(USER1)['blobs']), 1)
+        self.assertIn('Invalid archive', self.post(b'not an archive')['error'])
+
+    def test_cli_import(self):
+        source = Path(self.workspace.name).joinpath('source')
+        source.joinpath('nested').mkdir(parents=True)
+        source.joinpath('a.txt').write_bytes(b'a' * 700)
+        source.joinpath('nested', 'b.txt').write_bytes(b'b')
+        with tarfile.open(fileobj=io.BytesIO(b''.join(tar_stream(source)))) as archive:
+            self.assertEqual(archive.getnames(), ['a.txt', 'nested/b.txt'])
+
+        server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        client = BlobService(f'http://127.0.0.1:{server.server_port}', authToken=USER1, cacheFile=None)
+        result = client.importBlobs(source)
+        self.assertEqual([entry['name'] for entry in result['blobs']], ['a.txt', 'nested/b.txt'])
+        self.assertEqual(len(self.blob_service.getBlobs(USER1)['blobs']), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
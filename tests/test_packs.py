@@ -0,0 +1,95 @@
+import hashlib
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB, PACKS_DIRECTORY
+from blobapi.packs import PackStore
+from tests.helpers import upload
+
+USER1 = 'test_user1'
+
+
+class TestPackStore(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def test_append_and_read(self):
+        packs = PackStore(self.workspace.name, max_pack_size=10)
+        first = packs.append(b'aaaa')
+        second = packs.append(b'bbbbbb')
+        third = packs.append(b'cc')
+        self.assertEqual(first, (1, 0, 4))
+        self.assertEqual(second, (1, 4, 6))
+        # The first pack is full
+        self.assertEqual(third, (2, 0, 2))
+        self.assertEqual(packs.read(second), b'bbbbbb')
+        packs.close()
+
+    def test_garbage_and_retire(self):
+        packs = PackStore(self.workspace.name, max_pack_size=4, garbage_ratio=0.5)
+        first = packs.append(b'aaaa')
+        packs.append(b'bbbb')
+        self.assertEqual(packs.garbage(), [])
+        packs.delete(first)
+        self.assertEqual(packs.garbage(), [1])
+        packs.retire(1)
+        self.assertFalse(os.path.exists(os.path.join(self.workspace.name, 'pack-000001.pack')))
+        self.assertEqual(packs.stats['packs'], 1)
+        packs.close()
+
+
+class TestBlobDBPacks(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.db_file = Path(self.workspace.name).joinpath('dbfile.json')
+        self.blob_service = self.new_service()
+
+    def new_service(self):
+        return BlobDB(db_file=self.db_file, packs=True, pack_threshold=16, compact_interval=0, cache_size=0,
+                      versions=0)
+
+    def tearDown(self):
+        self.blob_service.close()
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def test_small_blobs_in_packs(self):
+        small_id, small_url = self.blob_service.newBlob(upload(b'small', 'small.txt'), USER1)
+        big_id, big_url = self.blob_service.newBlob(upload(b'x' * 100, 'big.txt'), USER1)
+        self.assertFalse(os.path.exists(small_url))
+        self.assertTrue(os.path.exists(big_url))
+        self.assertEqual(self.blob_service.openBlob(small_id)['data'], b'small')
+        self.assertIsNone(self.blob_service.openBlob(big_id)['data'])
+        self.assertEqual(self.blob_service.getBlobHash(small_id, USER1)['hexdigest'], hashlib.md5(b'small').hexdigest())
+
+    def test_locations_survive_restart(self):
+        blob_id, _ = self.blob_service.newBlob(upload(b'small', 'small.txt'), USER1)
+        self.blob_service.close()
+        self.blob_service = self.new_service()
+        self.assertEqual(self.blob_service.openBlob(blob_id)['data'], b'small')
+        self.assertEqual(self.blob_service.metrics()['packs']['live_bytes'], 5)
+
+    def test_update_remove_and_compaction(self):
+        kept_id, _ = self.blob_service.newBlob(upload(b'kept', 'kept.txt'), USER1)
+        removed_id, _ = self.blob_service.newBlob(upload(b'removed', 'removed.txt'), USER1)
+        self.blob_service.updateBlob(kept_id, upload(b'updated', 'kept.txt'), USER1)
+        self.blob_service.removeBlob(removed_id, USER1)
+        # Start a new pack, so the first one can be compacted
+        self.blob_service._packs_._open_active_(2)
+        self.assertEqual(self.blob_service.compactPacks(), 1)
+        self.assertEqual(self.blob_service.openBlob(kept_id)['data'], b'updated')
+        self.assertEqual(os.listdir(os.path.join(FILE_STORAGE, PACKS_DIRECTORY)), ['pack-000002.pack'])
+        self.assertEqual(self.blob_service.metrics()['packs']['bytes'], len(b'updated'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,117 @@
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+from flask import Flask
+
+from blobapi.blob_service import BlobDB
+from blobapi.errors import InvalidSignature
+from blobapi.presigned import URLSigner
+from blobapi.server import routeApp
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+CONTENTS = bytes(range(256)) * 100
+
+
+class TestURLSigner(unittest.TestCase):
+
+    def test_sign_and_verify(self):
+        signer = URLSigner({'new': b'secret', 'old': b'previous'}, max_ttl=600)
+        query, expires = signer.sign('blob', ttl=60, byte_range=(10, 19), now=1000)
+        args = dict(parse_qsl(query))
+        self.assertEqual(expires, 1060)
+        self.assertEqual(signer.verify('blob', 'GET', args, now=1000), (1060, (10, 19)))
+        for blob_id, method, changes, now in (('other', 'GET', {}, 1000), ('blob', 'HEAD', {}, 1000),
+                                              ('blob', 'GET', {'range': '0-19'}, 1000),
+                                              ('blob', 'GET', {'expires': '9999'}, 1000),
+                                              ('blob', 'GET', {}, 1061), ('blob', 'GET', {'kid': 'old'}, 1000),
+                                              ('blob', 'GET', {'signature': '!!'}, 1000)):
+            with self.assertRaises(InvalidSignature):
+                signer.verify(blob_id, method, dict(args, **changes), now=now)
+        # Any key verifies, so keys can be rotated
+        rotated = URLSigner({'newer': b'other', 'new': b'secret'})
+        self.assertEqual(rotated.verify('blob', 'GET', args, now=1000), (1060, (10, 19)))
+        with self.assertRaises(ValueError):
+            signer.sign('blob', ttl=601)
+        with self.assertRaises(ValueError):
+            signer.sign('blob', method='DELETE')
+
+
+class TestPresignedDownloads(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(Path(self.workspace.name).joinpath('dbfile.json'),
+                                   storage=os.path.join(self.workspace.name, 'storage'), cache_size=0)
+        self.blob_id, _ = self.blob_service.newBlob(upload(CONTENTS, 'blob.bin'), USER1)
+        self.blob_service.setVisibility(self.blob_id, False, USER1)
+        self.auth = MockClient(users=(USER1, USER2))
+        app = Flask(__name__)
+        routeApp(app, self.auth, self.blob_service, signer=URLSigner({'key': b'secret'}))
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def presign(self, user=USER1, **body):
+        return self.client.post(f'/api/v1/blob/{self.blob_id}/presign', headers={'AuthToken': user}, json=body)
+
+    def download(self, url, method='GET'):
+        url = urlsplit(url)
+        self.auth.lookups = 0
+        return self.client.open(f'{url.path}?{url.query}', method=method)
+
+    def test_presigned_download(self):
+        response = self.presign()
+        self.assertEqual(response.status_code, 200)
+        with self.download(response.json['URL']) as download:
+            self.assertEqual(download.status_code, 200)
+            self.assertEqual(download.data, CONTENTS)
+            # No auth lookup, and cacheable by shared caches until it expires
+            self.assertEqual(self.auth.lookups, 0)
+            self.assertTrue(download.cache_control.public)
+            self.assertGreater(download.cache_control.max_age, 3500)
+            self.assertIsNone(download.cache_control.no_cache)
+        self.assertEqual(self.download(response.json['URL'].replace(self.blob_id, 'other')).status_code, 403)
+
+    def test_head_with_get_url(self):
+        response = self.presign()
+        head = self.download(response.json['URL'], 'HEAD')
+        self.assertEqual(head.status_code, 200)
+        self.assertEqual(head.content_length, len(CONTENTS))
+        # A HEAD URL does not allow GET
+        response = self.presign(method='head')
+        self.assertEqual(self.download(response.json['URL']).status_code, 403)
+
+    def test_byte_range(self):
+        response = self.presign(range='300-309', expires_in=60, method='head')
+        self.assertEqual(self.download(response.json['URL'], 'HEAD').status_code, 206)
+        response = self.presign(range='300-309', expires_in=60)
+        with self.download(response.json['URL']) as download:
+            self.assertEqual(download.status_code, 206)
+            self.assertEqual(download.headers['Content-Range'], f'bytes 300-309/{len(CONTENTS)}')
+            self.assertEqual(download.data, CONTENTS[300:310])
+            self.assertLessEqual(download.cache_control.max_age, 60)
+        response = self.presign(range=f'{len(CONTENTS) - 5}-{len(CONTENTS) + 100}')
+        with self.download(response.json['URL']) as download:
+            self.assertEqual(download.status_code, 206)
+            self.assertEqual(download.headers['Content-Range'],
+                             f'bytes {len(CONTENTS) - 5}-{len(CONTENTS) - 1}/{len(CONTENTS)}')
+            self.assertEqual(download.data, CONTENTS[-5:])
+        self.assertEqual(self.download(self.presign(range=f'{len(CONTENTS)}-{len(CONTENTS)}').json['URL']).status_code,
+                         416)
+
+    def test_only_owner(self):
+        self.assertEqual(self.presign(USER2).status_code, 401)
+        self.assertEqual(self.presign(range='9-1').status_code, 400)
+        self.assertEqual(self.presign(expires_in=10 ** 9).status_code, 400)
+        self.assertEqual(self.client.post('/api/v1/blob/missing/presign', headers={'AuthToken': USER1}).status_code,
+                         404)
+
+
+if __name__ == '__main__':
+    unittest.main()
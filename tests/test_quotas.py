@@ -0,0 +1,121 @@
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from flask import Flask
+
+from blobapi.blob_service import BlobDB
+from blobapi.errors import QuotaExceeded
+from blobapi.quotas import parse_quotas
+from blobapi.server import routeApp
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+
+
+class TestQuotas(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.db_file = Path(self.workspace.name).joinpath('dbfile.json')
+        self.storage = os.path.join(self.workspace.name, 'storage')
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def service(self, **options):
+        return BlobDB(self.db_file, storage=self.storage, cache_size=0, **options)
+
+    def test_parse_quotas(self):
+        self.assertEqual(parse_quotas('alice:1000:10, bob:2000,carol::5'),
+                         {'alice': (1000, 10), 'bob': (2000, 0), 'carol': (0, 5)})
+        with self.assertRaises(ValueError):
+            parse_quotas('alice:many')
+
+    def test_usage_accounting(self):
+        blob_service = self.service(quotas={})
+        first, _ = blob_service.newBlob(upload(b'x' * 100, 'first.txt'), USER1)
+        blob_service.newBlob(upload(b'x' * 50, 'second.txt'), USER1)
+        blob_service.updateBlob(first, upload(b'x' * 10, 'first.txt'), USER1)
+        copy, _ = blob_service.copyBlob(first, USER2, name='copy.txt')
+        self.assertEqual(blob_service.usage(USER1)['bytes'], 60)
+        self.assertEqual(blob_service.usage(USER1)['blobs'], 2)
+        self.assertEqual(blob_service.usage(USER2)['bytes'], 10)
+        blob_service.restoreVersion(first, 1, USER1)
+        blob_service.removeBlob(copy, USER2)
+        self.assertEqual(blob_service.usage(USER1), {'user': USER1, 'bytes': 150, 'blobs': 2,
+                                                     'quota': {'bytes': None, 'blobs': None}})
+        self.assertEqual(blob_service.usage(USER2)['blobs'], 0)
+
+        # The totals are stored with the catalog, and used as they are when it is loaded
+        with open(self.db_file, encoding='utf-8') as contents:
+            self.assertIn('"usage"', contents.readline())
+        self.assertEqual(self.service(quotas={}).usage(USER1)['bytes'], 150)
+
+    def test_usage_of_old_databases(self):
+        blob_service = self.service(quotas={})
+        blob_service.newBlob(upload(b'x' * 100, 'blob.txt'), USER1)
+        with open(self.db_file, encoding='utf-8') as contents:
+            lines = contents.readlines()
+        # Without totals in the header, they are added up while loading
+        lines[0] = lines[0].replace(',"usage":{"test_user1":{"bytes":100,"blobs":1}}', '')
+        self.assertNotIn('usage', lines[0])
+        with open(self.db_file, 'w', encoding='utf-8') as contents:
+            contents.writelines(lines)
+        self.assertEqual(self.service(quotas={}).usage(USER1)['bytes'], 100)
+
+    def test_quotas(self):
+        blob_service = self.service(quota=(100, 2), quotas={USER2: (0, 1)})
+        blob_id, _ = blob_service.newBlob(upload(b'x' * 60, 'first.txt'), USER1)
+        # The upload is stopped as soon as it does not fit, and nothing is stored
+        with self.assertRaises(QuotaExceeded):
+            blob_service.newBlob(upload(b'x' * 50, 'second.txt'), USER1)
+        self.assertFalse(os.path.exists(os.path.join(self.storage, 'second.txt')))
+        with self.assertRaises(QuotaExceeded):
+            blob_service.updateBlob(blob_id, upload(b'x' * 101, 'first.txt'), USER1)
+        # Updates only take the difference
+        blob_service.updateBlob(blob_id, upload(b'x' * 100, 'first.txt'), USER1)
+        self.assertEqual(blob_service.usage(USER1)['bytes'], 100)
+
+        blob_service.copyBlob(blob_id, USER2, name='copy.txt')
+        with self.assertRaises(QuotaExceeded):
+            blob_service.copyBlob(blob_id, USER2, name='another.txt')
+        self.assertEqual(blob_service.usage(USER2)['quota'], {'bytes': None, 'blobs': 1})
+
+
+class TestUsageEndpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(Path(self.workspace.name).joinpath('dbfile.json'),
+                                   storage=os.path.join(self.workspace.name, 'storage'), cache_size=0,
+                                   quota=(20000, 0), quotas={})
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service)
+        self.client = app.test_client()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def test_usage_and_early_rejection(self):
+        headers = {'AuthToken': USER1}
+        response = self.client.post('/api/v1/blob', headers=headers,
+                                    data={'file': (io.BytesIO(b'x' * 100), 'blob.txt')})
+        self.assertEqual(response.status_code, 201)
+        response = self.client.get('/api/v1/usage', headers=headers)
+        self.assertEqual(response.json, {'user': USER1, 'bytes': 100, 'blobs': 1,
+                                         'quota': {'bytes': 20000, 'blobs': None}})
+        self.assertEqual(self.client.get('/api/v1/usage').status_code, 401)
+
+        # Rejected from its Content-Length, before reading the upload
+        response = self.client.post('/api/v1/blob', headers=headers,
+                                    data={'file': (io.BytesIO(b'x' * 40000), 'big.txt')})
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(self.blob_service.usage(USER1)['blobs'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
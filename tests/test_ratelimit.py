@@ -0,0 +1,110 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from flask import Flask
+
+from blobapi.blob_service import BlobDB
+from blobapi.ratelimit import RateLimiter, TransferSlots
+from blobapi.server import routeApp
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestRateLimiter(unittest.TestCase):
+
+    def test_request_bucket(self):
+        clock = FakeClock()
+        limiter = RateLimiter(2, 3, 0, 0, clock=clock)
+        self.assertEqual([limiter.admit('a') for _ in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(limiter.admit('a'), 0.5)
+        # Every client has its own bucket
+        self.assertEqual(limiter.admit('b'), 0)
+        clock.now += 0.5
+        self.assertEqual(limiter.admit('a'), 0)
+        self.assertEqual(limiter.stats, {'clients': 2, 'rejected': 1})
+
+    def test_byte_bucket_debt(self):
+        clock = FakeClock()
+        limiter = RateLimiter(0, 1, 100, 200, clock=clock)
+        # Transfers bigger than the burst are admitted with a full bucket and leave it in debt
+        self.assertEqual(limiter.admit('a', 500), 0)
+        self.assertAlmostEqual(limiter.admit('a'), 3.0)
+        clock.now += 3
+        self.assertEqual(limiter.admit('a'), 0)
+        limiter.charge('a', 100)
+        self.assertAlmostEqual(limiter.admit('a', 50), 1.5)
+
+    def test_forget_old_clients(self):
+        limiter = RateLimiter(1, 1, 0, 0, clients=2, clock=FakeClock())
+        for client in ('a', 'b', 'c'):
+            limiter.admit(client)
+        self.assertEqual(limiter.stats['clients'], 2)
+        # "a" was forgotten, so it has a full bucket again
+        self.assertEqual(limiter.admit('a'), 0)
+        self.assertGreater(limiter.admit('c'), 0)
+
+
+class TestAdmission(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(Path(self.workspace.name).joinpath('dbfile.json'),
+                                   storage=str(Path(self.workspace.name).joinpath('storage')), cache_size=0)
+        self.blob_id, _ = self.blob_service.newBlob(upload(b'data' * 1000, 'blob.txt'), USER1)
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def client(self, limiter=None, slots=None):
+        app = Flask(__name__)
+        routeApp(app, MockClient(), self.blob_service, limiter=limiter, slots=slots)
+        return app.test_client()
+
+    def test_too_many_requests(self):
+        client = self.client(limiter=RateLimiter(1, 2, 0, 0))
+        for _ in range(2):
+            self.assertEqual(client.get('/api/v1/blobs', headers={'AuthToken': USER1}).status_code, 200)
+        response = client.get('/api/v1/blobs', headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        # Other users and anonymous requests have their own limits
+        self.assertEqual(client.get('/api/v1/blobs', headers={'AuthToken': USER2}).status_code, 200)
+        self.assertEqual(client.get('/api/v1/blobs').status_code, 200)
+
+    def test_downloads_take_bytes(self):
+        client = self.client(limiter=RateLimiter(0, 1, 1000, 1000))
+        self.assertEqual(client.get(f'/api/v1/blob/{self.blob_id}').status_code, 200)
+        response = client.get(f'/api/v1/blob/{self.blob_id}')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '3')
+
+    def test_transfers_running_at_once(self):
+        slots = TransferSlots(1)
+        client = self.client(slots=slots)
+        download = client.get(f'/api/v1/blob/{self.blob_id}', buffered=False)
+        self.assertEqual(download.status_code, 200)
+        response = client.get(f'/api/v1/blob/{self.blob_id}')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        # Other requests are not transfers
+        self.assertEqual(client.get('/api/v1/blobs').status_code, 200)
+        download.close()
+        # The slot is returned when the server closes the response
+        with client.get(f'/api/v1/blob/{self.blob_id}') as response:
+            self.assertEqual(response.status_code, 200)
+        self.assertEqual(slots.stats, {'running': 0, 'limit': 1, 'rejected': 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
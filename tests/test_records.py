@@ -0,0 +1,74 @@
+import unittest
+
+from blobapi.records import BlobRecord, AclPool, SMALL_ACL, intern_users
+
+STORED = {'URL': 'storage/blob1', 'public': False, 'users': ['user2', 'user1'], 'owner': 'user0'}
+
+
+class TestBlobRecord(unittest.TestCase):
+
+    def test_roundtrip(self):
+        record = BlobRecord.from_dict(STORED)
+        self.assertEqual(record.to_dict(), dict(STORED, users=['user1', 'user2']))
+        record.version = 3
+        record.encoding = 'gzip'
+        self.assertEqual(BlobRecord.from_dict(record.to_dict()), record)
+
+    def test_item_access(self):
+        record = BlobRecord.from_dict(STORED)
+        self.assertEqual(record['URL'], 'storage/blob1')
+        self.assertIn('user1', record['users'])
+        self.assertNotIn('encoding', record)
+        self.assertEqual(record.get('version'), 1)
+        record['users'] = ['user3']
+        self.assertEqual(record.users, frozenset(['user3']))
+        with self.assertRaises(KeyError):
+            record['unknown']
+
+    def test_names_are_shared(self):
+        first = BlobRecord.from_dict(dict(STORED, owner=''.join(['us', 'er9'])))
+        second = BlobRecord.from_dict(dict(STORED, owner=''.join(['use', 'r9'])))
+        self.assertIs(first.owner, second.owner)
+        self.assertIs(BlobRecord('a', True, [], 'x').users, BlobRecord('b', True, (), 'y').users)
+
+    def test_rare_fields_are_not_stored_by_default(self):
+        record = BlobRecord.from_dict(STORED)
+        self.assertIsNone(record._extra_)
+        record.encoding = 'gzip'
+        record.version = 2
+        self.assertEqual(record.pop('encoding'), 'gzip')
+        record['version'] = 1
+        self.assertIsNone(record._extra_)
+        self.assertEqual(record, BlobRecord.from_dict(STORED))
+
+    def test_small_acl_behaves_like_a_frozenset(self):
+        small = intern_users(['user2', 'user1', 'user2'])
+        self.assertEqual(len(small), 2)
+        self.assertEqual(small, frozenset(['user1', 'user2']))
+        self.assertEqual(hash(small), hash(frozenset(['user1', 'user2'])))
+        self.assertEqual(small | frozenset(['user3']), {'user1', 'user2', 'user3'})
+        self.assertEqual(frozenset(['user1', 'user3']) - small, {'user3'})
+        self.assertEqual({'user1'} - small, frozenset())
+        self.assertTrue(frozenset(['user1']) <= small)
+        self.assertTrue(small.isdisjoint(['user3']))
+        large = intern_users(f'user{index}' for index in range(SMALL_ACL + 1))
+        self.assertIsInstance(large, frozenset)
+
+
+class TestAclPool(unittest.TestCase):
+
+    def test_sets_are_shared_and_released(self):
+        pool = AclPool()
+        first = pool.acquire(['user1', 'user2'])
+        second = pool.acquire(['user2', 'user1'])
+        self.assertIs(first, second)
+        self.assertIs(pool.acquire([]), intern_users(()))
+        self.assertEqual(len(pool), 1)
+        pool.release(first)
+        self.assertEqual(len(pool), 1)
+        pool.release(second)
+        self.assertEqual(len(pool), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from flask import Flask
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.replication import DirectoryReplica, Replicator
+from blobapi.server import routeApp
+from tests.helpers import upload
+
+OWNER = 'owner'
+
+
+class FlakyReplica:
+    def __init__(self, replica, failures):
+        self.replica = replica
+        self.failures = failures
+
+    def apply(self, operations):
+        if self.failures:
+            self.failures -= 1
+            raise IOError('replica is down')
+        self.replica.apply(operations)
+
+    def inventory(self):
+        return self.replica.inventory()
+
+
+class TestReplication(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.replica_dir = Path(self.workspace.name).joinpath('replica')
+        self.blob_service = BlobDB(db_file=Path(self.workspace.name).joinpath('dbfile.json'))
+
+    def tearDown(self):
+        self.blob_service.close()
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def replica_db(self):
+        return BlobDB(self.replica_dir.joinpath('blobs.json'), storage=self.replica_dir.joinpath('storage'))
+
+    def test_changes_are_replicated(self):
+        replicator = Replicator(self.blob_service, DirectoryReplica(self.replica_dir), retry_delay=0.01)
+        kept_id, _ = self.blob_service.newBlob(upload(b'v1', 'kept.txt'), OWNER)
+        removed_id, _ = self.blob_service.newBlob(upload(b'removed', 'removed.txt'), OWNER)
+        self.blob_service.updateBlob(kept_id, upload(b'v2', 'kept.txt'), OWNER)
+        self.blob_service.setVisibility(kept_id, False, OWNER)
+        self.blob_service.addPermission(kept_id, ['reader'], OWNER)
+        self.blob_service.removeBlob(removed_id, OWNER)
+        self.blob_service.setGroup('team', ['reader'], OWNER)
+        self.assertTrue(replicator.flush(5))
+        replicator.close()
+
+        replica = self.replica_db()
+        self.assertEqual(replica.blobIds(), [kept_id])
+        self.assertEqual(replica.openBlob(kept_id, 'reader')['version'], 2)
+        self.assertEqual(b''.join(replica.readBlob(replica.storedBlob(kept_id))), b'v2')
+        self.assertEqual(replica.getGroup('team', OWNER)['members'], ['reader'])
+        self.assertEqual(replicator.stats['lag_seconds'], 0.0)
+
+    def test_failed_batches_are_retried(self):
+        replica = FlakyReplica(DirectoryReplica(self.replica_dir), failures=2)
+        replicator = Replicator(self.blob_service, replica, retry_delay=0.01)
+        blob_id, _ = self.blob_service.newBlob(upload(b'data', 'blob.txt'), OWNER)
+        self.assertTrue(replicator.flush(5))
+        replicator.close()
+        self.assertEqual(replicator.stats['failures'], 2)
+        self.assertEqual(self.replica_db().blobIds(), [blob_id])
+
+    def test_resync(self):
+        missed_id, _ = self.blob_service.newBlob(upload(b'missed', 'missed.txt'), OWNER)
+        stale = DirectoryReplica(self.replica_dir)
+        stale.apply([{'op': 'put', 'id': 'extra', 'blob': {'URL': 'storage/extra.txt', 'public': True,
+                                                           'users': [], 'owner': OWNER}, 'data': BytesIO(b'x')}])
+        replicator = Replicator(self.blob_service, stale)
+        self.assertEqual(replicator.resync(), 2)
+        self.assertTrue(replicator.flush(5))
+        replicator.close()
+        self.assertEqual(self.replica_db().blobIds(), [missed_id])
+
+    def test_replica_is_written_without_the_lock(self):
+        blob_service = self.blob_service
+        blocked = []
+
+        class SlowStream(BytesIO):
+            def read(self, size=-1):
+                # The catalog can be used while the contents are transferred
+                reader = threading.Thread(target=blob_service.blobIds, daemon=True)
+                reader.start()
+                reader.join(2)
+                blocked.append(reader.is_alive())
+                return super().read(size)
+        blob_service.applyReplica('blob', {'URL': 'storage/blob.txt', 'public': True, 'users': [], 'owner': OWNER},
+                                  SlowStream(b'data'))
+        self.assertEqual(set(blocked), {False})
+        self.assertEqual(b''.join(blob_service.readBlob(blob_service.storedBlob('blob'))), b'data')
+
+
+class TestReplicaApi(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(db_file=Path(self.workspace.name).joinpath('dbfile.json'))
+        app = Flask(__name__)
+        routeApp(app, None, self.blob_service)
+        self.client = app.test_client()
+        patcher = mock.patch('blobapi.server.REPLICATION_KEY', 'secret')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def post_batch(self, key):
+        manifest = [{'op': 'put', 'id': 'blob1', 'part': 'blob0',
+                     'blob': {'URL': 'storage/one.txt', 'public': True, 'users': [], 'owner': OWNER, 'version': 3}}]
+        return self.client.post('/api/v1/replica', headers={'ReplicationKey': key},
+                                data={'manifest': json.dumps(manifest), 'blob0': (BytesIO(b'data'), 'one.txt')})
+
+    def test_apply_batch(self):
+        self.assertEqual(self.post_batch('secret').status_code, 204)
+        self.assertEqual(self.blob_service.openBlob('blob1')['version'], 3)
+        response = self.client.get('/api/v1/replica', headers={'ReplicationKey': 'secret'})
+        self.assertEqual(response.json['blob1']['version'], 3)
+
+    def test_invalid_key(self):
+        self.assertEqual(self.post_batch('wrong').status_code, 401)
+        self.assertEqual(self.blob_service.blobIds(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import os
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.scrubber import QUARANTINE_DIRECTORY, Scrubber
+from tests.helpers import upload
+
+USER1 = 'test_user1'
+
+
+class TestScrubber(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.blob_service = BlobDB(db_file=Path(self.workspace.name).joinpath('dbfile.json'), cache_size=0)
+
+    def tearDown(self):
+        self.blob_service.close()
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def scrubber(self, **kwargs):
+        options = dict(files_per_second=0, bytes_per_second=0, verify=True, grace=0)
+        options.update(kwargs)
+        return Scrubber(self.blob_service, **options)
+
+    def test_consistent_storage(self):
+        self.blob_service.newBlob(upload(b'data', 'blob.txt'), USER1)
+        scrubber = self.scrubber()
+        scrubber.scrub()
+        stats = scrubber.stats
+        self.assertEqual((stats['checked'], stats['orphans'], stats['missing'], stats['corrupt']), (1, 0, [], []))
+        self.assertEqual(stats['bytes_verified'], 4)
+
+    def test_missing_and_corrupt_blobs(self):
+        missing_id, missing_url = self.blob_service.newBlob(upload(b'data', 'missing.txt'), USER1)
+        corrupt_id, corrupt_url = self.blob_service.newBlob(upload(b'data', 'corrupt.txt'), USER1)
+        os.remove(missing_url)
+        with open(corrupt_url, 'wb') as contents:
+            contents.write(b'changed')
+        scrubber = self.scrubber()
+        scrubber.scrub()
+        self.assertEqual(scrubber.stats['missing'], [missing_id])
+        self.assertEqual(scrubber.stats['corrupt'], [corrupt_id])
+
+    def test_orphans_quarantined(self):
+        self.blob_service.newBlob(upload(b'data', 'blob.txt'), USER1)
+        orphan = os.path.join(FILE_STORAGE, 'orphan.txt')
+        with open(orphan, 'wb') as contents:
+            contents.write(b'orphan')
+        self.scrubber().scrub()
+        self.assertFalse(os.path.exists(orphan))
+        self.assertEqual(len(os.listdir(os.path.join(FILE_STORAGE, QUARANTINE_DIRECTORY))), 1)
+
+    def test_recent_orphans_kept(self):
+        os.makedirs(FILE_STORAGE, exist_ok=True)
+        orphan = os.path.join(FILE_STORAGE, 'orphan.txt')
+        with open(orphan, 'wb') as contents:
+            contents.write(b'orphan')
+        self.scrubber(grace=60, orphans='delete').scrub()
+        self.assertTrue(os.path.exists(orphan))
+
+    def test_budget(self):
+        for index in range(3):
+            self.blob_service.newBlob(upload(b'data', f'blob{index}.txt'), USER1)
+        start = time.monotonic()
+        self.scrubber(files_per_second=50, verify=False).scrub()
+        # 3 blobs and 3 files at 50 files/s
+        self.assertGreaterEqual(time.monotonic() - start, 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
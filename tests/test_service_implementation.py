@@ -193,12 +193,18 @@ class MockBlobDB:
     def getBlob(self, blob_id, token):
         return 'test_file'
 
+    def openBlob(self, blob_id, token):
+        return {'URL': 'test_file', 'encoding': None, 'size': None, 'version': 1, 'data': None}
+
     def removeBlob(self, blob_id, token):
         pass
 
     def updateBlob(self, blob_id, file, token):
         pass
 
+    def checkQuota(self, user, size, blob_id=None):
+        pass
+
     def getBlobHash(self, blob_id, type, token):
         return [{'hash_type': 'md5', 'hexdigest': 'hash_value'}]
 
@@ -0,0 +1,180 @@
+import os
+import tarfile
+import tempfile
+import threading
+import unittest
+import uuid
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+import requests
+from flask import Flask
+from werkzeug.serving import make_server
+
+from blobapi.blob_service import BlobDB, VERSIONS_DIRECTORY
+from blobapi.server import routeApp
+from blobapi.sharding import LOCAL_HEADER, HashRing, Shards, rebalance
+from tests.helpers import MockClient, upload
+
+USER1 = 'USER1'
+
+
+class TestHashRing(unittest.TestCase):
+
+    def test_balance(self):
+        ring = HashRing(['http://a', 'http://b', 'http://c', 'http://d'])
+        owners = [ring.node_for(str(uuid.uuid4())) for _ in range(4000)]
+        for node in ring.nodes:
+            self.assertGreater(owners.count(node), 600)
+
+    def test_adding_a_node_only_moves_keys_to_it(self):
+        keys = [str(uuid.uuid4()) for _ in range(2000)]
+        before = HashRing(['http://a', 'http://b', 'http://c'])
+        after = HashRing(['http://a', 'http://b', 'http://c', 'http://d'])
+        moved = [key for key in keys if before.node_for(key) != after.node_for(key)]
+        self.assertTrue(all(after.node_for(key) == 'http://d' for key in moved))
+        self.assertLess(len(moved), len(keys) / 2)
+
+
+class Node:
+    def __init__(self, workspace, name):
+        self.app = Flask(name)
+        self.server = make_server('127.0.0.1', 0, self.app, threaded=True)
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        self.directory = Path(workspace).joinpath(name)
+        os.makedirs(self.directory)
+        self.blobdb = None
+
+    def start(self, nodes, **options):
+        shards = Shards(HashRing(nodes), self.url)
+        self.blobdb = BlobDB(self.directory.joinpath('blobs.json'), storage=str(self.directory.joinpath('storage')),
+                             owns=shards.owns, **options)
+        routeApp(self.app, MockClient(), self.blobdb, shards=shards)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def upload(self, name):
+        return self.blobdb.newBlob(upload(name.encode(), name), USER1)[0]
+
+
+class TestShardedService(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        patcher = mock.patch('blobapi.server.REPLICATION_KEY', 'secret')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.nodes = [Node(self.workspace.name, 'a'), Node(self.workspace.name, 'b')]
+
+    def tearDown(self):
+        for node in self.nodes:
+            node.server.shutdown()
+        self.workspace.cleanup()
+
+    def start(self, nodes, **options):
+        urls = [node.url for node in nodes]
+        for node in nodes:
+            node.start(urls, **options)
+
+    def test_routing_and_listing(self):
+        self.start(self.nodes)
+        first, second = self.nodes
+        blob_ids = [first.upload(f'first{index}') for index in range(5)] + [second.upload('second')]
+        self.assertTrue(all(first.blobdb.storedBlob(blob_id) for blob_id in blob_ids[:5]))
+
+        # Any node redirects to the owner of the blob
+        response = requests.get(f'{second.url}/api/v1/blob/{blob_ids[0]}', headers={'AuthToken': USER1},
+                                allow_redirects=False)
+        self.assertEqual(response.status_code, 307)
+        self.assertTrue(response.headers['Location'].startswith(first.url))
+        response = requests.get(f'{second.url}/api/v1/blob/{blob_ids[0]}', headers={'AuthToken': USER1})
+        self.assertEqual(response.content, b'first0')
+
+        listing = requests.get(f'{second.url}/api/v1/blobs', headers={'AuthToken': USER1}).json()
+        self.assertEqual(sorted(listing['blobs']), sorted(blob_ids))
+        ring = requests.get(f'{first.url}/api/v1/status/ring').json()
+        self.assertEqual(ring['nodes'], sorted(node.url for node in self.nodes))
+
+    def test_groups_on_every_node(self):
+        self.start(self.nodes)
+        groups_node = [node for node in self.nodes if node.url == min(node.url for node in self.nodes)][0]
+        other = [node for node in self.nodes if node is not groups_node][0]
+        blob_id = other.upload('private')
+        other.blobdb.setVisibility(blob_id, False, USER1)
+
+        # Sent to any node, kept by the first node of the ring and shared with the others
+        response = requests.put(f'{other.url}/api/v1/group/team', json={'members': ['member']},
+                                headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 204)
+        response = requests.post(f'{other.url}/api/v1/blob/{blob_id}/acl', json={'allowed_users': ['group:team']},
+                                 headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 204)
+        response = requests.get(f'{other.url}/api/v1/blob/{blob_id}', headers={'AuthToken': 'member'})
+        self.assertEqual(response.content, b'private')
+
+        response = requests.delete(f'{other.url}/api/v1/group/team', headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(other.blobdb.groupsSnapshot(), {})
+        self.assertEqual(other.blobdb.getPermissions(blob_id, USER1), [USER1])
+        self.assertEqual(requests.get(f'{groups_node.url}/api/v1/group/team',
+                                      headers={'AuthToken': USER1}).status_code, 404)
+
+    def test_quota_of_every_node(self):
+        self.start(self.nodes, quota=(0, 3))
+        first, second = self.nodes
+        first.upload('first')
+        first.upload('second')
+        usage = requests.get(f'{second.url}/api/v1/usage', headers={'AuthToken': USER1}).json()
+        self.assertEqual((usage['bytes'], usage['blobs']), (len('firstsecond'), 2))
+        self.assertEqual(usage['quota']['blobs'], 3)
+
+        def upload(name):
+            return requests.post(f'{second.url}/api/v1/blob', files={'file': (name, name.encode())},
+                                 headers={'AuthToken': USER1})
+        self.assertEqual(upload('third').status_code, 201)
+        # The blobs of the user in the other node count too
+        self.assertEqual(upload('fourth').status_code, 413)
+        self.assertEqual(len(second.blobdb.getBlobs(owner=USER1)['blobs']), 1)
+        # Only other shards (with the replication key) ask for the usage of someone else
+        self.assertEqual(requests.get(f'{second.url}/api/v1/usage?owner={USER1}').status_code, 401)
+
+    def test_export_one_node_at_a_time(self):
+        self.start(self.nodes)
+        first, second = self.nodes
+        first_id, second_id = first.upload('first'), second.upload('second')
+        url = f'{second.url}/api/v1/blobs/export'
+        # Not every blob is in this node: no incomplete archive
+        self.assertEqual(requests.post(url, json={}, headers={'AuthToken': USER1}).status_code, 400)
+        self.assertEqual(requests.post(url, json={'blobs': [first_id, second_id]},
+                                       headers={'AuthToken': USER1}).status_code, 400)
+        for body, headers in (({'blobs': [second_id]}, {}), ({}, {LOCAL_HEADER: '1'})):
+            response = requests.post(url, json=body, headers=dict(headers, AuthToken=USER1))
+            self.assertEqual(response.status_code, 200)
+            with tarfile.open(fileobj=BytesIO(response.content)) as archive:
+                self.assertEqual(archive.extractfile('second').read(), b'second')
+                self.assertNotIn('first', archive.getnames())
+
+    def test_rebalance(self):
+        first, second = self.nodes
+        first.start([first.url])
+        blob_ids = [first.upload(f'blob{index}') for index in range(20)]
+        for index, blob_id in enumerate(blob_ids):
+            first.blobdb.updateBlob(blob_id, upload(f'blob{index}'.encode(), f'blob{index}'), USER1)
+        second.start([first.url, second.url])
+        moved = rebalance([first.url], [first.url, second.url], key='secret')
+        ring = HashRing([first.url, second.url])
+        expected = [blob_id for blob_id in blob_ids if ring.node_for(blob_id) == second.url]
+        self.assertEqual(moved, len(expected))
+        self.assertEqual(sorted(second.blobdb.blobIds()), sorted(expected))
+        self.assertEqual(len(first.blobdb.blobIds()), len(blob_ids) - len(expected))
+        # The versions of the blobs moved are removed too
+        versions = first.directory.joinpath('storage', VERSIONS_DIRECTORY)
+        self.assertEqual(sorted(blob_id for blob_id in os.listdir(versions) if os.listdir(versions.joinpath(blob_id))),
+                         sorted(set(blob_ids) - set(expected)))
+        for blob_id in expected:
+            contents = b''.join(second.blobdb.readBlob(second.blobdb.storedBlob(blob_id)))
+            self.assertEqual(contents, f'blob{blob_ids.index(blob_id)}'.encode())
+
+
+if __name__ == '__main__':
+    unittest.main()
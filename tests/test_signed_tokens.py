@@ -0,0 +1,74 @@
+import base64
+import json
+import time
+import unittest
+
+from blobapi.errors import UserNotExists
+from blobapi.signed_tokens import SignedTokenClient, TokenVerifier, parse_keys, sign_token
+
+KEYS = parse_keys('old:old-secret, new:new-secret')
+
+
+class RemoteClient:
+    def __init__(self):
+        self.lookups = 0
+
+    def token_owner(self, token):
+        self.lookups += 1
+        if token == 'USER_TOKEN':
+            return 'USER'
+        raise UserNotExists(token)
+
+
+class TestSignedTokens(unittest.TestCase):
+
+    def test_valid_tokens_of_every_key(self):
+        verifier = TokenVerifier(KEYS)
+        self.assertEqual(verifier.verify(sign_token('alice', 'old', 'old-secret')), 'alice')
+        self.assertEqual(verifier.verify(sign_token('bob', 'new', 'new-secret')), 'bob')
+
+    def test_invalid_tokens(self):
+        verifier = TokenVerifier(KEYS)
+        with self.assertRaises(UserNotExists):
+            verifier.verify(sign_token('alice', 'new', 'wrong-secret'))
+        with self.assertRaises(UserNotExists):
+            verifier.verify(sign_token('alice', 'new', 'new-secret', ttl=-60))
+        token = sign_token('alice', 'new', 'new-secret')
+        header, _, signature = token.split('.')
+        forged = sign_token('mallory', 'new', 'new-secret').split('.')[1]
+        with self.assertRaises(UserNotExists):
+            verifier.verify(f'{header}.{forged}.{signature}')
+
+    def test_crafted_tokens(self):
+        verifier = TokenVerifier(KEYS)
+        # A kid which is not a string, and a payload with non-ASCII characters
+        unhashable = base64.urlsafe_b64encode(json.dumps({'alg': 'HS256', 'kid': ['new']}).encode()).decode()
+        header, _, signature = sign_token('alice', 'new', 'new-secret').split('.')
+        for token in (f'{unhashable}.e30.{signature}', f'{header}.ñ.{signature}'):
+            with self.assertRaises(UserNotExists):
+                verifier.verify(token)
+
+    def test_leeway(self):
+        verifier = TokenVerifier(KEYS, leeway=30)
+        token = sign_token('alice', 'new', 'new-secret', ttl=0, now=time.time() - 10)
+        self.assertEqual(verifier.verify(token), 'alice')
+
+    def test_parse_keys(self):
+        self.assertEqual(KEYS, {'old': b'old-secret', 'new': b'new-secret'})
+        with self.assertRaises(ValueError):
+            parse_keys('no-secret')
+
+    def test_client_falls_back_to_remote_lookup(self):
+        remote = RemoteClient()
+        client = SignedTokenClient(remote, TokenVerifier(KEYS))
+        self.assertEqual(client.token_owner(sign_token('alice', 'new', 'new-secret')), 'alice')
+        self.assertEqual(remote.lookups, 0)
+        self.assertEqual(client.token_owner('USER_TOKEN'), 'USER')
+        # Tokens signed with a key that is no longer configured are checked remotely
+        with self.assertRaises(UserNotExists):
+            client.token_owner(sign_token('alice', 'retired', 'secret'))
+        self.assertEqual(remote.lookups, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
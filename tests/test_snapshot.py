@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from werkzeug.datastructures import FileStorage
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.snapshot import read_snapshot, write_snapshot
+
+USER1 = 'test_user1'
+BLOBS = {
+    'blob_id1': {'public': True, 'owner': 'user1', 'users': [], 'URL': 'blob1'},
+    'blob_id2': {'public': False, 'owner': 'user2', 'users': ['user1'], 'URL': 'blob2'},
+    'blob_id3': {'public': False, 'owner': 'user3', 'users': [], 'URL': 'blob3'},
+}
+
+
+def load(db_file, batch_size=10000):
+    snapshot = read_snapshot(db_file, batch_size)
+    header = next(snapshot)
+    blobs = {}
+    for batch, _ in snapshot:
+        blobs.update(batch)
+    return header, blobs
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.dbfile = Path(self.workspace.name).joinpath('dbfile.json')
+
+    def tearDown(self):
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def test_roundtrip_in_batches(self):
+        with open(self.dbfile, 'w', encoding='utf-8') as contents:
+            write_snapshot(contents, BLOBS, {'extra': 1})
+        header, blobs = load(self.dbfile, batch_size=2)
+        self.assertEqual(header['blobs'], 3)
+        self.assertEqual(header['extra'], 1)
+        self.assertEqual(blobs, BLOBS)
+
+    def test_snapshot_is_valid_json(self):
+        with open(self.dbfile, 'w', encoding='utf-8') as contents:
+            write_snapshot(contents, BLOBS)
+        with open(self.dbfile, encoding='utf-8') as contents:
+            self.assertEqual(len(json.load(contents)), 4)
+
+    def test_previous_format_is_migrated(self):
+        with open(self.dbfile, 'w', encoding='utf-8') as contents:
+            json.dump(BLOBS, contents, indent=2, sort_keys=True)
+        blob_service = BlobDB(db_file=self.dbfile)
+        self.assertEqual(blob_service._blobs_, BLOBS)
+        blob_service.newBlob(FileStorage(stream=BytesIO(b'data'), filename='new.txt'), USER1)
+        header, blobs = load(self.dbfile)
+        self.assertEqual(header['blobs'], 4)
+        self.assertEqual(len(blobs), 4)
+
+    def test_background_load(self):
+        with open(self.dbfile, 'w', encoding='utf-8') as contents:
+            write_snapshot(contents, BLOBS)
+        blob_service = BlobDB(db_file=self.dbfile, background_load=True)
+        # Requests wait for the blobs they need
+        self.assertEqual(blob_service.getBlob('blob_id2', 'user1'), 'blob2')
+        self.assertCountEqual(blob_service.getBlobs('user1')['blobs'], ['blob_id1', 'blob_id2'])
+        load_stats = blob_service.metrics()['load']
+        self.assertTrue(load_stats['loaded'])
+        self.assertEqual(load_stats['progress'], 1.0)
+
+    def test_change_while_loading(self):
+        with open(self.dbfile, 'w', encoding='utf-8') as contents:
+            write_snapshot(contents, BLOBS)
+        loading = threading.Event()
+
+        def slow_snapshot(db_file):
+            snapshot = read_snapshot(db_file, batch_size=1)
+            yield next(snapshot)
+            loading.wait()
+            yield from snapshot
+        with mock.patch('blobapi.blob_service.read_snapshot', slow_snapshot):
+            blob_service = BlobDB(db_file=self.dbfile, background_load=True)
+            # A change of a blob not loaded yet waits for the load without blocking it
+            change = threading.Thread(target=blob_service.setVisibility, args=('blob_id3', True, 'user3'),
+                                      daemon=True)
+            change.start()
+            change.join(0.2)
+            loading.set()
+            change.join(5)
+        self.assertFalse(change.is_alive())
+        self.assertTrue(blob_service.metrics()['load']['loaded'])
+        self.assertTrue(blob_service._blobs_['blob_id3'].public)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import hashlib
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from flask import Flask
+from werkzeug.serving import make_server
+
+from blobapi import FILE_STORAGE
+from blobapi.blob_service import BlobDB
+from blobapi.errors import ServiceError
+from blobapi.server import routeApp
+from blobapi.storage import LocalBackend, S3Backend
+from tests.helpers import MockClient, upload
+from tests.mock_s3 import mock_s3
+
+USER1 = 'USER1'
+
+
+class TestLocalBackend(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def test_atomic_writer(self):
+        backend = LocalBackend()
+        key = os.path.join(self.workspace.name, 'storage', 'blob.txt')
+        with backend.writer(key) as contents:
+            contents.write(b'data')
+        with self.assertRaises(RuntimeError):
+            with backend.writer(key) as contents:
+                contents.write(b'partial')
+                raise RuntimeError()
+        with backend.open(key) as contents:
+            self.assertEqual(contents.read(), b'data')
+        self.assertEqual([key for key, _ in backend.list(os.path.dirname(key))], [key])
+
+
+class TestS3Backend(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        mock_s3.ACCESS_KEY = 'access'
+        cls.server = make_server('127.0.0.1', 0, mock_s3.app, threaded=True)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.endpoint = f'http://127.0.0.1:{cls.server.server_port}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+
+    def setUp(self):
+        mock_s3.OBJECTS.clear()
+        self.workspace = tempfile.TemporaryDirectory()
+        self.backend = S3Backend(self.endpoint, 'blobs', 'access', 'secret', part_size=1024)
+
+    def tearDown(self):
+        os.system('rm -rf ' + FILE_STORAGE)
+        self.workspace.cleanup()
+
+    def test_small_and_multipart_uploads(self):
+        with self.backend.writer('storage/small.txt') as contents:
+            contents.write(b'small')
+        uploads = mock_s3.STATS['multipart_uploads']
+        data = os.urandom(3000)
+        with self.backend.writer('storage/big.bin') as contents:
+            contents.write(data[:1500])
+            contents.write(data[1500:])
+        self.assertEqual(mock_s3.STATS['multipart_uploads'], uploads + 1)
+        self.assertEqual(self.backend.size('storage/big.bin'), 3000)
+        with self.backend.open('storage/big.bin') as contents:
+            self.assertEqual(contents.read(), data)
+        self.assertEqual(sorted(key for key, _ in self.backend.list('storage')),
+                         ['storage/big.bin', 'storage/small.txt'])
+
+    def test_remove_and_rename(self):
+        with self.backend.writer('storage/blob.txt') as contents:
+            contents.write(b'data')
+        self.backend.rename('storage/blob.txt', 'storage/.quarantine/blob.txt')
+        self.assertFalse(self.backend.exists('storage/blob.txt'))
+        self.assertTrue(self.backend.exists('storage/.quarantine/blob.txt'))
+        self.backend.remove('storage/.quarantine/blob.txt')
+        with self.assertRaises(FileNotFoundError):
+            self.backend.open('storage/.quarantine/blob.txt')
+
+    def test_wrong_credentials(self):
+        backend = S3Backend(self.endpoint, 'blobs', 'other', 'secret')
+        with self.assertRaises(ServiceError):
+            backend.size('storage/blob.txt')
+
+    def test_blobdb_on_s3(self):
+        blob_service = BlobDB(Path(self.workspace.name).joinpath('dbfile.json'), backend=self.backend, cache_size=0)
+        data = b'x' * 5000
+        blob_id, url = blob_service.newBlob(upload(data, 'blob.bin'), USER1)
+        self.assertFalse(os.path.exists(url))
+        self.assertEqual(blob_service.getBlobHash(blob_id, USER1)['hexdigest'], hashlib.md5(data).hexdigest())
+
+        app = Flask(__name__)
+        routeApp(app, MockClient(), blob_service)
+        response = app.test_client().get(f'/api/v1/blob/{blob_id}', headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, data)
+
+        blob_service.removeBlob(blob_id, USER1)
+        self.assertFalse(self.backend.exists(url))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,145 @@
+import os
+import tempfile
+import threading
+import unittest
+from io import BytesIO
+from pathlib import Path
+from unittest import mock
+
+from flask import Flask
+from werkzeug.datastructures import FileStorage
+
+from blobapi.blob_service import BlobDB, VERSIONS_DIRECTORY
+from blobapi.errors import ObjectNotFound, UnauthorizedBlob
+from blobapi.server import routeApp
+from tests.helpers import MockClient, upload
+
+USER1 = 'test_user1'
+USER2 = 'test_user2'
+
+
+class FailingStream(BytesIO):
+    def read(self, size=-1):
+        if self.tell() > 0:
+            raise IOError('Connection lost')
+        return super().read(4)
+
+
+class TestBlobVersions(unittest.TestCase):
+
+    def setUp(self):
+        self.workspace = tempfile.TemporaryDirectory()
+        self.storage = os.path.join(self.workspace.name, 'storage')
+
+    def tearDown(self):
+        self.workspace.cleanup()
+
+    def new_service(self, **options):
+        return BlobDB(Path(self.workspace.name).joinpath('dbfile.json'), storage=self.storage, cache_size=0,
+                      **options)
+
+    def read(self, blob_service, blob_id):
+        return b''.join(blob_service.readBlob(blob_service.storedBlob(blob_id)))
+
+    def stored_versions(self, blob_id):
+        directory = os.path.join(self.storage, VERSIONS_DIRECTORY, blob_id)
+        return sorted(os.listdir(directory)) if os.path.isdir(directory) else []
+
+    def test_update_keeps_versions(self):
+        blob_service = self.new_service(versions=2)
+        blob_id, _ = blob_service.newBlob(upload(b'v1', 'blob.txt'), USER1)
+        for contents in (b'v2', b'v3', b'v4'):
+            blob_service.updateBlob(blob_id, upload(contents, 'blob.txt'), USER1)
+        listing = blob_service.listVersions(blob_id, USER1)
+        self.assertEqual(listing['version'], 4)
+        self.assertEqual([entry['version'] for entry in listing['versions']], [2, 3])
+        self.assertEqual(len(self.stored_versions(blob_id)), 2)
+
+        blob_service.restoreVersion(blob_id, 2, USER1)
+        self.assertEqual(self.read(blob_service, blob_id), b'v2')
+        self.assertEqual(blob_service.listVersions(blob_id, USER1)['version'], 5)
+        with self.assertRaises(ObjectNotFound):
+            blob_service.restoreVersion(blob_id, 1, USER1)
+        with self.assertRaises(UnauthorizedBlob):
+            blob_service.restoreVersion(blob_id, 3, USER2)
+
+        # The versions survive a restart and are removed with the blob
+        blob_service = self.new_service(versions=2)
+        self.assertEqual([entry['version'] for entry in blob_service.listVersions(blob_id, USER1)['versions']],
+                         [3, 4])
+        blob_service.removeBlob(blob_id, USER1)
+        self.assertEqual(self.stored_versions(blob_id), [])
+
+    def test_unchanged_versions_are_stored_once(self):
+        blob_service = self.new_service(versions=5)
+        blob_id, _ = blob_service.newBlob(upload(b'same', 'blob.txt'), USER1)
+        for _ in range(3):
+            blob_service.updateBlob(blob_id, upload(b'same', 'blob.txt'), USER1)
+        self.assertEqual(len(blob_service.listVersions(blob_id, USER1)['versions']), 3)
+        self.assertEqual(len(self.stored_versions(blob_id)), 1)
+
+    def test_failed_update_keeps_the_blob(self):
+        blob_service = self.new_service()
+        blob_id, url = blob_service.newBlob(upload(b'original', 'blob.txt'), USER1)
+        with self.assertRaises(IOError):
+            blob_service.updateBlob(blob_id, FileStorage(stream=FailingStream(b'new contents'), filename='blob.txt'),
+                                    USER1)
+        self.assertEqual(self.read(blob_service, blob_id), b'original')
+        self.assertEqual(blob_service.listVersions(blob_id, USER1)['version'], 1)
+        self.assertEqual(self.stored_versions(blob_id), [])
+        self.assertTrue(os.path.exists(url))
+
+    def test_versions_are_copied_without_the_lock(self):
+        blob_service = self.new_service(versions=2, compression='none')
+        blob_id, _ = blob_service.newBlob(upload(b'v1', 'blob.txt'), USER1)
+        backend_copy = blob_service.backend.copy
+        blocked = []
+
+        def copy(key, new_key):
+            # The catalog can be used while the contents are copied
+            reader = threading.Thread(target=blob_service.blobIds, daemon=True)
+            reader.start()
+            reader.join(2)
+            blocked.append(reader.is_alive())
+            return backend_copy(key, new_key)
+        with mock.patch.object(blob_service.backend, 'copy', copy):
+            blob_service.updateBlob(blob_id, upload(b'v2', 'blob.txt'), USER1)
+            blob_service.restoreVersion(blob_id, 1, USER1)
+        # The version kept by the update, and by the restore the version restored and the version kept
+        self.assertEqual(blocked, [False] * 3)
+        self.assertEqual(self.read(blob_service, blob_id), b'v1')
+        self.assertEqual([entry['version'] for entry in blob_service.listVersions(blob_id, USER1)['versions']], [1, 2])
+        self.assertEqual(len(self.stored_versions(blob_id)), 2)
+
+    def test_versions_in_packs(self):
+        blob_service = self.new_service(packs=True, pack_threshold=1024, compact_interval=0)
+        blob_id, _ = blob_service.newBlob(upload(b'v1', 'blob.txt'), USER1)
+        blob_service.updateBlob(blob_id, upload(b'v2', 'blob.txt'), USER1)
+        blob_service._packs_._open_active_(2)
+        blob_service.compactPacks()
+        blob_service.restoreVersion(blob_id, 1, USER1)
+        self.assertEqual(self.read(blob_service, blob_id), b'v1')
+        blob_service.close()
+
+    def test_versions_endpoints(self):
+        blob_service = self.new_service()
+        blob_id, _ = blob_service.newBlob(upload(b'v1', 'blob.txt'), USER1)
+        blob_service.updateBlob(blob_id, upload(b'v2', 'blob.txt'), USER1)
+        app = Flask(__name__)
+        routeApp(app, MockClient(), blob_service)
+        client = app.test_client()
+        response = client.get(f'/api/v1/blob/{blob_id}/versions')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json['version'], 2)
+        self.assertEqual([entry['version'] for entry in response.json['versions']], [1])
+        response = client.post(f'/api/v1/blob/{blob_id}/versions/1/restore', headers={'AuthToken': USER2})
+        self.assertEqual(response.status_code, 401)
+        response = client.post(f'/api/v1/blob/{blob_id}/versions/1/restore', headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(client.get(f'/api/v1/blob/{blob_id}').data, b'v1')
+        response = client.post(f'/api/v1/blob/{blob_id}/versions/7/restore', headers={'AuthToken': USER1})
+        self.assertEqual(response.status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()